@@ -0,0 +1,124 @@
+import argparse
+import glob
+import os
+
+import pandas as pd
+
+from corpus import is_data_file, open_text
+
+# Columns that identify a single reviewed annotation
+KEY_COLUMNS = ['file', 'region', 'chunk', 'text', 'label']
+
+# Columns we actually need from each annotation_choices.csv; older downloads have no session_id
+USECOLS = KEY_COLUMNS + ['choice', 'data_source', 'user_experience', 'user_translation', 'session_id']
+
+
+def iter_choice_files(paths):
+    """Yield every annotation_choices CSV found in the given files, directories or glob patterns.
+
+    Directories are searched for compressed CSVs (.csv.gz, .csv.xz, .csv.zst) as well.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(name for name in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                              if is_data_file(name, '.csv') and os.path.isfile(name))
+        elif any(char in path for char in '*?['):
+            yield from sorted(glob.glob(path, recursive=True))
+        else:
+            yield path
+
+
+def read_choice_file(path, chunksize=50000):
+    """Read one (possibly compressed) annotation_choices CSV in chunks, keeping only the columns we aggregate on."""
+    with open_text(path) as f:
+        for chunk in pd.read_csv(f, usecols=lambda c: c in USECOLS, dtype=str,
+                                 keep_default_na=False, chunksize=chunksize):
+            for column in USECOLS:
+                if column not in chunk.columns:
+                    chunk[column] = ''
+            yield chunk
+
+
+def collect_choices(paths, chunksize=50000):
+    """Stream all CSVs and keep the last choice per participant and (file, region, chunk, text, label).
+
+    Every download of the app contains all choices made so far, so the same
+    participant usually shows up in several files. Files are read oldest
+    first by modification time, so the latest download wins; names like
+    "annotation_choices (10).csv" do not sort in download order. Participants
+    are told apart by the session_id column, or for older downloads without
+    one by their translation, which is free text and practically unique.
+    Keys are hashed to 64-bit integers so memory grows with the number of
+    distinct reviewed annotations, not with the number of files read.
+    """
+    latest = {}
+    strings = {}
+    n_files = 0
+    n_rows = 0
+
+    for path in sorted(iter_choice_files(paths), key=os.path.getmtime):
+        n_files += 1
+        for chunk in read_choice_file(path, chunksize=chunksize):
+            n_rows += len(chunk)
+            participant = chunk['session_id'].where(chunk['session_id'] != '', chunk['user_translation'])
+            keys = pd.util.hash_pandas_object(chunk[KEY_COLUMNS].assign(participant=participant), index=False)
+            values = zip(chunk['label'], chunk['data_source'], chunk['user_experience'], chunk['choice'])
+            for key, (label, data_source, experience, choice) in zip(keys.tolist(), values):
+                # Intern the small set of repeated strings so the dict holds references only
+                latest[key] = (strings.setdefault(label, label),
+                               strings.setdefault(data_source, data_source),
+                               strings.setdefault(experience, experience),
+                               choice == 'useful')
+
+    return latest, n_files, n_rows
+
+
+def summarize_choices(latest):
+    """Compute useful/misleading rates per label and per data_source, broken down by user_experience."""
+    df = pd.DataFrame(list(latest.values()), columns=['label', 'data_source', 'user_experience', 'useful'])
+
+    frames = []
+    for group in ['label', 'data_source']:
+        counts = df.groupby([group, 'user_experience'])['useful'].agg(['sum', 'count']).reset_index()
+        counts = counts.rename(columns={group: 'value', 'sum': 'useful', 'count': 'total'})
+        counts.insert(0, 'group', group)
+        frames.append(counts)
+
+    summary = pd.concat(frames, ignore_index=True)
+    summary['useful'] = summary['useful'].astype(int)
+    summary['misleading'] = summary['total'] - summary['useful']
+    summary['useful_rate'] = summary['useful'] / summary['total']
+    summary['misleading_rate'] = summary['misleading'] / summary['total']
+    return summary[['group', 'value', 'user_experience', 'useful', 'misleading', 'total',
+                    'useful_rate', 'misleading_rate']]
+
+
+def write_summary(summary, outfile):
+    """Write the summary as Parquet or CSV, depending on the extension of outfile."""
+    if outfile.endswith('.parquet'):
+        summary.to_parquet(outfile, index=False)
+    else:
+        summary.to_csv(outfile, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate annotation_choices.csv downloads from workshop participants.")
+    parser.add_argument('inputs', nargs='+', help="CSV files, directories or glob patterns")
+    parser.add_argument('-o', '--output', default='choices_summary.csv', help="output file (.csv or .parquet)")
+    parser.add_argument('--chunksize', type=int, default=50000, help="rows read per CSV chunk")
+    args = parser.parse_args()
+
+    latest, n_files, n_rows = collect_choices(args.inputs, chunksize=args.chunksize)
+    print(f"Read {n_rows} rows from {n_files} files, {len(latest)} unique choices")
+
+    if not latest:
+        print("Nothing to summarize.")
+        return
+
+    summary = summarize_choices(latest)
+    write_summary(summary, args.output)
+    print(f"Wrote {len(summary)} summary rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
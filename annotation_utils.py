@@ -0,0 +1,275 @@
+from span_rules import apply_span_rules
+
+# Define color schemes with lighter blues
+ENTITY_COLORS = {
+    'LOC_NAME': '#4A90E2',  # Medium blue
+    'LOC_ADJ': '#7FB3D5',  # Light blue
+    'PER_NAME': '#9FCDFF',  # Powder blue
+    'PER_ATTR': '#5B9BD5',  # Sky blue
+    'PRF': '#89CFF0',  # Baby blue
+    'CMTY_QUANT': '#6BB6FF',  # Bright blue
+    'CMTY_NAME': '#A8D5FF',  # Soft blue
+    'DOC': '#1E90FF',  # Dodger blue
+    'DATE': '#87CEEB',  # Sky blue light
+    'SHIP_TYPE': '#C2DFFF',  # Alice blue
+    'ORG': '#B0D7FF',  # Baby blue
+    'STATUS': '#AFEEEE'  # Pale Turquoise
+}
+
+EVENT_COLORS = {
+    'event1': '#FF8C00',  # Dark orange
+    'event2': '#FFA500',  # Orange
+    'event3': '#FFB347',  # Light orange
+    'event4': '#FF7F50',  # Coral
+    'event5': '#FF6347',  # Tomato
+}
+
+
+def hex_to_rgba(hex_color, opacity=1.0):
+    """Convert hex color to rgba with specified opacity."""
+    hex_color = hex_color.lstrip('#')
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    return f'rgba({r}, {g}, {b}, {opacity})'
+
+
+def get_color_for_label(label):
+    """Get the appropriate color for a label."""
+    if label in ENTITY_COLORS:
+        color = ENTITY_COLORS[label]
+        return hex_to_rgba(color, 0.30)  # Entities always 70% transparent (25% opacity)
+    elif label in EVENT_COLORS:
+        return EVENT_COLORS[label]
+    else:
+        # Default colors if not found
+        if is_entity_label(label):
+            color = '#B3D9FF'  # Default light blue
+            return hex_to_rgba(color, 0.25)  # Entities always transparent
+        else:
+            return '#FFD699'  # Default light orange
+
+def is_entity_label(label):
+    """Check if a label is an entity type."""
+    entity_labels = ['LOC_NAME', 'PER_NAME', 'PER_ATTR', 'PRF', 'CMTY_QUANT',
+                     'CMTY_NAME', 'DOC', 'DATE', 'SHIP_TYPE', 'LOC_ADJ', 'ORG', 'STATUS', 'SHIP', 'ETH_REL']
+    return any(entity in label for entity in entity_labels)
+
+
+def count_event_annotations(data):
+    """Count the number of event annotations in a data structure."""
+    events = data['events']
+    count = 0
+    for event in events:
+        if event.startswith('B-') and not is_entity_label(event[2:]) and event!='B-None' and event!='I-None':
+            count += 1
+    return count
+
+def merge_annotations(event_data, entity_data):
+    """Merge event and entity annotations into a single data structure.
+
+    Curated entity files store their labels under 'entities'; prediction files
+    that double as entity files store them under 'events'.
+    """
+    words = event_data['words']
+    events = event_data['events']
+    entities = entity_data['entities'] if 'entities' in entity_data else entity_data['events']
+
+    combined = []
+    for event, entity in zip(events, entities):
+        if event != 'O':
+            combined.append(event)
+        else:
+            combined.append(entity)
+
+    merged_data = {
+        'words': words,
+        'events': combined
+    }
+    
+    # Apply the span rules from span_rules.txt (e.g. merging consecutive motion events)
+    merged_data = apply_span_rules(merged_data)
+    
+    return merged_data
+
+
+def convert_to_annotated_text(data):
+    """Convert data to annotated_text format with color coding."""
+    words = data['words']
+    events = data['events']
+
+    result = []
+    current_text = []
+    current_event = None
+    current_event_words = []
+
+    for word, event in zip(words, events):
+        if event.startswith('B-') and event!='B-None':
+            if current_text:
+                result.append(' '.join(current_text) + ' ')
+                current_text = []
+
+            if current_event_words and current_event:
+                label = current_event
+                color = get_color_for_label(label)
+                result.append((' '.join(current_event_words) + ' ', label, color))
+                current_event_words = []
+
+            current_event = event[2:]
+            current_event_words = [word]
+
+        elif event.startswith('I-') and event!='I-None':
+            current_event_words.append(word)
+
+        else:
+            if current_event_words and current_event:
+                label = current_event
+                color = get_color_for_label(label)
+                result.append((' '.join(current_event_words) + ' ', label, color))
+                current_event_words = []
+                current_event = None
+
+            current_text.append(word)
+
+    if current_text:
+        result.append(' '.join(current_text))
+    if current_event_words and current_event:
+        label = current_event
+        color = get_color_for_label(label)
+        result.append((' '.join(current_event_words) + ' ', label, color))
+
+    return result
+
+
+def extract_annotations(data, annotation_type='event'):
+    """Extract annotations. Can filter by type (event vs entity)."""
+    words = data['words']
+    events = data['events']
+
+    annotations = []
+    current_event = None
+    current_words = []
+
+    for word, event in zip(words, events):
+        if event.startswith('B-') and event != 'B-None':
+            if current_words and current_event:
+                label_type = current_event
+                is_entity = is_entity_label(label_type)
+                is_event = not is_entity
+
+                if (annotation_type == 'entity' and is_entity) or \
+                        (annotation_type == 'event' and is_event) or \
+                        (annotation_type == 'all'):
+                    annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
+
+            current_event = event[2:]
+            current_words = [word]
+
+        elif event.startswith('I-') and event !='I-None':
+            current_words.append(word)
+
+        else:
+            if current_words and current_event:
+                label_type = current_event
+                is_entity = is_entity_label(label_type)
+                is_event = not is_entity
+
+                if (annotation_type == 'entity' and is_entity) or \
+                        (annotation_type == 'event' and is_event) or \
+                        (annotation_type == 'all'):
+                    annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
+                current_words = []
+                current_event = None
+
+    if current_words and current_event:
+        label_type = current_event
+        is_entity = is_entity_label(label_type)
+        is_event = not is_entity
+
+        if (annotation_type == 'entity' and is_entity) or \
+                (annotation_type == 'event' and is_event) or \
+                (annotation_type == 'all'):
+            annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
+
+    return annotations
+
+
+def span_offsets(events):
+    """Return (start, end, label) for every span in a list of BIO tags.
+
+    Follows the same rules as extract_annotations: B- opens a span (except
+    B-None), I- extends an open span and anything else closes it, so the
+    event spans come out in the same order as the annotation buttons.
+    """
+    spans = []
+    start = None
+    label = None
+    for i, event in enumerate(events):
+        if event.startswith('B-') and event != 'B-None':
+            if start is not None:
+                spans.append((start, i, label))
+            start, label = i, event[2:]
+        elif event.startswith('I-') and event != 'I-None':
+            continue
+        elif start is not None:
+            spans.append((start, i, label))
+            start = label = None
+    if start is not None:
+        spans.append((start, len(events), label))
+    return spans
+
+
+def split_data_into_chunks(data, max_words=150):
+    """Split data into roughly equal chunks, each up to max_words."""
+    words = data['words']
+    events = data['events']
+
+    total_words = len(words)
+
+    if total_words <= max_words:
+        return [data]
+
+    num_chunks = (total_words + max_words - 1) // max_words
+    chunk_size = total_words // num_chunks
+    remainder = total_words % num_chunks
+
+    chunks = []
+    start_idx = 0
+
+    for i in range(num_chunks):
+        extra = 1 if i < remainder else 0
+        end_idx = start_idx + chunk_size + extra
+
+        chunk = {
+            'words': words[start_idx:end_idx],
+            'events': events[start_idx:end_idx]
+        }
+        chunks.append(chunk)
+        start_idx = end_idx
+
+    return chunks
+
+def merge_small_regions(regions, min_words=150):
+    """Merge consecutive regions with fewer than min_words tokens into one region."""
+    merged = []
+    buffer = None
+
+    for region in regions:
+        if buffer is None:
+            buffer = region
+        else:
+            combined_len = len(buffer['words']) + len(region['words'])
+            if len(buffer['words']) < min_words or combined_len <= min_words:
+                # Merge region into buffer
+                buffer = {
+                    'words': buffer['words'] + region['words'],
+                    'events': buffer['events'] + region['events']
+                }
+            else:
+                merged.append(buffer)
+                buffer = region
+
+    if buffer is not None:
+        merged.append(buffer)
+
+    return merged
@@ -0,0 +1,204 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from choice_store import ChoiceStore
+
+logger = logging.getLogger(__name__)
+
+AUTOSAVE_DIR = 'autosave'
+
+# Sessions are identified by a token in the URL, so keep it to something safe to use as a file name
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def get_session_id(query_params):
+    """Return the session token from the URL, creating (and storing) a new one if missing or malformed."""
+    session_id = query_params.get('session')
+    if not session_id or not SESSION_ID_PATTERN.match(session_id):
+        session_id = uuid.uuid4().hex
+        query_params['session'] = session_id
+    return session_id
+
+
+def log_path(session_id, directory=AUTOSAVE_DIR):
+    """Path of the JSONL log for a session."""
+    return os.path.join(directory, f'{session_id}.jsonl')
+
+
+class AutosaveError(RuntimeError):
+    """Raised by AutosaveWriter.append() once the writer thread has stopped on an error."""
+
+
+class AutosaveWriter:
+    """Append-only JSONL writer shared by all sessions of a process.
+
+    append() only puts the record on a queue, so nothing touches the disk on the
+    click path. A background thread writes queued records in batches every
+    flush_interval seconds and fsyncs the touched files every fsync_interval
+    seconds. At most max_open_files log files are kept open at once.
+
+    If writing fails (e.g. the disk is full), the thread stops and keeps the
+    exception in `error`; from then on append() raises AutosaveError rather
+    than queueing records that will never be written.
+    """
+
+    def __init__(self, directory=AUTOSAVE_DIR, flush_interval=0.5, fsync_interval=5.0, max_open_files=256):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_open_files = max_open_files
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.SimpleQueue()
+        self._files = OrderedDict()
+        self._unsynced = set()
+        self._stopped = False
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='autosave-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, session_id, record):
+        """Queue a record for the session's log."""
+        if self.error is not None:
+            raise AutosaveError(f"autosave stopped: {self.error!r}") from self.error
+        self._queue.put((session_id, json.dumps(record, ensure_ascii=False)))
+
+    def close(self):
+        """Write and fsync everything still queued, then stop the writer thread."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        last_fsync = time.monotonic()
+        running = True
+        try:
+            while running:
+                batch, running = self._next_batch()
+                if batch:
+                    self._write_batch(batch)
+                if not running or time.monotonic() - last_fsync >= self.fsync_interval:
+                    self._fsync()
+                    last_fsync = time.monotonic()
+        except Exception as e:
+            self.error = e
+            logger.exception("Autosave writer stopped; choices are no longer saved")
+            # Records queued before append() noticed are lost either way; do not keep them around
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        for f in self._files.values():
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._files.clear()
+
+    def _next_batch(self):
+        """Block until the next flush is due and return everything queued by then."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return batch, True
+            if item is None:
+                return batch, False
+            batch.append(item)
+
+    def _write_batch(self, batch):
+        lines = {}
+        for session_id, line in batch:
+            lines.setdefault(session_id, []).append(line)
+
+        for session_id, session_lines in lines.items():
+            f = self._open(session_id)
+            f.write('\n'.join(session_lines) + '\n')
+            f.flush()
+            self._unsynced.add(session_id)
+
+    def _open(self, session_id):
+        if session_id in self._files:
+            self._files.move_to_end(session_id)
+            return self._files[session_id]
+
+        while len(self._files) >= self.max_open_files:
+            old_id, old_file = self._files.popitem(last=False)
+            if old_id in self._unsynced:
+                os.fsync(old_file.fileno())
+                self._unsynced.discard(old_id)
+            old_file.close()
+
+        f = open(log_path(session_id, self.directory), 'a', encoding='utf-8')
+        self._files[session_id] = f
+        return f
+
+    def _fsync(self):
+        for session_id in self._unsynced:
+            if session_id in self._files:
+                os.fsync(self._files[session_id].fileno())
+        self._unsynced.clear()
+
+
+def restore_choice(store, value):
+    # Older logs also have the span text and label; those are looked up in the document now
+    store.set(value['file'], value['region'], value['chunk'], value['annotation'], value['choice'], value['data_source'])
+
+
+def replay_log(session_id, directory=AUTOSAVE_DIR):
+    """Rebuild a session's state from its log in one pass.
+
+    Returns a dict with the restored annotation_choices (a ChoiceStore) and feedback, plus the
+    user information and reviewer slot if the log contains them. Later records win; 'choices' and
+    'clear' records set or remove the choices of several spans at once, and a 'reset' record
+    clears all choices made before it.
+    """
+    state = {'annotation_choices': ChoiceStore(), 'user_feedback': ""}
+
+    path = log_path(session_id, directory)
+    if not os.path.exists(path):
+        return state
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partially written last line
+                continue
+
+            kind = record.get('type')
+            if kind == 'choice':
+                restore_choice(state['annotation_choices'], record['value'])
+            elif kind == 'choices':
+                for value in record['value']:
+                    restore_choice(state['annotation_choices'], value)
+            elif kind == 'feedback':
+                state['user_feedback'] = record['value']
+            elif kind == 'user':
+                state['user_experience'] = record['experience']
+                state['user_translation'] = record['translation']
+            elif kind == 'assignment':
+                state['reviewer_slot'] = record['slot']
+            elif kind == 'clear':
+                # One span, or a list of spans cleared at once
+                values = record['value']
+                for value in values if isinstance(values, list) else [values]:
+                    state['annotation_choices'].remove(**value)
+            elif kind == 'reset':
+                state['annotation_choices'].clear()
+
+    return state
@@ -0,0 +1,134 @@
+import argparse
+import glob
+import gzip
+import json
+import lzma
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from corpus import import_zstandard, read_jsonl
+from snapshot import WORKSHOP_DOCUMENTS
+
+
+def build_corpus(paths, size, out_path, seed=0):
+    """Write a JSONL file of at least `size` bytes with lines like those of the given files.
+
+    The files in this repo are single pages, and repeating them would let xz
+    and zstd compress the copies a thousandfold. Instead every line takes
+    the label key and length of a random line of the files and is filled
+    with runs of one to eight consecutive tokens from random places in them,
+    which keeps the vocabulary and compression ratio close to the real
+    files. The same seed writes the same file.
+    """
+    rng = random.Random(seed)
+    lines = [line for path in paths for line in read_jsonl(path)]
+    tokens = [(word, label) for line in lines
+              for word, label in zip(line['words'], line.get('events', line.get('entities', [])))]
+    written = 0
+    with open(out_path, 'w', encoding='utf-8') as out:
+        while written < size:
+            template = rng.choice(lines)
+            picked = []
+            while len(picked) < len(template['words']):
+                start = rng.randrange(len(tokens))
+                picked.extend(tokens[start:start + rng.randint(1, 8)])
+            picked = picked[:len(template['words'])]
+            key = 'events' if 'events' in template else 'entities'
+            text = json.dumps({'words': [word for word, _ in picked], key: [label for _, label in picked]}) + '\n'
+            out.write(text)
+            written += len(text.encode('utf-8'))
+    return out_path
+
+
+def versions():
+    """The decoder versions the numbers depend on."""
+    try:
+        zstd = import_zstandard().__version__
+    except ImportError:
+        zstd = 'not installed'
+    return f"Python {platform.python_version()}, zlib {zlib.ZLIB_RUNTIME_VERSION}, zstandard {zstd}"
+
+
+def compress_copy(path, out_dir, suffix):
+    """Write a compressed copy of a file to out_dir and return its path."""
+    target = os.path.join(out_dir, os.path.basename(path) + suffix)
+    with open(path, 'rb') as src:
+        if suffix == '.gz':
+            with gzip.open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        elif suffix == '.xz':
+            with lzma.open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        elif suffix == '.zst':
+            with open(target, 'wb') as raw:
+                with import_zstandard().ZstdCompressor().stream_writer(raw) as dst:
+                    shutil.copyfileobj(src, dst)
+        else:
+            shutil.copyfile(path, target)
+    return target
+
+
+def time_read(paths, repeat):
+    """Best wall time over `repeat` reads of all paths, and the peak traced memory of one read."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            read_jsonl(path)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    for path in paths:
+        read_jsonl(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def benchmark(paths, formats, repeat=5):
+    """Rows of (format, size on disk, read throughput of the uncompressed bytes, peak memory) for the given files."""
+    raw_size = sum(os.path.getsize(path) for path in paths)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for suffix in formats:
+            try:
+                copies = [compress_copy(path, tmp, suffix) for path in paths]
+            except ImportError as e:
+                print(f"Skipping {suffix}: {e}")
+                continue
+            size = sum(os.path.getsize(path) for path in copies)
+            seconds, peak = time_read(copies, repeat)
+            rows.append((suffix or 'plain', size, raw_size / size, raw_size / seconds / 2 ** 20, seconds, peak))
+    return rows
+
+
+def main():
+    default_files = sorted(glob.glob('predictions_snellius/*.json')) + [path for doc in WORKSHOP_DOCUMENTS for path in doc]
+    parser = argparse.ArgumentParser(description="Compare reading plain and compressed JSONL files: size, speed and memory.")
+    parser.add_argument('files', nargs='*', default=default_files, help="JSONL files to build the input from")
+    parser.add_argument('-s', '--size', type=float, default=64,
+                        help="MB of input, made of short token runs sampled from the files (default 64); "
+                             "0 reads the files as they are")
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.files
+        if args.size:
+            paths = [build_corpus(args.files, int(args.size * 2 ** 20), os.path.join(tmp, 'corpus.json'))]
+        rows = benchmark(paths, ['', '.gz', '.xz', '.zst'], repeat=args.repeat)
+        print(f"{len(paths)} files, {sum(os.path.getsize(path) for path in paths) / 2 ** 20:.1f} MB uncompressed; "
+              f"best of {args.repeat} reads; {versions()}")
+    print(f"{'format':<8}{'size MB':>10}{'ratio':>8}{'MB/s':>10}{'read ms':>10}{'peak MB':>10}")
+    for name, size, ratio, throughput, seconds, peak in rows:
+        print(f"{name:<8}{size / 2 ** 20:>10.2f}{ratio:>8.1f}{throughput:>10.1f}{seconds * 1000:>10.1f}{peak / 2 ** 20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
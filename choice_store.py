@@ -0,0 +1,101 @@
+import sys
+
+# Columns of the downloaded annotation_choices.csv, before the user information is added
+EXPORT_COLUMNS = ['file', 'region', 'chunk', 'text', 'label', 'choice', 'data_source']
+
+CHOICE_VALUES = ('useful', 'misleading')
+DATA_SOURCE_VALUES = ('prediction', 'gold')
+
+
+class ChoiceRecord:
+    """A single reviewer decision.
+
+    The span is identified by its file, region, chunk and annotation index;
+    its text and label are looked up in the document on export (see
+    span_of), so a record keeps no copy of them. The file id is interned and
+    the choice and data source point at the module's constants, so those
+    strings are shared between records (and sessions) rather than copied.
+    """
+
+    __slots__ = ('file', 'region', 'chunk', 'annotation', 'choice', 'data_source')
+
+    def __init__(self, file, region, chunk, annotation, choice, data_source):
+        self.file = sys.intern(file)
+        self.region = region
+        self.chunk = chunk
+        self.annotation = annotation
+        # Point at the module's constants instead of keeping a copy per record
+        self.choice = CHOICE_VALUES[CHOICE_VALUES.index(choice)]
+        self.data_source = DATA_SOURCE_VALUES[DATA_SOURCE_VALUES.index(data_source)]
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def span_of(document, record):
+    """(text, label) of the span a record points at in a document's frozen regions."""
+    text, label, _ = document[record.region][record.data_source][record.chunk]['annotations'][record.annotation]
+    return text, label
+
+
+def export_rows(records, get_document):
+    """Yield the EXPORT_COLUMNS values of each record, with its span looked up in get_document(file id).
+
+    Each document is asked for once. A span whose document is gone or does
+    not line up any more (KeyError or ValueError, e.g. AlignmentError), or
+    that is no longer in it, is exported without text and label.
+    """
+    documents = {}
+    for record in records:
+        if record.file not in documents:
+            try:
+                documents[record.file] = get_document(record.file)
+            except (KeyError, ValueError):
+                documents[record.file] = None
+        try:
+            text, label = span_of(documents[record.file], record)
+        except (TypeError, KeyError, IndexError):
+            text = label = None
+        values = dict(record.as_dict(), text=text, label=label)
+        yield [values[column] for column in EXPORT_COLUMNS]
+
+
+class ChoiceStore:
+    """Per-session collection of ChoiceRecords, keyed by (file, region, chunk, annotation)."""
+
+    def __init__(self):
+        self._records = {}
+
+    def set(self, file, region, chunk, annotation, choice, data_source):
+        """Record (or overwrite) the choice for a span and return the record."""
+        record = ChoiceRecord(file, region, chunk, annotation, choice, data_source)
+        self._records[(record.file, region, chunk, annotation)] = record
+        return record
+
+    def get_choice(self, file, region, chunk, annotation):
+        """Return 'useful', 'misleading' or None if the span has not been reviewed."""
+        record = self._records.get((file, region, chunk, annotation))
+        return record.choice if record is not None else None
+
+    def remove(self, file, region, chunk, annotation):
+        """Forget the choice for a span, if there is one."""
+        self._records.pop((file, region, chunk, annotation), None)
+
+    def clear(self):
+        self._records.clear()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def to_frame(self, get_document):
+        """Return the choices as a DataFrame with the columns of the CSV download.
+
+        get_document(file id) returns the document the records point into, for the span text and label.
+        """
+        # pandas is only needed for the download section, so keep it out of the app's startup
+        import pandas as pd
+
+        return pd.DataFrame(list(export_rows(self, get_document)), columns=EXPORT_COLUMNS)
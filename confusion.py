@@ -0,0 +1,126 @@
+import argparse
+
+import numpy as np
+
+from annotation_utils import span_offsets
+from corpus import file_stem, load_document
+
+
+def document_tags(document, layer):
+    """All merged event/entity tags of one layer ('prediction' or 'gold') of a frozen document, in order."""
+    return [tag for region in document for chunk in region[layer] for tag in chunk['events']]
+
+
+def strip_prefix(tag):
+    return tag[2:] if tag.startswith(('B-', 'I-')) and tag not in ('B-None', 'I-None') else 'O'
+
+
+def pair_confusion(gold_ids, pred_ids, n_labels):
+    """Confusion matrix (gold rows, predicted columns) of paired label ids, in one bincount."""
+    return np.bincount(gold_ids * n_labels + pred_ids, minlength=n_labels * n_labels).reshape(n_labels, n_labels)
+
+
+def token_confusion(gold_tags, pred_tags):
+    """Token-level confusion of the labels (without B-/I-) of two tag sequences over the same tokens.
+
+    Returns (matrix, labels); label 0 is always 'O'.
+    """
+    if len(gold_tags) != len(pred_tags):
+        raise ValueError(f"gold has {len(gold_tags)} tokens but the prediction has {len(pred_tags)}")
+    vocab = {'O': 0}
+    gold_ids = np.array([vocab.setdefault(strip_prefix(tag), len(vocab)) for tag in gold_tags], dtype=np.int64)
+    pred_ids = np.array([vocab.setdefault(strip_prefix(tag), len(vocab)) for tag in pred_tags], dtype=np.int64)
+    return pair_confusion(gold_ids, pred_ids, len(vocab)), list(vocab)
+
+
+def span_confusion(gold_tags, pred_tags):
+    """Span-level confusion of two tag sequences over the same tokens.
+
+    A gold span is paired with the predicted span with exactly the same
+    boundaries, or with 'O' if there is none; predicted spans without a gold
+    span at the same boundaries are paired with gold 'O'. Returns
+    (matrix, labels); label 0 is always 'O'.
+    """
+    n_tokens = len(gold_tags)
+    vocab = {'O': 0}
+
+    def spans(tags):
+        found = span_offsets(tags)
+        codes = np.array([start * (n_tokens + 1) + end for start, end, _ in found], dtype=np.int64)
+        ids = np.array([vocab.setdefault(label, len(vocab)) for _, _, label in found], dtype=np.int64)
+        return codes, ids
+
+    gold_codes, gold_ids = spans(gold_tags)
+    pred_codes, pred_ids = spans(pred_tags)
+
+    order = np.argsort(pred_codes)
+    sorted_codes = pred_codes[order]
+    positions = np.minimum(np.searchsorted(sorted_codes, gold_codes), max(len(sorted_codes) - 1, 0))
+    matched = sorted_codes[positions] == gold_codes if len(sorted_codes) else np.zeros(len(gold_codes), dtype=bool)
+    gold_pred = np.where(matched, pred_ids[order][positions] if len(sorted_codes) else 0, 0)
+
+    unmatched_pred = pred_ids[~np.isin(pred_codes, gold_codes)]
+
+    all_gold = np.concatenate([gold_ids, np.zeros(len(unmatched_pred), dtype=np.int64)])
+    all_pred = np.concatenate([gold_pred, unmatched_pred])
+    return pair_confusion(all_gold, all_pred, len(vocab)), list(vocab)
+
+
+def document_confusion(document, level='token'):
+    """Confusion of the prediction layer against the gold layer of a frozen document."""
+    gold_tags = document_tags(document, 'gold')
+    pred_tags = document_tags(document, 'prediction')
+    if level == 'span':
+        return span_confusion(gold_tags, pred_tags)
+    return token_confusion(gold_tags, pred_tags)
+
+
+def confusion_frame(matrix, labels):
+    """The matrix as a DataFrame with gold labels as rows and predicted labels as columns."""
+    import pandas as pd
+
+    frame = pd.DataFrame(matrix, index=labels, columns=labels)
+    frame.index.name = 'gold'
+    frame.columns.name = 'prediction'
+    return frame
+
+
+def confusion_long_frame(matrix, labels, **columns):
+    """The non-zero cells of the matrix as rows of (..., gold_label, pred_label, count)."""
+    import pandas as pd
+
+    gold, pred = np.nonzero(matrix)
+    frame = pd.DataFrame({'gold_label': np.array(labels)[gold], 'pred_label': np.array(labels)[pred],
+                          'count': matrix[gold, pred]})
+    for position, (name, value) in enumerate(columns.items()):
+        frame.insert(position, name, value)
+    return frame
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Confusion matrices of prediction files against their gold file.")
+    parser.add_argument('predictions', nargs='+', help="prediction files")
+    parser.add_argument('--gold', default='gold/3604.json')
+    parser.add_argument('--entities', default='gold/curated_entities_3604/p_80-ner-event-preanno_NL-HaNA_1.04.02_3604_0270-0276 - 1782 -.json')
+    parser.add_argument('-o', '--output', default='confusion.csv', help="CSV with one row per non-zero cell")
+    args = parser.parse_args()
+
+    frames = []
+    for pred_path in args.predictions:
+        document = load_document(pred_path, args.entities, args.gold)
+        checkpoint = file_stem(pred_path)
+        for level in ('token', 'span'):
+            matrix, labels = document_confusion(document, level)
+            frames.append(confusion_long_frame(matrix, labels, checkpoint=checkpoint, level=level))
+            correct = np.trace(matrix[1:, 1:])
+            print(f"{checkpoint} {level}: {correct} of {matrix[1:, :].sum()} gold and "
+                  f"{matrix[:, 1:].sum()} predicted labels agree")
+
+    pd.concat(frames, ignore_index=True).to_csv(args.output, index=False)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import re
+from types import MappingProxyType
+
+from annotation_utils import (convert_to_annotated_text, extract_annotations, merge_annotations,
+                              merge_small_regions, split_data_into_chunks)
+
+
+# Scans of the VOC archive (1.04.02) are named NL-HaNA_1.04.02_<inventory number>_<page>
+SCAN_NAME_PATTERN = re.compile(r'^NL-HaNA_1\.04\.02_(\d+)_(\d+)')
+
+
+def parse_scan_name(filename):
+    """Return (inventory number, page) from a file name like NL-HaNA_1.04.02_1120_0135.json, or None."""
+    match = SCAN_NAME_PATTERN.match(os.path.basename(filename))
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+
+def scan_url(inventory, page):
+    """Link to the scan on the website of the Nationaal Archief."""
+    return (f"https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/{inventory}"
+            f"/file/NL-HaNA_1.04.02_{inventory}_{page}")
+
+
+class AlignmentError(ValueError):
+    """Raised when the layers of a document do not line up; `report` holds the details."""
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(f"{len(report['errors'])} alignment errors, first: {report['errors'][0]['message']}")
+
+
+# Compressed files are read transparently, going by their last suffix; .zst needs the optional zstandard package
+COMPRESSION_SUFFIXES = ('.gz', '.xz', '.zst')
+
+
+def strip_compression(path):
+    """The path without a .gz, .xz or .zst suffix, to tell the format or the name of a possibly compressed file."""
+    for suffix in COMPRESSION_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def is_data_file(name, suffix='.json'):
+    """True for name<suffix>, also when compressed, e.g. NL-HaNA_1.04.02_1120_0135.json.gz."""
+    return strip_compression(name).endswith(suffix)
+
+
+def file_stem(path):
+    """File name without directory, format and compression suffix, e.g. 3604_mixed_experts for predictions/3604_mixed_experts.json.gz."""
+    return os.path.splitext(os.path.basename(strip_compression(path)))[0]
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading .zst files needs the zstandard package: "
+                          "pip install -r requirements-optional.txt") from None
+    return zstandard
+
+
+def decompression_errors(path):
+    """The exceptions a truncated or damaged compressed file raises while it is read."""
+    if path.endswith('.zst'):
+        return (EOFError, import_zstandard().ZstdError)
+    return (EOFError, gzip.BadGzipFile, lzma.LZMAError)
+
+
+def open_text(path):
+    """Open a text file for reading, decompressing .gz, .xz and .zst files on the fly."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        reader = import_zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True,
+                                                                      closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def file_digest(*paths):
+    """Content hash of one or more files, read in blocks so large files are never held in memory."""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def read_jsonl(path):
+    """Read a (possibly compressed) file with one {'words': [...], 'events'/'entities': [...]} object per line.
+
+    A truncated or damaged compressed file raises ValueError, like a file with invalid JSON.
+    """
+    try:
+        with open_text(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except decompression_errors(path) as e:
+        raise ValueError(f"cannot decompress {path}: {e!r}") from e
+
+
+def read_layer(path):
+    """Read one layer of a document: a JSONL file, or a gold CSV (labelled with its manual_resolve column).
+
+    Both may be compressed; pandas decompresses CSVs by their suffix as well.
+    """
+    if is_data_file(path, '.csv'):
+        from gold_csv import read_gold_lines
+        return read_gold_lines(path)
+    return read_jsonl(path)
+
+
+def freeze_chunk(chunk):
+    """Turn a chunk into a read-only mapping, with its rendering and event spans precomputed."""
+    return MappingProxyType({
+        'words': tuple(chunk['words']),
+        'events': tuple(chunk['events']),
+        'annotated_text': tuple(convert_to_annotated_text(chunk)),
+        'annotations': tuple(extract_annotations(chunk, annotation_type='event')),
+    })
+
+
+def build_document(pred_lines, entity_lines, gold_lines, min_words=None, max_words=150):
+    """Merge, chunk and freeze the regions of one document.
+
+    Each region is a read-only mapping with a 'prediction' and a 'gold' tuple
+    of frozen chunks. If min_words is given, small consecutive regions are
+    merged first, as in make_streamlit.py.
+
+    The layers are checked for alignment first; a document whose layers do
+    not line up raises AlignmentError instead of being silently truncated
+    or misaligned.
+    """
+    # Imported here so that restoring documents from a snapshot does not need numpy
+    from validate import validate_document
+
+    validate_document(pred_lines, entity_lines, gold_lines)
+
+    pred_regions = [merge_annotations(pred_lines[i], entity_lines[i]) for i in range(len(pred_lines))]
+    gold_regions = [merge_annotations(gold_lines[i], entity_lines[i]) for i in range(len(pred_lines))]
+
+    if min_words is not None:
+        pred_regions = merge_small_regions(pred_regions, min_words=min_words)
+        gold_regions = merge_small_regions(gold_regions, min_words=min_words)
+
+    regions = []
+    for pred_region, gold_region in zip(pred_regions, gold_regions):
+        regions.append(MappingProxyType({
+            'prediction': tuple(freeze_chunk(c) for c in split_data_into_chunks(pred_region, max_words=max_words)),
+            'gold': tuple(freeze_chunk(c) for c in split_data_into_chunks(gold_region, max_words=max_words)),
+        }))
+
+    return tuple(regions)
+
+
+def load_document(pred_path, entity_path, gold_path, min_words=None, max_words=150):
+    """Read the prediction, entity and gold files (JSONL or gold CSV) of a document and build its frozen regions."""
+    return build_document(read_layer(pred_path), read_layer(entity_path), read_layer(gold_path),
+                          min_words=min_words, max_words=max_words)
@@ -0,0 +1,70 @@
+import numpy as np
+
+from annotation_utils import is_entity_label, span_offsets
+
+
+def label_id_matrix(checkpoints):
+    """Stack the event tags of several checkpoints into an (n_checkpoints, n_tokens) array of label ids.
+
+    `checkpoints` is a list of parsed prediction files (lists of region dicts)
+    over the same document; their tokens must line up exactly.
+    """
+    vocab = {}
+    rows = []
+    for lines in checkpoints:
+        tags = [tag for line in lines for tag in line['events']]
+        rows.append([vocab.setdefault(tag, len(vocab)) for tag in tags])
+
+    if len({len(row) for row in rows}) > 1:
+        raise ValueError(f"Checkpoints have different token counts: {[len(row) for row in rows]}")
+
+    return np.array(rows, dtype=np.int32), vocab
+
+
+def token_disagreement(label_ids):
+    """Share of checkpoints that disagree with the majority label, per token (0 = all agree)."""
+    n_checkpoints, n_tokens = label_ids.shape
+    n_labels = int(label_ids.max()) + 1 if label_ids.size else 1
+    # Count votes per (label, token) in a single bincount
+    votes = np.bincount((label_ids * n_tokens + np.arange(n_tokens)).ravel(), minlength=n_labels * n_tokens)
+    majority = votes.reshape(n_labels, n_tokens).max(axis=0)
+    return 1.0 - majority / n_checkpoints
+
+
+def build_review_queue(document, checkpoints):
+    """Rank the event spans of a document by how much the checkpoints disagree on them.
+
+    Returns (spans, chunks). spans is a list of (score, region_idx, chunk_idx,
+    ann_idx) sorted from most to least contested, where score is the mean
+    token disagreement over the span. chunks lists every (region_idx, chunk_idx)
+    that has event spans, ordered by its most contested span.
+    """
+    label_ids, _ = label_id_matrix(checkpoints)
+    scores = token_disagreement(label_ids)
+
+    starts, ends, keys = [], [], []
+    offset = 0
+    for region_idx, region in enumerate(document):
+        for chunk_idx, chunk in enumerate(region['prediction']):
+            ann_idx = 0
+            for start, end, label in span_offsets(chunk['events']):
+                if not is_entity_label(label):
+                    starts.append(offset + start)
+                    ends.append(offset + end)
+                    keys.append((region_idx, chunk_idx, ann_idx))
+                    ann_idx += 1
+            offset += len(chunk['events'])
+
+    if offset != len(scores):
+        raise ValueError(f"Document has {offset} tokens but the checkpoints have {len(scores)}")
+
+    cumulative = np.concatenate([[0.0], np.cumsum(scores)])
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    span_scores = (cumulative[ends] - cumulative[starts]) / np.maximum(ends - starts, 1)
+
+    order = np.argsort(-span_scores, kind='stable')
+    spans = [(float(span_scores[i]),) + keys[i] for i in order]
+
+    chunks = list(dict.fromkeys((region_idx, chunk_idx) for _, region_idx, chunk_idx, _ in spans))
+    return spans, chunks
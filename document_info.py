@@ -0,0 +1,56 @@
+from corpus import parse_scan_name, scan_url, strip_compression
+
+# Headers for the documents we know something about. Any other prediction file that lands in
+# the predictions directory is picked up by the watcher and shown with a header derived from its file name.
+DOCUMENT_INFO = {
+    'NL-HaNA_1.04.02_1120_0135.json': {
+        'file_id': '1120_ete',
+        'header': "Random document from inv. nr 1120 with End-to-End event classification (EtE)",
+        'subheader': "Document from 1637 (I think)",
+        'link': "https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/1120/file/NL-HaNA_1.04.02_1120_0135",
+    },
+    'NL-HaNA_1.04.02_8436_0169.json': {
+        'file_id': '8436_ete',
+        'header': "Random document from inv. nr 8436 with EtE. NB: this is a scan of a small page inside a larger one, which has probably messed with the transcription",
+        'subheader': "Document from 1786",
+        'link': "https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/8436/file/NL-HaNA_1.04.02_8436_0169",
+    },
+    'NL-HaNA_1.04.02_11024_0185.json': {
+        'file_id': '11024_ete',
+        'header': "Random document from inv. nr 11024 with EtE",
+        'subheader': "Document from ?",
+        'link': "https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/11024/file/NL-HaNA_1.04.02_11024_0185",
+    },
+    'NL-HaNA_1.04.02_1790_0033.json': {
+        'file_id': '1790_ete',
+        'header': "Random document from inv. nr 1790 with EtE",
+        'subheader': "Document from ? my guess is around 1710",
+        'link': "https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/1790/file/NL-HaNA_1.04.02_1790_0033",
+    },
+    'NL-HaNA_1.04.02_3598_0055.json': {
+        'file_id': '3598_ete',
+        'header': "Random document from inv. nr 3598",
+        'subheader': "Document from ",
+        'link': "",
+    },
+}
+
+
+def get_document_info(filename):
+    """Header information for a prediction file, derived from its name if it is not in DOCUMENT_INFO."""
+    filename = strip_compression(filename)
+    if filename in DOCUMENT_INFO:
+        return DOCUMENT_INFO[filename]
+
+    scan = parse_scan_name(filename)
+    if scan is None:
+        stem = filename.rsplit('.', 1)[0]
+        return {'file_id': f'{stem}_ete', 'header': f"Document {stem} with EtE", 'subheader': "", 'link': ""}
+
+    inventory, page = scan
+    return {
+        'file_id': f'{inventory}_{page}_ete',
+        'header': f"Document from inv. nr {inventory} (scan {page}) with EtE",
+        'subheader': "",
+        'link': scan_url(inventory, page),
+    }
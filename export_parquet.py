@@ -0,0 +1,171 @@
+import argparse
+import glob
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from autosave import AUTOSAVE_DIR, replay_log
+from choice_store import EXPORT_COLUMNS, export_rows
+from corpus import AlignmentError, file_stem, is_data_file, read_jsonl, read_layer
+from snapshot import WORKSHOP_DOCUMENTS, report_skipped
+from validate import label_key, validate_document
+
+LABEL_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+# One row per token. Labels are dictionary encoded, so each distinct label is stored once per row group.
+CORPUS_SCHEMA = pa.schema([
+    ('document', LABEL_TYPE),
+    ('region', pa.int32()),
+    ('token', pa.int32()),
+    ('word', pa.string()),
+    ('event', LABEL_TYPE),
+    ('entity', LABEL_TYPE),
+    ('gold', LABEL_TYPE),
+])
+
+# One row per decision: the columns of the CSV download plus the session it came from
+CHOICE_COLUMNS = ['session_id'] + EXPORT_COLUMNS + ['user_experience', 'user_translation', 'user_feedback']
+CHOICE_TYPES = {'region': pa.int32(), 'chunk': pa.int32(), 'text': pa.string(),
+                'user_translation': pa.string(), 'user_feedback': pa.string()}
+CHOICE_SCHEMA = pa.schema([(column, CHOICE_TYPES.get(column, LABEL_TYPE)) for column in CHOICE_COLUMNS])
+
+
+def document_id(path):
+    return file_stem(path)
+
+
+def layer_labels(lines):
+    return [label for line in lines for label in line[label_key(line)]]
+
+
+def document_table(document, pred_lines, entity_lines=None, gold_lines=None):
+    """One row per token of a document; entity and gold are null for documents that only have predictions."""
+    validate_document(pred_lines, entity_lines or pred_lines, gold_lines or pred_lines)
+
+    lengths = [len(line['words']) for line in pred_lines]
+    n_tokens = sum(lengths)
+    regions = [region for region, length in enumerate(lengths) for _ in range(length)]
+    tokens = [token for length in lengths for token in range(length)]
+
+    def labels(lines):
+        if lines is None:
+            return pa.nulls(n_tokens, LABEL_TYPE)
+        return pa.array(layer_labels(lines), pa.string()).dictionary_encode()
+
+    return pa.Table.from_arrays([
+        pa.DictionaryArray.from_arrays(pa.array([0] * n_tokens, pa.int32()), pa.array([document])),
+        pa.array(regions, pa.int32()),
+        pa.array(tokens, pa.int32()),
+        pa.array([word for line in pred_lines for word in line['words']], pa.string()),
+        labels(pred_lines),
+        labels(entity_lines),
+        labels(gold_lines),
+    ], schema=CORPUS_SCHEMA)
+
+
+def iter_layers(documents, predictions_dir=None, store=None):
+    """Yield (document id, layers) for every (prediction, entity, gold) document, prediction file and store page."""
+    for pred_path, entity_path, gold_path in documents:
+        yield document_id(pred_path), (read_layer(pred_path), read_layer(entity_path), read_layer(gold_path))
+
+    if predictions_dir:
+        for path in sorted(glob.glob(os.path.join(predictions_dir, '*.json*'))):
+            if not is_data_file(path):
+                continue
+            yield document_id(path), (read_jsonl(path),)
+
+    if store is not None:
+        for inventory in store.inventories():
+            for page in store.pages(inventory):
+                yield f'{inventory}_{page}', (store.read_page(inventory, page),)
+
+
+def iter_corpus(documents, predictions_dir=None, store=None, skipped=None):
+    """Yield a token table for every (prediction, entity, gold) document, prediction file and store page.
+
+    Documents whose layers do not line up are left out; if `skipped` is a
+    dict, their alignment reports are put in it by document id.
+    """
+    for document, layers in iter_layers(documents, predictions_dir, store):
+        try:
+            yield document_table(document, *layers)
+        except AlignmentError as e:
+            if skipped is not None:
+                skipped[document] = e.report
+
+
+def choices_table(get_document, directory=AUTOSAVE_DIR):
+    """One row per decision, restored from the autosave logs of every session.
+
+    get_document(file id) returns the document the choices point into, for the span text and label.
+    """
+    columns = {column: [] for column in CHOICE_COLUMNS}
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        session_id = document_id(path)
+        state = replay_log(session_id, directory)
+        for row in export_rows(state['annotation_choices'], get_document):
+            columns['session_id'].append(session_id)
+            for column, value in zip(EXPORT_COLUMNS, row):
+                columns[column].append(value)
+            columns['user_experience'].append(state.get('user_experience'))
+            columns['user_translation'].append(state.get('user_translation'))
+            columns['user_feedback'].append(state['user_feedback'])
+
+    return pa.table(columns, schema=CHOICE_SCHEMA)
+
+
+def write_table(tables, path):
+    """Write tables with the same schema as one Parquet file (one row group each) or one Arrow IPC file."""
+    tables = list(tables)
+    if path.endswith('.parquet'):
+        with pq.ParquetWriter(path, tables[0].schema) as writer:
+            for table in tables:
+                writer.write_table(table)
+    else:
+        # The IPC file format needs a single dictionary per column
+        table = pa.concat_tables(tables).unify_dictionaries()
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sum(table.num_rows for table in tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the corpus (one row per token) or the autosaved choices "
+                                                 "(one row per decision) as Parquet or Arrow.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    corpus_parser = subparsers.add_parser('corpus')
+    corpus_parser.add_argument('--predictions', default='predictions_snellius', help="directory of prediction files")
+    corpus_parser.add_argument('--store', help="prediction store written by import_predictions.py")
+    corpus_parser.add_argument('-o', '--output', default='corpus.parquet', help="output file (.parquet or .arrow)")
+
+    choices_parser = subparsers.add_parser('choices')
+    choices_parser.add_argument('--autosave', default=AUTOSAVE_DIR, help="directory of session logs")
+    choices_parser.add_argument('--predictions', default='predictions_snellius',
+                                help="directory of prediction files the choices were made on")
+    choices_parser.add_argument('--store', default='prediction_store', help="prediction store the choices were made on")
+    choices_parser.add_argument('-o', '--output', default='choices.parquet', help="output file (.parquet or .arrow)")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'corpus':
+        store = None
+        if args.store:
+            from prediction_store import PredictionStore
+            store = PredictionStore(args.store)
+        skipped = {}
+        n_rows = write_table(iter_corpus(WORKSHOP_DOCUMENTS, args.predictions, store, skipped), args.output)
+        report_skipped(skipped)
+    else:
+        # Resolves file ids like the apps do; read-only, so it does not write to the autosave directory
+        from review_api import ReviewService
+        service = ReviewService(args.predictions, args.store, read_only=True)
+        n_rows = write_table([choices_table(service.document, args.autosave)], args.output)
+    print(f"Wrote {n_rows} rows to {args.output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import html
+import json
+import os
+from urllib.parse import quote
+
+from choice_store import EXPORT_COLUMNS
+from corpus import AlignmentError
+from review_api import PREDICTION_STORE, PREDICTIONS_DIR, ReviewService
+from shared_corpus import open_corpus_snapshot
+from snapshot import report_skipped
+
+SITE_DIR = 'review_site'
+
+# Same questions as the intake form of make_workshop_streamlit.py
+EXPERIENCE_OPTIONS = [
+    "None",
+    "Less than half a year",
+    "One year",
+    "Between one to five years",
+    "More than five years",
+]
+TRANSLATION_PASSAGE = ("Wat er tegen de opere Vaart, die niet Voor half Oktober gerekend mag Worden, op Mallabaar "
+                       "Voorvallen kan, mogen wij niet gissen, en zoo Wij deeze zeshonderd lasten Mallabaers rijst "
+                       "kreegen, bij de geeischte Javasche, zoude onze Voorraad maar maatig zijn, Wijl de Fransche "
+                       "Vloot zeken om rijst zal vraagen, en de gemeente geen aanvoer uit Boengaale hoopen kan.")
+
+STYLE = """
+body { font-family: "Source Sans Pro", sans-serif; max-width: 60rem; margin: 2rem auto; padding: 0 1rem; line-height: 1.6; }
+.chunk { margin: 1rem 0; padding-bottom: 1rem; border-bottom: 1px solid #ddd; }
+.annotation { display: flex; align-items: center; gap: 0.5rem; margin: 0.25rem 0; }
+.annotation .text { flex: 0 0 60%; }
+.annotation button { min-width: 2.5rem; padding: 0.25rem 0.5rem; border: 1px solid #ccc; border-radius: 0.5rem; background: white; cursor: pointer; }
+.annotation[data-choice="useful"] .useful, .annotation[data-choice="misleading"] .misleading { border-color: #333; font-weight: bold; }
+.annotation[data-choice="useful"] .status::after { content: "✅ Useful"; }
+.annotation[data-choice="misleading"] .status::after { content: "❌ Misleading"; }
+.region { margin-bottom: 3rem; }
+code { background: #f0f2f6; padding: 0 0.25rem; border-radius: 0.25rem; }
+"""
+
+# Choices are kept in localStorage under one key per site, keyed by file|region|chunk|annotation
+SCRIPT = """
+const EXPORT_COLUMNS = %(columns)s;
+const STORAGE_KEY = 'annotation_choices:' + %(site)s;
+const USER_KEY = 'user_info:' + %(site)s;
+const SESSION_KEY = 'session_id:' + %(site)s;
+
+function load(key) {
+  try { return JSON.parse(localStorage.getItem(key)) || {}; } catch (e) { return {}; }
+}
+
+function save(key, value) {
+  localStorage.setItem(key, JSON.stringify(value));
+}
+
+// 32 hex digits, like the session ids of the apps
+function sessionId() {
+  let id = localStorage.getItem(SESSION_KEY);
+  if (!id) {
+    id = Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('');
+    localStorage.setItem(SESSION_KEY, id);
+  }
+  return id;
+}
+
+function spanKey(el) {
+  return [el.dataset.file, el.dataset.region, el.dataset.chunk, el.dataset.annotation].join('|');
+}
+
+function record(el, choice) {
+  const choices = load(STORAGE_KEY);
+  const key = spanKey(el);
+  // Keep the order in which spans were first reviewed, like the apps do
+  choices[key] = {
+    file: el.dataset.file, region: Number(el.dataset.region), chunk: Number(el.dataset.chunk),
+    annotation: Number(el.dataset.annotation), text: el.dataset.text, label: el.dataset.label,
+    choice: choice, data_source: el.dataset.source,
+  };
+  save(STORAGE_KEY, choices);
+  el.dataset.choice = choice;
+  showCount();
+}
+
+function showCount() {
+  const count = Object.keys(load(STORAGE_KEY)).length;
+  document.querySelectorAll('.count').forEach(el => { el.textContent = count; });
+}
+
+function csvField(value) {
+  if (value === null || value === undefined) return '';
+  const text = String(value);
+  return /[",\\r\\n]/.test(text) ? '"' + text.replace(/"/g, '""') + '"' : text;
+}
+
+function downloadCsv() {
+  const user = load(USER_KEY);
+  const session = sessionId();
+  const columns = ['session_id'].concat(EXPORT_COLUMNS, ['user_experience', 'user_translation', 'user_feedback']);
+  const rows = Object.values(load(STORAGE_KEY)).map(choice => columns.map(column =>
+    csvField(column === 'session_id' ? session : column.startsWith('user_') ? user[column] : choice[column])).join(','));
+  const blob = new Blob([[columns.join(',')].concat(rows).join('\\n') + '\\n'], {type: 'text/csv'});
+  const link = document.createElement('a');
+  link.href = URL.createObjectURL(blob);
+  link.download = 'annotation_choices.csv';
+  link.click();
+  URL.revokeObjectURL(link.href);
+}
+
+function resetChoices() {
+  if (confirm('Remove all of your choices from this browser?')) {
+    localStorage.removeItem(STORAGE_KEY);
+    location.reload();
+  }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  const choices = load(STORAGE_KEY);
+  document.querySelectorAll('.annotation').forEach(el => {
+    const choice = choices[spanKey(el)];
+    if (choice) el.dataset.choice = choice.choice;
+    el.querySelector('.useful').addEventListener('click', () => record(el, 'useful'));
+    el.querySelector('.misleading').addEventListener('click', () => record(el, 'misleading'));
+  });
+
+  const form = document.getElementById('user-info');
+  if (form) {
+    const user = load(USER_KEY);
+    for (const [name, value] of Object.entries(user)) {
+      if (form.elements[name]) form.elements[name].value = value;
+    }
+    form.addEventListener('input', () => {
+      save(USER_KEY, Object.fromEntries(new FormData(form)));
+    });
+  }
+  document.querySelectorAll('.download').forEach(el => el.addEventListener('click', downloadCsv));
+  document.querySelectorAll('.reset').forEach(el => el.addEventListener('click', resetChoices));
+  showCount();
+});
+"""
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<link rel="stylesheet" href="review.css">
+<script src="review.js"></script>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def footer():
+    return ('<hr><p>Annotations reviewed in this browser: <b class="count">0</b></p>'
+            '<p><button class="download">Download CSV</button> <button class="reset">Reset All Choices</button></p>')
+
+
+def render_span(file_id, region_idx, chunk_idx, ann_idx, text, label, data_source):
+    attributes = ' '.join(f'data-{name}="{html.escape(str(value))}"' for name, value in (
+        ('file', file_id), ('region', region_idx), ('chunk', chunk_idx), ('annotation', ann_idx),
+        ('text', text), ('label', label), ('source', data_source)))
+    return (f'<div class="annotation" {attributes}><span class="text"><b>{html.escape(text)}</b> '
+            f'<code>({html.escape(label)})</code></span>'
+            f'<button class="useful" title="Useful">✓</button><button class="misleading" title="Misleading">✗</button>'
+            f'<span class="status"></span></div>')
+
+
+def render_region(region, file_id, region_idx, gold_chunk_ids=()):
+    """The chunks of a region with a ✓/✗ pair for each span, like display_region_with_buttons in the apps."""
+    from annotated_text.util import get_annotated_html
+
+    parts = [f'<div class="region" id="region-{region_idx}">']
+    for chunk_idx in range(len(region['prediction'])):
+        data_source = 'gold' if f"{region_idx}_{chunk_idx}" in gold_chunk_ids else 'prediction'
+        chunk = region[data_source][chunk_idx]
+        parts.append(f'<div class="chunk"><p>{get_annotated_html(*chunk["annotated_text"])}</p>')
+        for ann_idx, (text, label, _) in enumerate(chunk['annotations']):
+            parts.append(render_span(file_id, region_idx, chunk_idx, ann_idx, text, label, data_source))
+        parts.append('</div>')
+    parts.append('</div>')
+    return '\n'.join(parts)
+
+
+def render_document(document, file_id, header, link, gold_chunk_ids=()):
+    body = ['<p><a href="index.html">All documents</a></p>', f'<h1>{html.escape(header)}</h1>']
+    if link:
+        body.append(f'<h3><a href="{html.escape(link)}">See original doc here</a></h3>')
+    body.extend(render_region(region, file_id, region_idx, gold_chunk_ids) for region_idx, region in enumerate(document))
+    body.append(footer())
+    return PAGE.format(title=html.escape(header), body='\n'.join(body))
+
+
+def render_index(entries):
+    """The start page: the intake questions, the feedback box and the list of documents."""
+    options = ''.join(f'<option>{html.escape(option)}</option>' for option in EXPERIENCE_OPTIONS)
+    documents = ''.join(f'<li><a href="{quote(file_id)}.html">{html.escape(header)}</a></li>'
+                        for file_id, header in entries)
+    body = f"""<h1>Review annotations</h1>
+<form id="user-info" onsubmit="return false">
+<p>How many years of experience do you have reading the archives of the Dutch East India Company or archives similar to these?<br>
+<select name="user_experience"><option value=""></option>{options}</select></p>
+<p><b>Please translate the following text into English:</b></p>
+<blockquote>{html.escape(TRANSLATION_PASSAGE)}</blockquote>
+<p><textarea name="user_translation" rows="5" cols="80"></textarea></p>
+<h2>Documents</h2>
+<ul>{documents}</ul>
+<h2>Additional Feedback</h2>
+<p>Do you have any remarks or feedback about the annotations you reviewed?<br>
+<textarea name="user_feedback" rows="6" cols="80"></textarea></p>
+</form>
+<p>Your answers and choices are kept in this browser only. Download them when you are done.</p>
+{footer()}"""
+    return PAGE.format(title="Review annotations", body=body)
+
+
+def export_site(service, out_dir=SITE_DIR, gold_chunk_ids=(), skipped=None):
+    """Write every document of a ReviewService as a static page to out_dir; returns the number of pages.
+
+    Documents whose layers do not line up are left out; if `skipped` is a
+    dict, their alignment reports are put in it by file id.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for file_id, (header, link, _) in service.index().items():
+        try:
+            document = service.document(file_id)
+        except AlignmentError as e:
+            if skipped is not None:
+                skipped[file_id] = e.report
+            continue
+        page = render_document(document, file_id, header, link, gold_chunk_ids)
+        with open(os.path.join(out_dir, f'{file_id}.html'), 'w', encoding='utf-8') as f:
+            f.write(page)
+        entries.append((file_id, header))
+
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(render_index(entries))
+    with open(os.path.join(out_dir, 'review.css'), 'w', encoding='utf-8') as f:
+        f.write(STYLE.lstrip())
+    with open(os.path.join(out_dir, 'review.js'), 'w', encoding='utf-8') as f:
+        f.write(SCRIPT.lstrip() % {'columns': json.dumps(EXPORT_COLUMNS),
+                                   'site': json.dumps(os.path.basename(os.path.abspath(out_dir)))})
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render all documents to a static review site with "
+                                                 "in-browser ✓/✗ buttons and a CSV download.")
+    parser.add_argument('-o', '--out', default=SITE_DIR, help=f"output directory (default {SITE_DIR}/)")
+    parser.add_argument('--predictions', default=PREDICTIONS_DIR)
+    parser.add_argument('--store', default=PREDICTION_STORE)
+    parser.add_argument('--gold-chunks', default='',
+                        help="comma-separated region_chunk ids to show gold data for, e.g. 7_1,8_1")
+    args = parser.parse_args()
+
+    service = ReviewService(args.predictions, args.store, snapshot=open_corpus_snapshot(), read_only=True)
+    gold_chunk_ids = {chunk_id for chunk_id in args.gold_chunks.split(',') if chunk_id}
+    skipped = {}
+    pages = export_site(service, args.out, gold_chunk_ids, skipped)
+    report_skipped(skipped)
+    print(f"Wrote {pages} documents to {args.out}/; serve it with e.g. python -m http.server -d {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import os
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+# Rows with this word separate the regions of a document
+SEPARATOR = '\\n'
+
+# Columns with the annotator data; the rest of the CSV is not used
+USECOLS = ['word', 'tupled_annos', 'first_resolve', 'manual_resolve', 'resolve_type']
+
+
+def read_gold_csv(path):
+    """Read a gold CSV into one row per token, with a region column and the separator rows dropped."""
+    df = pd.read_csv(path, usecols=lambda c: c in USECOLS, dtype=str, keep_default_na=False, encoding='utf-8')
+    separator = df['word'] == SEPARATOR
+    regions = separator.cumsum()[~separator]
+    df = df[~separator].reset_index(drop=True)
+    # Number the regions 0, 1, ... skipping empty ones, like csv_to_json.py always did
+    df['region'] = pd.factorize(regions)[0]
+    return df
+
+
+def parse_tupled_annos(annos):
+    """Parse a column of tuple strings like "('O', 'B-Translocation')" into an (n_tokens, n_annotators) array."""
+    parts = annos.str.strip('()').str.split(',', expand=True)
+    if parts.isna().any(axis=None):
+        raise ValueError("tupled_annos rows have different numbers of annotators")
+    # Some tuples miss a quote, so strip quotes from both sides of every label
+    return np.char.strip(parts.to_numpy(dtype=str), " '\"")
+
+
+def label_types(labels):
+    """Strip the B-/I- prefix (and stray whitespace) off an array of tags; B-None and I-None become 'O'."""
+    types = pd.Series(np.ravel(labels), dtype=str).str.strip().str.replace(r'^[BI]-', '', regex=True)
+    return types.replace('None', 'O').to_numpy(dtype=str).reshape(np.shape(labels))
+
+
+def unresolved(labels):
+    """Mask of the cells of a resolve column that still hold the annotators' tuple instead of one label.
+
+    first_resolve keeps the tuple, e.g. "('O', 'B-Translocation')", for the
+    tokens that were left to the manual resolve.
+    """
+    return labels.str.startswith('(')
+
+
+def gold_lines(frame, column='manual_resolve'):
+    """Turn a gold frame into {'words': [...], 'events': [...]} regions, as in the JSON gold files."""
+    if not len(frame):
+        return []
+    n_unresolved = int(unresolved(frame[column]).sum())
+    if n_unresolved:
+        raise ValueError(f"{n_unresolved} tokens have no single label in {column}")
+    bounds = np.flatnonzero(np.diff(frame['region'].to_numpy())) + 1
+    words = np.split(frame['word'].to_numpy(dtype=object), bounds)
+    labels = np.split(frame[column].to_numpy(dtype=object), bounds)
+    return [{'words': w.tolist(), 'events': l.tolist()} for w, l in zip(words, labels)]
+
+
+def kappa(po, pe):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(pe < 1, (po - pe) / (1 - pe), np.nan)
+
+
+def agreement(frame):
+    """Inter-annotator agreement of a gold frame, from one bincount over all annotator pairs.
+
+    Returns a dict with the number of annotators and tokens, the mean pairwise
+    Cohen's kappa over all labels, a frame with the mean pairwise kappa per
+    label (each label against all others), and a frame with per resolve_type
+    counts of tokens, unanimous tokens, tokens the first resolve left
+    unresolved and tokens whose manual resolve differs from the first one.
+    """
+    annotators = label_types(parse_tupled_annos(frame['tupled_annos']))
+    n_tokens, n_annotators = annotators.shape
+    codes, labels = pd.factorize(annotators.ravel())
+    ids = codes.reshape(n_tokens, n_annotators)
+    n_labels = len(labels)
+
+    # counts[p, a, b]: tokens where the first annotator of pair p says a and the second says b
+    pairs = list(combinations(range(n_annotators), 2))
+    pair_codes = [(p * n_labels + ids[:, i]) * n_labels + ids[:, j] for p, (i, j) in enumerate(pairs)]
+    counts = np.bincount(np.concatenate(pair_codes) if pairs else np.zeros(0, dtype=np.int64),
+                         minlength=len(pairs) * n_labels * n_labels).reshape(len(pairs), n_labels, n_labels)
+
+    agree = np.diagonal(counts, axis1=1, axis2=2)
+    first = counts.sum(axis=2)
+    second = counts.sum(axis=1)
+    n = max(n_tokens, 1)
+
+    overall = kappa(agree.sum(axis=1) / n, (first * second).sum(axis=1) / n ** 2)
+    # Per label: that label against all others, a 2x2 table per pair
+    po = (n - first - second + 2 * agree) / n
+    pe = (first * second + (n - first) * (n - second)) / n ** 2
+    per_label = kappa(po, pe)
+
+    with np.errstate(invalid='ignore'):
+        label_kappa = np.nanmean(per_label, axis=0) if pairs else np.full(n_labels, np.nan)
+    labels_frame = pd.DataFrame({'label': labels, 'annotations': np.bincount(codes, minlength=n_labels),
+                                 'kappa': label_kappa}).sort_values('annotations', ascending=False, ignore_index=True)
+
+    resolve = pd.DataFrame({
+        'resolve_type': frame['resolve_type'].replace('', 'none'),
+        'unanimous': (ids == ids[:, :1]).all(axis=1),
+        'unresolved': unresolved(frame['first_resolve']),
+    })
+    # A token without a first resolve was not changed by the manual one, only settled by it
+    resolve['changed'] = (frame['first_resolve'] != frame['manual_resolve']) & ~resolve['unresolved']
+    resolve_frame = resolve.groupby('resolve_type').agg(tokens=('unanimous', 'size'), unanimous=('unanimous', 'sum'),
+                                                        unresolved=('unresolved', 'sum'),
+                                                        changed=('changed', 'sum')).reset_index()
+
+    return {'annotators': n_annotators, 'tokens': n_tokens,
+            'kappa': float(np.nanmean(overall)) if pairs else float('nan'),
+            'labels': labels_frame, 'resolve_types': resolve_frame}
+
+
+_cache = {}
+
+
+def load_gold_csv(path):
+    """Read and analyse a gold CSV once, and again only when the file changes.
+
+    Returns (frame, agreement); see read_gold_csv and agreement.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != signature:
+        frame = read_gold_csv(path)
+        cached = (signature, frame, agreement(frame))
+        _cache[path] = cached
+    return cached[1], cached[2]
+
+
+def read_gold_lines(path, column='manual_resolve'):
+    """Regions of a gold CSV in the format of the JSON files, labelled with one of its resolve columns."""
+    frame, _ = load_gold_csv(path)
+    return gold_lines(frame, column)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report inter-annotator agreement of a gold CSV.")
+    parser.add_argument('gold', help="gold CSV with tupled_annos, first_resolve, manual_resolve and resolve_type")
+    parser.add_argument('-o', '--output', help="write the per-label agreement to this CSV")
+    args = parser.parse_args()
+
+    _, report = load_gold_csv(args.gold)
+    print(f"{report['tokens']} tokens, {report['annotators']} annotators, mean pairwise kappa {report['kappa']:.3f}")
+    print(report['labels'].to_string(index=False))
+    print(report['resolve_types'].to_string(index=False))
+    if args.output:
+        report['labels'].to_csv(args.output, index=False)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from corpus import is_data_file, parse_scan_name, read_jsonl
+from prediction_store import update_inventories, write_shard
+
+
+def validate_lines(lines):
+    """Return a list of problems with the regions of a prediction file (empty if it is fine)."""
+    problems = []
+    for i, line in enumerate(lines):
+        words = line.get('words')
+        events = line.get('events')
+        if not isinstance(words, list) or not isinstance(events, list):
+            problems.append(f"line {i + 1}: 'words' and 'events' must both be lists")
+            continue
+        if len(words) != len(events):
+            problems.append(f"line {i + 1}: {len(words)} words but {len(events)} events")
+        for event in events:
+            if not isinstance(event, str) or not (event == 'O' or event[:2] in ('B-', 'I-')):
+                problems.append(f"line {i + 1}: invalid label {event!r}")
+                break
+    return problems
+
+
+def parse_prediction_file(path):
+    """Parse and validate one prediction file (runs in a worker process).
+
+    Returns (path, payload, problems), where payload is the page encoded as a
+    single compact JSON line, or None if the file is invalid.
+    """
+    try:
+        lines = read_jsonl(path)
+    except (ValueError, UnicodeDecodeError) as e:
+        return path, None, [f"not valid JSON lines: {e}"]
+
+    problems = validate_lines(lines)
+    if problems:
+        return path, None, problems
+
+    lines = [{'words': line['words'], 'events': line['events']} for line in lines]
+    return path, json.dumps(lines, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), []
+
+
+def find_prediction_files(directory):
+    """Return {path: (inventory, page)} for every NL-HaNA_1.04.02_<inv>_<page>.json(.gz/.xz/.zst) file, sorted by inventory and page."""
+    files = {}
+    for entry in os.scandir(directory):
+        scan = parse_scan_name(entry.name) if is_data_file(entry.name) else None
+        if scan is not None:
+            files[entry.path] = scan
+    return dict(sorted(files.items(), key=lambda item: (int(item[1][0]), item[1][1])))
+
+
+def import_predictions(directory, store, workers=None, chunksize=16):
+    """Parse a directory of prediction files in a process pool and write one shard per inventory.
+
+    Files are handed to the pool in inventory order and results come back in
+    the same order, so only one shard is open at a time and memory stays
+    bounded by the largest inventory. Returns {path: problems} for the
+    files that were refused.
+    """
+    os.makedirs(store, exist_ok=True)
+    files = find_prediction_files(directory)
+    refused = {}
+    shards = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(parse_prediction_file, files, chunksize=chunksize)
+        for inventory, group in groupby(results, key=lambda result: files[result[0]][0]):
+            pages = []
+            for path, payload, problems in group:
+                if problems:
+                    refused[path] = problems
+                else:
+                    pages.append((files[path][1], payload))
+            if pages:
+                shards[inventory] = write_shard(store, inventory, pages)
+                print(f"inv. nr {inventory}: {len(pages)} pages")
+
+    update_inventories(store, shards)
+    return refused
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a directory of Snellius prediction files into a store sharded by inventory number.")
+    parser.add_argument('directory', help="directory with NL-HaNA_1.04.02_<inv>_<page>.json files")
+    parser.add_argument('-o', '--store', default='prediction_store', help="store directory")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    refused = import_predictions(args.directory, args.store, workers=args.workers)
+
+    for path, problems in refused.items():
+        print(f"Refused {path}:")
+        for problem in problems[:5]:
+            print(f"  {problem}")
+    print(f"{len(refused)} files refused")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import numpy as np
+
+from annotation_utils import is_entity_label, span_offsets
+
+DIFF_CLASSES = ['match', 'partial', 'wrong-label', 'missed', 'spurious']
+
+DIFF_COLORS = {
+    'match': '#8FD18F',        # Green
+    'partial': '#FFE08A',      # Yellow: same label, different boundaries
+    'wrong-label': '#C9A3FF',  # Purple
+    'missed': '#FF8A80',       # Red: in gold, not predicted
+    'spurious': '#FFB347',     # Orange: predicted, not in gold
+}
+
+
+def event_spans(events, vocab):
+    """Return (starts, ends, label ids) arrays of the event spans in a list of tags."""
+    spans = [(start, end, vocab.setdefault(label, len(vocab) + 1))
+             for start, end, label in span_offsets(events) if not is_entity_label(label)]
+    if not spans:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return tuple(np.array(column, dtype=np.int64) for column in zip(*spans))
+
+
+def span_label_array(n_tokens, starts, ends, labels):
+    """Per-token label id of the event span covering the token (0 outside spans)."""
+    lengths = ends - starts
+    token_labels = np.zeros(n_tokens, dtype=np.int64)
+    if len(starts):
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        positions = np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+        token_labels[positions] = np.repeat(labels, lengths)
+    return token_labels
+
+
+def range_sums(values, starts, ends):
+    """Sum of values[start:end] for every (start, end) pair."""
+    cumulative = np.concatenate([[0], np.cumsum(values)])
+    return cumulative[ends] - cumulative[starts]
+
+
+def diff_events(gold_events, pred_events):
+    """Classify the event spans of a gold and a prediction tag sequence over the same tokens.
+
+    Every gold span is a 'match' (same boundaries and label), 'wrong-label'
+    (same boundaries, or overlapping predictions, with a different label),
+    'partial' (overlapping prediction with the same label but different
+    boundaries) or 'missed' (no predicted event overlaps it). Predicted spans
+    that overlap no gold event are 'spurious'. Returns a list of
+    (start, end, class, gold label, predicted label) sorted by start.
+    """
+    if len(gold_events) != len(pred_events):
+        raise ValueError(f"gold has {len(gold_events)} tokens but the prediction has {len(pred_events)}")
+
+    n_tokens = len(gold_events)
+    vocab = {}
+    g_starts, g_ends, g_labels = event_spans(gold_events, vocab)
+    p_starts, p_ends, p_labels = event_spans(pred_events, vocab)
+    names = {label_id: label for label, label_id in vocab.items()}
+
+    g_tokens = span_label_array(n_tokens, g_starts, g_ends, g_labels)
+    p_tokens = span_label_array(n_tokens, p_starts, p_ends, p_labels)
+
+    # Gold spans
+    p_codes = p_starts * (n_tokens + 1) + p_ends
+    g_codes = g_starts * (n_tokens + 1) + g_ends
+    same_bounds = np.isin(g_codes, p_codes)
+    overlap = range_sums(p_tokens > 0, g_starts, g_ends) > 0
+    same_label = range_sums((p_tokens == g_tokens) & (g_tokens > 0), g_starts, g_ends) > 0
+    exact = same_bounds & (range_sums(p_tokens != g_tokens, g_starts, g_ends) == 0)
+
+    g_classes = np.select([exact, same_bounds, overlap & same_label, overlap],
+                          ['match', 'wrong-label', 'partial', 'wrong-label'], 'missed')
+
+    # The predicted label shown next to a gold span: the label predicted on most of its tokens
+    # (the first one predicted on ties), counted per (span, label) with one bincount
+    span_ids = span_label_array(n_tokens, g_starts, g_ends, np.arange(1, len(g_starts) + 1))
+    inside = (span_ids > 0) & (p_tokens > 0)
+    n_labels = len(vocab) + 1
+    counts = np.bincount((span_ids[inside] - 1) * n_labels + p_tokens[inside], minlength=len(g_starts) * n_labels)
+    pred_in_span = counts.reshape(len(g_starts), n_labels).argmax(axis=1)
+
+    diff = [(int(start), int(end), str(cls), names[int(g)], names.get(int(p)))
+            for start, end, cls, g, p in zip(g_starts, g_ends, g_classes, g_labels, pred_in_span)]
+
+    # Predicted spans that touch no gold event
+    spurious = range_sums(g_tokens > 0, p_starts, p_ends) == 0
+    diff += [(int(start), int(end), 'spurious', None, names[int(p)])
+             for start, end, p in zip(p_starts[spurious], p_ends[spurious], p_labels[spurious])]
+
+    return sorted(diff, key=lambda span: (span[0], span[1]))
+
+
+def diff_document(document):
+    """Diff the gold and prediction chunks of every region of a frozen document.
+
+    Returns one list per region with the diff (see diff_events) of each chunk.
+    """
+    return [[diff_events(gold['events'], pred['events']) for gold, pred in zip(region['gold'], region['prediction'])]
+            for region in document]
+
+
+def diff_counts(diffs):
+    """Count the spans per class over the output of diff_document."""
+    counts = dict.fromkeys(DIFF_CLASSES, 0)
+    for region in diffs:
+        for chunk in region:
+            for _, _, cls, _, _ in chunk:
+                counts[cls] += 1
+    return counts
+
+
+def diff_to_annotated_text(words, diff):
+    """Render a chunk with its diff spans highlighted, in annotated_text format.
+
+    Overlapping gold and predicted spans are shown as one highlighted piece.
+    """
+    result = []
+    position = 0
+    for start, end, cls, gold_label, pred_label in diff:
+        if start < position:
+            # Overlaps the previous piece, which already shows these words
+            continue
+        if start > position:
+            result.append(' '.join(words[position:start]) + ' ')
+        if cls == 'match':
+            label = gold_label
+        elif cls == 'missed':
+            label = f"missed: {gold_label}"
+        elif cls == 'spurious':
+            label = f"spurious: {pred_label}"
+        else:
+            label = f"{cls}: {gold_label} → {pred_label}"
+        result.append((' '.join(words[start:end]) + ' ', label, DIFF_COLORS[cls]))
+        position = end
+    if position < len(words):
+        result.append(' '.join(words[position:]))
+    return result
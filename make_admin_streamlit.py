@@ -0,0 +1,62 @@
+import pandas as pd
+import streamlit as st
+from memory_profile import is_admin
+from rerun_log import RERUN_LOG_DIR, read_rerun_log
+
+PERCENTILES = {'p50': 0.5, 'p95': 0.95, 'p99': 0.99}
+
+
+def latency_percentiles(groups):
+    """p50/p95/p99 of total_ms and the number of reruns for each group of a grouped rerun log."""
+    table = groups['total_ms'].quantile(list(PERCENTILES.values())).unstack()
+    table.columns = list(PERCENTILES)
+    table['reruns'] = groups.size()
+    return table
+
+
+# Main app
+
+# Same guard as the admin pages of the apps: open with ?admin=<ADMIN_TOKEN>
+if not is_admin(st.query_params):
+    st.error("This page needs ?admin=<ADMIN_TOKEN> in its address.")
+    st.stop()
+
+st.header("Admin")
+
+st.subheader("Rerun latency")
+
+reruns = read_rerun_log(RERUN_LOG_DIR)
+if reruns.empty:
+    st.info(f"No reruns have been logged in {RERUN_LOG_DIR}/ yet.")
+    st.stop()
+
+apps = st.sidebar.multiselect("Apps", sorted(reruns['app'].unique()), default=sorted(reruns['app'].unique()))
+last = st.sidebar.selectbox("Period", ["Last hour", "Last 24 hours", "Everything"], index=1)
+interval = st.sidebar.selectbox("Interval", ["1min", "5min", "15min", "1h"], index=1)
+
+reruns = reruns[reruns['app'].isin(apps)]
+if last != "Everything":
+    since = reruns['time'].max() - pd.Timedelta(hours=1 if last == "Last hour" else 24)
+    reruns = reruns[reruns['time'] >= since]
+
+overall = reruns['total_ms'].quantile(list(PERCENTILES.values()))
+cols = st.columns(len(PERCENTILES) + 1)
+cols[0].metric("Reruns", len(reruns))
+for col, (name, value) in zip(cols[1:], zip(PERCENTILES, overall)):
+    col.metric(name, f"{value:.0f} ms")
+
+st.caption(f"Latency per {interval} (ms)")
+over_time = latency_percentiles(reruns.groupby(pd.Grouper(key='time', freq=interval)))
+st.line_chart(over_time[list(PERCENTILES)])
+
+st.caption("Per document")
+st.dataframe(latency_percentiles(reruns.groupby('document', dropna=False)).sort_values('p95', ascending=False))
+
+st.caption("Per trigger")
+triggers = reruns.assign(trigger=reruns['trigger'].fillna('(none)').str.replace(r'_\d.*$', '', regex=True))
+st.dataframe(latency_percentiles(triggers.groupby('trigger')).sort_values('p95', ascending=False))
+
+st.caption("Per stage (ms)")
+stages = [column for column in reruns.columns if column.startswith('stages_')]
+st.dataframe(reruns[stages].rename(columns=lambda column: column[len('stages_'):])
+             .quantile(list(PERCENTILES.values())).set_axis(list(PERCENTILES)).T)
@@ -0,0 +1,88 @@
+import streamlit as st
+from annotated_text import annotated_text
+from confusion import confusion_frame, confusion_long_frame, document_confusion
+from corpus import AlignmentError, load_document
+from gold_csv import load_gold_csv
+from label_diff import DIFF_CLASSES, DIFF_COLORS, diff_counts, diff_document, diff_to_annotated_text
+
+GOLD_FILE = 'gold/3604.json'
+# Annotator data behind the gold file
+GOLD_CSV_FILE = 'gold/3604.csv'
+ENTITY_FILE = 'gold/curated_entities_3604/p_80-ner-event-preanno_NL-HaNA_1.04.02_3604_0270-0276 - 1782 -.json'
+
+# Predictions of inv. nr 3604 that share their tokens with the gold file
+PREDICTION_FILES = {
+    'Mixed experts': 'predictions/3604_mixed_experts.json',
+    '5 epochs': 'predictions/3604_5ep.json',
+    '10 epochs': 'predictions/3604_10ep.json',
+    '20 epochs': 'predictions/3604_20ep.json',
+    '40 epochs': 'predictions/3604_40ep.json',
+}
+
+
+@st.cache_resource
+def get_diff(pred_path, gold_path, entity_path):
+    """Load a (gold, prediction) pair and diff it once per server process."""
+    document = load_document(pred_path, entity_path, gold_path)
+    diffs = diff_document(document)
+    return document, diffs, diff_counts(diffs)
+
+
+@st.cache_resource
+def get_confusion(pred_path, gold_path, entity_path, level):
+    """Token- or span-level confusion matrix of a (gold, prediction) pair, once per server process."""
+    document, _, _ = get_diff(pred_path, gold_path, entity_path)
+    return document_confusion(document, level)
+
+
+# Main app
+
+st.header("Gold vs. predictions for inv. nr 3604")
+
+model = st.sidebar.radio("Prediction", list(PREDICTION_FILES))
+only_differences = st.sidebar.checkbox("Only show chunks with differences", value=False)
+
+try:
+    document, diffs, counts = get_diff(PREDICTION_FILES[model], GOLD_FILE, ENTITY_FILE)
+except AlignmentError as e:
+    st.error("The prediction, entity and gold files do not line up.")
+    st.json(e.report, expanded=False)
+    st.stop()
+
+# Legend and totals
+cols = st.columns(len(DIFF_CLASSES))
+for col, cls in zip(cols, DIFF_CLASSES):
+    with col:
+        annotated_text((cls, str(counts[cls]), DIFF_COLORS[cls]))
+
+with st.expander("Confusion matrix"):
+    level = st.radio("Level", ['token', 'span'], horizontal=True,
+                     help="Span level pairs spans with exactly the same boundaries; 'O' marks a missing span.")
+    matrix, labels = get_confusion(PREDICTION_FILES[model], GOLD_FILE, ENTITY_FILE, level)
+    st.caption("Rows are gold labels, columns predicted labels (events and curated entities).")
+    st.dataframe(confusion_frame(matrix, labels))
+    st.download_button(
+        "Download as CSV",
+        confusion_long_frame(matrix, labels, checkpoint=model, level=level).to_csv(index=False),
+        file_name=f"confusion_{level}_{model.replace(' ', '_')}.csv",
+        mime='text/csv',
+    )
+
+with st.expander("Annotator agreement"):
+    # load_gold_csv keeps the result until the CSV changes
+    _, report = load_gold_csv(GOLD_CSV_FILE)
+    st.write(f"{report['tokens']} tokens, {report['annotators']} annotators, "
+             f"mean pairwise Cohen's kappa {report['kappa']:.3f}")
+    st.dataframe(report['labels'], hide_index=True)
+    st.caption("Tokens per resolve type: unanimous annotators, and manual resolve different from the first resolve.")
+    st.dataframe(report['resolve_types'], hide_index=True)
+
+st.divider()
+
+for region_idx, (region, region_diffs) in enumerate(zip(document, diffs)):
+    for chunk_idx, (chunk, chunk_diff) in enumerate(zip(region['gold'], region_diffs)):
+        if only_differences and all(span[2] == 'match' for span in chunk_diff):
+            continue
+        st.caption(f"Region {region_idx}, chunk {chunk_idx}")
+        annotated_text(*diff_to_annotated_text(chunk['words'], chunk_diff))
+        st.markdown("---")
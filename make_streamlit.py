@@ -1,613 +1,395 @@
-import streamlit as st
-from annotated_text import annotated_text
-import ast
-import pandas as pd
-
-# Initialize session state
-if 'annotation_choices' not in st.session_state:
-    st.session_state.annotation_choices = {}
-
-if 'chunk_sources' not in st.session_state:
-    st.session_state.chunk_sources = {}
-
-if 'user_info_collected' not in st.session_state:
-    st.session_state.user_info_collected = False
-
-if 'user_experience' not in st.session_state:
-    st.session_state.user_experience = None
-
-if 'user_translation' not in st.session_state:
-    st.session_state.user_translation = None
-
-if 'user_feedback' not in st.session_state:
-    st.session_state.user_feedback = ""
+import time
+script_start = time.perf_counter()
 
-# Define color schemes with lighter blues
-ENTITY_COLORS = {
-    'LOC_NAME': '#4A90E2',  # Medium blue
-    'LOC_ADJ': '#7FB3D5',  # Light blue
-    'PER_NAME': '#9FCDFF',  # Powder blue
-    'PER_ATTR': '#5B9BD5',  # Sky blue
-    'PRF': '#89CFF0',  # Baby blue
-    'CMTY_QUANT': '#6BB6FF',  # Bright blue
-    'CMTY_NAME': '#A8D5FF',  # Soft blue
-    'DOC': '#1E90FF',  # Dodger blue
-    'DATE': '#87CEEB',  # Sky blue light
-    'SHIP_TYPE': '#C2DFFF',  # Alice blue
-    'ORG': '#B0D7FF',  # Baby blue
-    'STATUS': '#AFEEEE'  # Pale Turquoise
-}
-
-EVENT_COLORS = {
-    'event1': '#FF8C00',  # Dark orange
-    'event2': '#FFA500',  # Orange
-    'event3': '#FFB347',  # Light orange
-    'event4': '#FF7F50',  # Coral
-    'event5': '#FF6347',  # Tomato
-}
-
-
-#Temporary setting with no gold annotations for within-team inspection of the model's output
-GOLD_CHUNK_IDS = {}
-
-def hex_to_rgba(hex_color, opacity=1.0):
-    """Convert hex color to rgba with specified opacity."""
-    hex_color = hex_color.lstrip('#')
-    r = int(hex_color[0:2], 16)
-    g = int(hex_color[2:4], 16)
-    b = int(hex_color[4:6], 16)
-    return f'rgba({r}, {g}, {b}, {opacity})'
-
-
-def get_color_for_label(label):
-    """Get the appropriate color for a label."""
-    if label in ENTITY_COLORS:
-        color = ENTITY_COLORS[label]
-        return hex_to_rgba(color, 0.30)  # Entities always 70% transparent (25% opacity)
-    elif label in EVENT_COLORS:
-        return EVENT_COLORS[label]
-    else:
-        # Default colors if not found
-        if is_entity_label(label):
-            color = '#B3D9FF'  # Default light blue
-            return hex_to_rgba(color, 0.25)  # Entities always transparent
-        else:
-            return '#FFD699'  # Default light orange
-
-def is_entity_label(label):
-    """Check if a label is an entity type."""
-    entity_labels = ['LOC_NAME', 'PER_NAME', 'PER_ATTR', 'PRF', 'CMTY_QUANT',
-                     'CMTY_NAME', 'DOC', 'DATE', 'SHIP_TYPE', 'LOC_ADJ', 'ORG', 'STATUS', 'SHIP', 'ETH_REL']
-    return any(entity in label for entity in entity_labels)
-
-
-def count_event_annotations(data):
-    """Count the number of event annotations in a data structure."""
-    events = data['events']
-    count = 0
-    for event in events:
-        if event.startswith('B-') and not is_entity_label(event[2:]) and event!='B-None' and event!='I-None':
-            count += 1
-    return count
-
-def merge_motion_events(data):
-    """Merge consecutive motion event annotations into a single span.
-    
-    If two consecutive tokens are annotated with different events from the motion list,
-    they are merged into one span using the label of the first token.
-    """
-    motion_events = ["Translocation", "Transportation", "Voyage", "Leaving", "Arriving", "BeingAtAPlace"]
-    
-    words = data['words']
-    events = data['events'].copy()  # Make a copy to avoid modifying original
-    
-    i = 0
-    while i < len(events):
-        current_event = events[i]
-        
-        # Check if current token has a motion event (B- or I-)
-        if current_event.startswith('B-'):
-            current_label = current_event[2:]
-            if current_label in motion_events:
-                # Look ahead for consecutive motion events
-                j = i + 1
-                while j < len(events):
-                    next_event = events[j]
-                    
-                    # If next token is also a motion event (B- prefix)
-                    if next_event.startswith('B-'):
-                        next_label = next_event[2:]
-                        if next_label in motion_events:
-                            # Change it to I- with the current label
-                            events[j] = f'I-{current_label}'
-                            j += 1
-                        else:
-                            break  # Not a motion event, stop merging
-                    elif next_event.startswith('I-'):
-                        # Already part of an annotation, continue
-                        next_label = next_event[2:]
-                        if next_label in motion_events:
-                            # Update to current label
-                            events[j] = f'I-{current_label}'
-                            j += 1
-                        else:
-                            break
-                    else:
-                        # 'O' tag, stop merging
-                        break
-                
-                i = j  # Skip to the end of merged span
-            else:
-                i += 1
-        else:
-            i += 1
-    
-    return {
-        'words': words,
-        'events': events
-    }
-
-
-def merge_annotations(event_data, entity_data):
-    """Merge event and entity annotations into a single data structure."""
-    words = event_data['words']
-    events = event_data['events']
-    entities = entity_data['events']
-
-    combined = []
-    for event, entity in zip(events, entities):
-        if event != 'O':
-            combined.append(event)
-        else:
-            combined.append(entity)
-
-    merged_data = {
-        'words': words,
-        'events': combined
-    }
-    
-    # Apply motion event merging
-    merged_data = merge_motion_events(merged_data)
-    
-    return merged_data
-
-
-def convert_to_annotated_text(data):
-    """Convert data to annotated_text format with color coding."""
-    words = data['words']
-    events = data['events']
-
-    result = []
-    current_text = []
-    current_event = None
-    current_event_words = []
-
-    for word, event in zip(words, events):
-        if event.startswith('B-') and event!='B-None':
-            if current_text:
-                result.append(' '.join(current_text) + ' ')
-                current_text = []
-
-            if current_event_words and current_event:
-                label = current_event
-                color = get_color_for_label(label)
-                result.append((' '.join(current_event_words) + ' ', label, color))
-                current_event_words = []
-
-            current_event = event[2:]
-            current_event_words = [word]
-
-        elif event.startswith('I-') and event!='I-None':
-            current_event_words.append(word)
-
-        else:
-            if current_event_words and current_event:
-                label = current_event
-                color = get_color_for_label(label)
-                result.append((' '.join(current_event_words) + ' ', label, color))
-                current_event_words = []
-                current_event = None
-
-            current_text.append(word)
-
-    if current_text:
-        result.append(' '.join(current_text))
-    if current_event_words and current_event:
-        label = current_event
-        color = get_color_for_label(label)
-        result.append((' '.join(current_event_words) + ' ', label, color))
-
-    return result
-
-
-def extract_annotations(data, annotation_type='event'):
-    """Extract annotations. Can filter by type (event vs entity)."""
-    words = data['words']
-    events = data['events']
-
-    annotations = []
-    current_event = None
-    current_words = []
-
-    for word, event in zip(words, events):
-        if event.startswith('B-') and event != 'B-None':
-            if current_words and current_event:
-                label_type = current_event
-                is_entity = is_entity_label(label_type)
-                is_event = not is_entity
-
-                if (annotation_type == 'entity' and is_entity) or \
-                        (annotation_type == 'event' and is_event) or \
-                        (annotation_type == 'all'):
-                    annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
-
-            current_event = event[2:]
-            current_words = [word]
-
-        elif event.startswith('I-') and event !='I-None':
-            current_words.append(word)
-
-        else:
-            if current_words and current_event:
-                label_type = current_event
-                is_entity = is_entity_label(label_type)
-                is_event = not is_entity
-
-                if (annotation_type == 'entity' and is_entity) or \
-                        (annotation_type == 'event' and is_event) or \
-                        (annotation_type == 'all'):
-                    annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
-                current_words = []
-                current_event = None
-
-    if current_words and current_event:
-        label_type = current_event
-        is_entity = is_entity_label(label_type)
-        is_event = not is_entity
-
-        if (annotation_type == 'entity' and is_entity) or \
-                (annotation_type == 'event' and is_event) or \
-                (annotation_type == 'all'):
-            annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
-
-    return annotations
-
-
-def split_data_into_chunks(data, max_words=150):
-    """Split data into roughly equal chunks, each up to max_words."""
-    words = data['words']
-    events = data['events']
-
-    total_words = len(words)
-
-    if total_words <= max_words:
-        return [data]
-
-    num_chunks = (total_words + max_words - 1) // max_words
-    chunk_size = total_words // num_chunks
-    remainder = total_words % num_chunks
-
-    chunks = []
-    start_idx = 0
-
-    for i in range(num_chunks):
-        extra = 1 if i < remainder else 0
-        end_idx = start_idx + chunk_size + extra
-
-        chunk = {
-            'words': words[start_idx:end_idx],
-            'events': events[start_idx:end_idx]
-        }
-        chunks.append(chunk)
-        start_idx = end_idx
-
-    return chunks
-
-def merge_small_regions(regions, min_words=150):
-    """Merge consecutive regions with fewer than min_words tokens into one region."""
-    merged = []
-    buffer = None
-
-    for region in regions:
-        if buffer is None:
-            buffer = region
-        else:
-            combined_len = len(buffer['words']) + len(region['words'])
-            if len(buffer['words']) < min_words or combined_len <= min_words:
-                # Merge region into buffer
-                buffer = {
-                    'words': buffer['words'] + region['words'],
-                    'events': buffer['events'] + region['events']
-                }
-            else:
-                merged.append(buffer)
-                buffer = region
-
-    if buffer is not None:
-        merged.append(buffer)
-
-    return merged
-
-
-def display_region_with_buttons(pred_data, gold_data, file_id, region_idx, gold_chunk_ids):
-    """Display annotated text and buttons for each annotation.
-    
-    Args:
-        pred_data: Prediction annotation data
-        gold_data: Gold annotation data
-        file_id: Identifier for the file
-        region_idx: Index of the current region
-        gold_chunk_ids: Set of chunk IDs that should display gold data
-        transparent_entities: Whether to make entity labels transparent
+import os
+import streamlit as st
+from autosave import get_session_id, replay_log
+from choice_store import ChoiceStore
+from corpus import AlignmentError, parse_scan_name, strip_compression
+from document_info import DOCUMENT_INFO, get_document_info
+from prediction_store import INVENTORIES_FILE, PredictionStore
+from memory_profile import MemoryTracer, SessionRegistry, is_admin, show_memory_page
+from prefetch import Prefetcher
+from rerun_log import RerunLog, RerunTimer, log_rerun, rerun_trigger
+from review_ui import (autosave, display_region_with_buttons, get_autosave_writer, record_choice, set_choices,
+                       show_autosave_error)
+from shared_corpus import open_corpus_snapshot
+from span_groups import SpanIndex, group_choices
+from watcher import PredictionWatcher
+
+imports_done = time.perf_counter()
+timer = RerunTimer(script_start)
+timer.stage('imports')
+
+
+@st.cache_resource
+def get_boot_report():
+    """Timings of the first run of this script in the server process, in seconds."""
+    return {}
+
+
+@st.cache_resource
+def get_boot_notes():
+    """Messages about the first run, e.g. that an outdated snapshot was ignored."""
+    return []
+
+
+@st.cache_resource
+def get_corpus_snapshot():
+    """Preprocessed documents written by shared_corpus.py or snapshot.py at build time (empty if missing or outdated).
+
+    A shared corpus is memory-mapped, so all server processes share one copy of it.
     """
-    pred_chunks = split_data_into_chunks(pred_data, max_words=150)
-    gold_chunks = split_data_into_chunks(gold_data, max_words=150)
-
-    for chunk_idx in range(len(pred_chunks)):
-        chunk_id = f"{region_idx}_{chunk_idx}"
-        
-        # Determine if this chunk should use gold or prediction data
-        if chunk_id in gold_chunk_ids:
-            chunk = gold_chunks[chunk_idx]
-            data_source = 'gold'
-        else:
-            chunk = pred_chunks[chunk_idx]
-            data_source = 'prediction'
-        
-        # Store the data source for this chunk
-        st.session_state.chunk_sources[chunk_id] = data_source
-        
-        annotated_version = convert_to_annotated_text(chunk)
-        annotated_text(*annotated_version)
-
-        annotations = extract_annotations(chunk, annotation_type='event')
-
-        if annotations:
-            st.markdown("---")
-            for ann_idx, (text, label, ann_type) in enumerate(annotations):
-                key = f"{file_id}_{region_idx}_{chunk_idx}_{ann_idx}"
-
-                cols = st.columns([0.6, 0.1, 0.1, 0.2])
-
-                with cols[0]:
-                    st.markdown(f"**{text}** `({label})`")
-
-                with cols[1]:
-                    if st.button("✓", key=f"correct_{key}"):
-                        st.session_state.annotation_choices[key] = {
-                            'file': file_id,
-                            'region': region_idx,
-                            'chunk': chunk_idx,
-                            'text': text,
-                            'label': label,
-                            'choice': 'useful',
-                            'data_source': data_source
-                        }
-
-                with cols[2]:
-                    if st.button("✗", key=f"wrong_{key}"):
-                        st.session_state.annotation_choices[key] = {
-                            'file': file_id,
-                            'region': region_idx,
-                            'chunk': chunk_idx,
-                            'text': text,
-                            'label': label,
-                            'choice': 'misleading',
-                            'data_source': data_source
-                        }
-
-                with cols[3]:
-                    if key in st.session_state.annotation_choices:
-                        choice = st.session_state.annotation_choices[key]['choice']
-                        st.markdown("✅ Useful" if choice == 'useful' else "❌ Misleading")
-
-        if chunk_idx < len(pred_chunks) - 1:
-            st.markdown("---")
-
-
-# Main app
-
-# first doc
-
-st.header("Random document from inv. nr 1120 with End-to-End event classification (EtE)")
-
-st.subheader("Document from 1637 (I think)")
-st.markdown("### [See original doc here](https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/1120/file/NL-HaNA_1.04.02_1120_0135)")
-
-
-# load predicted events and entities
-with open('predictions_snellius/NL-HaNA_1.04.02_1120_0135.json') as f:
-    pred_event_data = f.readlines()
-
-with open('predictions_snellius/NL-HaNA_1.04.02_1120_0135.json') as f:
-    entity_data = f.readlines()
-
-# load fake gold file
-with open('predictions_snellius/NL-HaNA_1.04.02_1120_0135.json') as f:
-    gold_event_data = f.readlines()
-
-    
-
-# Use the manually configured gold chunk IDs
-gold_chunk_ids = GOLD_CHUNK_IDS
-
-
-
-pred_regions = [merge_annotations(ast.literal_eval(pred_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(pred_event_data))]
-gold_regions = [merge_annotations(ast.literal_eval(gold_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(gold_event_data))]
-
-# Merge small regions
-pred_regions = merge_small_regions(pred_regions, min_words=150)
-gold_regions = merge_small_regions(gold_regions, min_words=150)
-
-# Display
-for region_idx, (merged_pred, merged_gold) in enumerate(zip(pred_regions, gold_regions)):
-    display_region_with_buttons(merged_pred, merged_gold, '1120_ete', region_idx, gold_chunk_ids)
-    st.write("")
-    st.write("")
+    start = time.perf_counter()
+    entries = open_corpus_snapshot(notes=get_boot_notes())
+    get_boot_report()['snapshot restore'] = time.perf_counter() - start
+    return entries
 
-# second doc
 
-st.header("Random document from inv. nr 8436 with EtE. NB: this is a scan of a small page inside a larger one, which has probably messed with the transcription")
+@st.cache_resource
+def get_session_registry():
+    """The state of every session of this server process, for the admin memory page."""
+    return SessionRegistry()
 
-st.subheader("Document from 1786")
-st.markdown("### [See original doc here](https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/8436/file/NL-HaNA_1.04.02_8436_0169)")
 
+@st.cache_resource
+def get_memory_tracer():
+    return MemoryTracer()
 
-# load predicted events and entities
-with open('predictions_snellius/NL-HaNA_1.04.02_8436_0169.json') as f:
-    pred_event_data = f.readlines()
 
-with open('predictions_snellius/NL-HaNA_1.04.02_8436_0169.json') as f:
-    entity_data = f.readlines()
+@st.cache_resource
+def get_rerun_log():
+    """One rolling rerun timing log (and writer thread) per server process."""
+    return RerunLog()
 
-# load fake gold file
-with open('predictions_snellius/NL-HaNA_1.04.02_8436_0169.json') as f:
-    gold_event_data = f.readlines()
 
-    
-
-# Use the manually configured gold chunk IDs
-gold_chunk_ids = GOLD_CHUNK_IDS
-
-
-
-pred_regions = [merge_annotations(ast.literal_eval(pred_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(pred_event_data))]
-gold_regions = [merge_annotations(ast.literal_eval(gold_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(gold_event_data))]
-
-# Merge small regions
-pred_regions = merge_small_regions(pred_regions, min_words=150)
-gold_regions = merge_small_regions(gold_regions, min_words=150)
-
-# Display
-for region_idx, (merged_pred, merged_gold) in enumerate(zip(pred_regions, gold_regions)):
-    display_region_with_buttons(merged_pred, merged_gold, '8436_ete', region_idx, gold_chunk_ids)
-    st.write("")
-    st.write("")
-
-
-# third doc
-
-st.header("Random document from inv. nr 11024 with EtE")
-
-st.subheader("Document from ?")
-st.markdown("### [See original doc here](https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/11024/file/NL-HaNA_1.04.02_11024_0185)")
-
-
-# load predicted events and entities
-with open('predictions_snellius/NL-HaNA_1.04.02_11024_0185.json') as f:
-    pred_event_data = f.readlines()
-
-with open('predictions_snellius/NL-HaNA_1.04.02_11024_0185.json') as f:
-    entity_data = f.readlines()
-
-# load fake gold file
-with open('predictions_snellius/NL-HaNA_1.04.02_11024_0185.json') as f:
-    gold_event_data = f.readlines()
-
-    
-
-# Use the manually configured gold chunk IDs
-gold_chunk_ids = GOLD_CHUNK_IDS
-
-
-
-pred_regions = [merge_annotations(ast.literal_eval(pred_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(pred_event_data))]
-gold_regions = [merge_annotations(ast.literal_eval(gold_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(gold_event_data))]
-
-# Merge small regions
-pred_regions = merge_small_regions(pred_regions, min_words=150)
-gold_regions = merge_small_regions(gold_regions, min_words=150)
-
-# Display
-for region_idx, (merged_pred, merged_gold) in enumerate(zip(pred_regions, gold_regions)):
-    display_region_with_buttons(merged_pred, merged_gold, '11024_ete', region_idx, gold_chunk_ids)
-    st.write("")
-    st.write("")
-
-
-
-# fourth doc
-
-st.header("Random document from inv. nr 1790 with EtE")
-
-st.subheader("Document from ? my guess is around 1710")
-st.markdown("### [See original doc here](https://www.nationaalarchief.nl/onderzoeken/archief/1.04.02/invnr/1790/file/NL-HaNA_1.04.02_1790_0033)")
+@st.cache_resource
+def get_prediction_watcher():
+    """Index PREDICTIONS_DIR once per server process and keep watching it for new files.
 
+    Documents are parsed when they are first opened and then shared by all
+    sessions as tuples and read-only mappings, so a session only holds its
+    own choices.
+    """
+    return PredictionWatcher(PREDICTIONS_DIR, min_words=150, snapshot=get_corpus_snapshot())
 
-# load predicted events and entities
-with open('predictions_snellius/NL-HaNA_1.04.02_1790_0033.json') as f:
-    pred_event_data = f.readlines()
 
-with open('predictions_snellius/NL-HaNA_1.04.02_1790_0033.json') as f:
-    entity_data = f.readlines()
+@st.cache_resource
+def get_prediction_store():
+    """Open the store written by import_predictions.py, if there is one."""
+    if not os.path.exists(os.path.join(PREDICTION_STORE, INVENTORIES_FILE)):
+        return None
+    return PredictionStore(PREDICTION_STORE)
 
-# load fake gold file
-with open('predictions_snellius/NL-HaNA_1.04.02_1790_0033.json') as f:
-    gold_event_data = f.readlines()
 
-    
+@st.cache_resource
+def get_prefetcher():
+    """One background loader thread per server process."""
+    return Prefetcher()
 
-# Use the manually configured gold chunk IDs
-gold_chunk_ids = GOLD_CHUNK_IDS
 
+@st.cache_resource(max_entries=64)
+def get_store_document(inventory, page):
+    """Build one page from the imported store, picking up a prefetch if there is one; recently opened pages stay cached."""
+    return get_prefetcher().get(('store', inventory, page), get_prediction_store().load_document, inventory, page, 150)
 
 
-pred_regions = [merge_annotations(ast.literal_eval(pred_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(pred_event_data))]
-gold_regions = [merge_annotations(ast.literal_eval(gold_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(gold_event_data))]
+autosave_writer = get_autosave_writer()
+trigger = rerun_trigger(st.session_state)
 
-# Merge small regions
-pred_regions = merge_small_regions(pred_regions, min_words=150)
-gold_regions = merge_small_regions(gold_regions, min_words=150)
 
-# Display
-for region_idx, (merged_pred, merged_gold) in enumerate(zip(pred_regions, gold_regions)):
-    display_region_with_buttons(merged_pred, merged_gold, '1790_ete', region_idx, gold_chunk_ids)
-    st.write("")
-    st.write("")
+def end_run(document=None):
+    """Log this run. Also called right before st.rerun() and st.stop(), which leave the script early."""
+    log_rerun(get_rerun_log(), timer, st.session_state, 'make_streamlit', document, trigger)
 
 
+# Restore choices from this session's autosave log, e.g. after the browser tab dropped
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = get_session_id(st.query_params)
+    restored = replay_log(st.session_state.session_id)
+    for name, value in restored.items():
+        st.session_state[name] = value
 
-# fourth doc
+# Initialize session state
+if 'annotation_choices' not in st.session_state:
+    st.session_state.annotation_choices = ChoiceStore()
 
-st.header("Random document from inv. nr 3598")
+if 'user_info_collected' not in st.session_state:
+    st.session_state.user_info_collected = False
 
-st.subheader("Document from ")
-st.markdown("### [See original doc here]()")
+if 'user_experience' not in st.session_state:
+    st.session_state.user_experience = None
 
+if 'user_translation' not in st.session_state:
+    st.session_state.user_translation = None
 
-# load predicted events and entities
-with open('predictions_snellius/NL-HaNA_1.04.02_3598_0055.json') as f:
-    pred_event_data = f.readlines()
+if 'user_feedback' not in st.session_state:
+    st.session_state.user_feedback = ""
+timer.stage('session')
 
-with open('predictions_snellius/NL-HaNA_1.04.02_3598_0055.json') as f:
-    entity_data = f.readlines()
+get_session_registry().touch(st.session_state.session_id, st.session_state)
 
-# load fake gold file
-with open('predictions_snellius/NL-HaNA_1.04.02_3598_0055.json') as f:
-    gold_event_data = f.readlines()
+PREDICTIONS_DIR = 'predictions_snellius'
+# Store written by import_predictions.py; its pages are listed in the navigator as well
+PREDICTION_STORE = 'prediction_store'
 
-    
+#Temporary setting with no gold annotations for within-team inspection of the model's output
+GOLD_CHUNK_IDS = {}
 
-# Use the manually configured gold chunk IDs
-gold_chunk_ids = GOLD_CHUNK_IDS
+# Repeated spans shown per page of the grouped view
+GROUPS_PER_PAGE = 20
 
 
+# Main app
 
-pred_regions = [merge_annotations(ast.literal_eval(pred_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(pred_event_data))]
-gold_regions = [merge_annotations(ast.literal_eval(gold_event_data[i]), ast.literal_eval(entity_data[i])) for i in range(len(gold_event_data))]
+def build_navigator_index(watched_files, store):
+    """Group the available documents by inventory number and page.
 
-# Merge small regions
-pred_regions = merge_small_regions(pred_regions, min_words=150)
-gold_regions = merge_small_regions(gold_regions, min_words=150)
+    Returns {inventory: {page: filename}}. Files in PREDICTIONS_DIR take
+    precedence over pages of the same scan in the imported store; store pages
+    get the file name they had before import. Files that do not follow the
+    NL-HaNA naming scheme are listed under 'other'.
+    """
+    index = {}
+    if store is not None:
+        for inventory in store.inventories():
+            for page in store.pages(inventory):
+                index.setdefault(inventory, {})[page] = f"NL-HaNA_1.04.02_{inventory}_{page}.json"
+    for filename in watched_files:
+        scan = parse_scan_name(filename)
+        inventory, page = scan if scan is not None else ('other', filename)
+        index.setdefault(inventory, {})[page] = filename
+    return index
+
+
+def load_selected_document(filename, inventory, page):
+    """Load one document from PREDICTIONS_DIR or, failing that, from the imported store.
+
+    Not wrapped in st.cache_resource: files are kept by the watcher, which
+    parses a file again only when it changes, and store pages by
+    get_store_document. The prefetcher only hands out a result once, so
+    whatever it returns has to be kept by one of those caches.
+    """
+    watcher = get_prediction_watcher()
+    if filename in watcher.files():
+        try:
+            return get_prefetcher().get(('file', filename), watcher.get, filename)
+        except KeyError:
+            # Removed since the navigator was built; the store may have the page as well
+            if get_prediction_store() is None:
+                raise
+    return get_store_document(inventory, page)
+
+
+def prefetch_document(filename, inventory, page):
+    """Start loading a document in the background, so that opening it later is a cache hit."""
+    watcher = get_prediction_watcher()
+    if filename in watcher.files():
+        get_prefetcher().prefetch(('file', filename), watcher.get, filename)
+    elif get_prediction_store() is not None:
+        get_prefetcher().prefetch(('store', inventory, page), get_prediction_store().load_document, inventory, page, 150)
+
+
+def find_document(navigator_index, file_id):
+    """Load the document with a file id, for the span text and label of the downloaded choices."""
+    for inventory, pages in navigator_index.items():
+        for page, filename in pages.items():
+            if get_document_info(filename)['file_id'] == file_id:
+                return load_selected_document(filename, inventory, page)
+    raise KeyError(file_id)
+
+
+def next_page(navigator_index, inventories, inventory, page):
+    """The (inventory, page) after the given one in navigator order, or None at the end."""
+    pages = sorted(navigator_index[inventory])
+    position = pages.index(page) + 1
+    if position < len(pages):
+        return inventory, pages[position]
+    position = inventories.index(inventory) + 1
+    if position < len(inventories):
+        return inventories[position], sorted(navigator_index[inventories[position]])[0]
+    return None
+
+
+@st.cache_resource(max_entries=8)
+def get_span_index(documents):
+    """Group the spans of some documents by normalized (text, label) once per server process.
+
+    documents is a tuple of (file_id, filename, inventory, page); documents that do not line up
+    or were removed are left out.
+    """
+    index = SpanIndex()
+    for file_id, filename, inventory, page in documents:
+        try:
+            index.add_document(file_id, load_selected_document(filename, inventory, page), GOLD_CHUNK_IDS)
+        except (AlignmentError, KeyError):
+            continue
+    return index
+
+
+def show_span_groups(span_index, headers):
+    """Review repeated spans a group at a time, with one decision for all occurrences or, expanded, one per occurrence."""
+    from annotated_text import annotated_text
+
+    groups = span_index.groups()
+    if not groups:
+        st.info("No span occurs more than once in these documents.")
+        return
+
+    store = st.session_state.annotation_choices
+    start = st.selectbox(
+        "Groups",
+        range(0, len(groups), GROUPS_PER_PAGE),
+        format_func=lambda start: f"{start + 1}–{min(start + GROUPS_PER_PAGE, len(groups))} of {len(groups)}",
+        key='group_page'
+    )
+    for (normalized, label), occurrences in groups[start:start + GROUPS_PER_PAGE]:
+        key = f"{label}_{normalized}"
+
+        cols = st.columns([0.45, 0.1, 0.1, 0.1, 0.25])
+        with cols[0]:
+            st.markdown(f"**{occurrences[0][4]}** `({label})` × {len(occurrences)}")
+            st.caption(f"in {len({occurrence[0] for occurrence in occurrences})} document(s)")
+        with cols[1]:
+            if st.button("✓", key=f"group_correct_{key}", help="Mark every occurrence as useful"):
+                set_choices(occurrences, 'useful')
+        with cols[2]:
+            if st.button("✗", key=f"group_wrong_{key}", help="Mark every occurrence as misleading"):
+                set_choices(occurrences, 'misleading')
+        with cols[3]:
+            if st.button("Clear", key=f"group_clear_{key}", help="Remove your choices for every occurrence"):
+                set_choices(occurrences, None)
+        # Filled in below, so that overrides of single occurrences are counted in this run
+        status = cols[4].empty()
+
+        if st.checkbox("Show occurrences", key=f"expand_{key}"):
+            for occurrence in occurrences:
+                file_id, region_idx, chunk_idx, ann_idx, text, _, data_source = occurrence
+                st.caption(f"{headers.get(file_id, file_id)}, region {region_idx + 1}, passage {chunk_idx + 1}")
+                annotated_text(*span_index.chunk(occurrence)['annotated_text'])
 
-# Display
-for region_idx, (merged_pred, merged_gold) in enumerate(zip(pred_regions, gold_regions)):
-    display_region_with_buttons(merged_pred, merged_gold, '3598_ete', region_idx, gold_chunk_ids)
-    st.write("")
-    st.write("")
+                cols = st.columns([0.6, 0.1, 0.1, 0.2])
+                occurrence_key = f"{file_id}_{region_idx}_{chunk_idx}_{ann_idx}"
+                with cols[0]:
+                    st.markdown(f"**{text}** `({label})`")
+                with cols[1]:
+                    if st.button("✓", key=f"correct_{occurrence_key}"):
+                        record_choice(file_id, region_idx, chunk_idx, ann_idx, 'useful', data_source)
+                with cols[2]:
+                    if st.button("✗", key=f"wrong_{occurrence_key}"):
+                        record_choice(file_id, region_idx, chunk_idx, ann_idx, 'misleading', data_source)
+                with cols[3]:
+                    choice = store.get_choice(file_id, region_idx, chunk_idx, ann_idx)
+                    if choice is not None:
+                        st.markdown("✅ Useful" if choice == 'useful' else "❌ Misleading")
 
+        counts = group_choices(occurrences, store)
+        status.markdown(f"✅ {counts['useful']} ❌ {counts['misleading']} · {counts[None]} open")
+        st.markdown("---")
+
+
+# Admin-only memory page, opened with ?admin=<ADMIN_TOKEN>
+if is_admin(st.query_params):
+    show_memory_page(get_session_registry(), get_memory_tracer(), {
+        'corpus snapshot': get_corpus_snapshot(),
+        'prediction watcher': get_prediction_watcher(),
+        'prediction store': get_prediction_store(),
+        'prefetcher': get_prefetcher(),
+        'autosave writer': autosave_writer,
+    })
+    end_run()
+    st.stop()
+
+
+# Only the index is read on startup; new files in PREDICTIONS_DIR show up on the next rerun
+navigator_index = build_navigator_index(get_prediction_watcher().files(), get_prediction_store())
+if get_prediction_watcher().scan_error:
+    st.sidebar.warning(f"New documents may be missing. {get_prediction_watcher().scan_error}")
+show_autosave_error()
+
+if not navigator_index:
+    st.info("No documents found.")
+    end_run()
+    st.stop()
+
+# Open the documents we know something about first
+watched_names = {strip_compression(name): name for name in get_prediction_watcher().files()}
+first_filename = next((watched_names[name] for name in DOCUMENT_INFO if name in watched_names), None)
+first_scan = parse_scan_name(first_filename) if first_filename else None
+
+st.sidebar.header("Documents")
+inventories = sorted(navigator_index, key=lambda inv: (not inv.isdigit(), int(inv) if inv.isdigit() else 0, inv))
+selected_inventory = st.sidebar.selectbox(
+    "Inventory number",
+    inventories,
+    index=inventories.index(first_scan[0]) if first_scan else 0,
+    format_func=lambda inv: f"inv. nr {inv}" if inv.isdigit() else inv,
+    key='inventory'
+)
+pages = sorted(navigator_index[selected_inventory])
+selected_page = st.sidebar.selectbox(
+    "Page",
+    pages,
+    index=pages.index(first_scan[1]) if first_scan and first_scan[0] == selected_inventory else 0
+)
 
+filename = navigator_index[selected_inventory][selected_page]
+info = get_document_info(filename)
+timer.stage('navigator')
+
+view = st.sidebar.radio("View", ["Document", "Repeated spans"], key='view',
+                        help="Repeated spans groups identical spans with the same label, so that a group "
+                             "can be judged once for all of its occurrences.")
+
+if view == "Repeated spans":
+    group_scope = st.sidebar.radio("Group spans of", ["This inventory", "All documents"], key='group_scope')
+    scope = [selected_inventory] if group_scope == "This inventory" else inventories
+    documents = tuple((get_document_info(name)['file_id'], name, inventory, page)
+                      for inventory in scope for page, name in sorted(navigator_index[inventory].items()))
+    st.header("Repeated spans" + (f" in inv. nr {selected_inventory}" if group_scope == "This inventory" else ""))
+    span_index = get_span_index(documents)
+    timer.stage('load')
+    show_span_groups(span_index, {file_id: get_document_info(name)['header'] for file_id, name, _, _ in documents})
+else:
+    # Use the manually configured gold chunk IDs
+    gold_chunk_ids = GOLD_CHUNK_IDS
+
+    st.header(info['header'])
+
+    if info['subheader']:
+        st.subheader(info['subheader'])
+    st.markdown(f"### [See original doc here]({info['link']})")
+
+    try:
+        document = load_selected_document(filename, selected_inventory, selected_page)
+    except AlignmentError as e:
+        st.error("The words and labels of this document do not line up, so it cannot be shown.")
+        st.json(e.report, expanded=False)
+        end_run(info['file_id'])
+        st.stop()
+    except KeyError:
+        st.warning("This document was removed from the server. Please pick another one.")
+        end_run(info['file_id'])
+        st.stop()
+    timer.stage('load')
+
+    load_error = get_prediction_watcher().errors().get(filename)
+    if load_error:
+        st.warning(f"This file changed, but its new version could not be read, so the previous version is shown "
+                   f"({load_error}).")
+
+    # Load the next page while this one is being reviewed
+    following = next_page(navigator_index, inventories, selected_inventory, selected_page)
+    if following is not None:
+        prefetch_document(navigator_index[following[0]][following[1]], *following)
+
+    # Display
+    for region_idx, region in enumerate(document):
+        display_region_with_buttons(region, info['file_id'], region_idx, gold_chunk_ids)
+        st.write("")
+        st.write("")
+
+timer.stage('render')
 
 # Feedback section
 st.divider()
@@ -620,8 +402,9 @@ feedback = st.text_area(
     key="feedback_input"
 )
 
-if st.button("Save Feedback"):
+if st.button("Save Feedback", key="save_feedback"):
     st.session_state.user_feedback = feedback
+    autosave({'type': 'feedback', 'value': feedback})
     st.success("Feedback saved!")
 
 # Download section
@@ -629,8 +412,10 @@ st.divider()
 st.subheader("Download Your Choices")
 
 if st.session_state.annotation_choices:
-    df = pd.DataFrame.from_dict(st.session_state.annotation_choices, orient='index')
-    
+    df = st.session_state.annotation_choices.to_frame(lambda file_id: find_document(navigator_index, file_id))
+    # Tells participants apart when their downloads are aggregated, also without the intake form
+    df.insert(0, 'session_id', st.session_state.session_id)
+
     # Add user information to all rows
     df['user_experience'] = st.session_state.user_experience
     df['user_translation'] = st.session_state.user_translation
@@ -656,10 +441,33 @@ if st.session_state.annotation_choices:
         file_name="annotation_choices.csv",
         mime="text/csv"
     )
+    st.download_button(
+        label="Download Parquet",
+        # Written when the button is clicked rather than on every rerun
+        data=lambda: df.to_parquet(index=False),
+        file_name="annotation_choices.parquet",
+        mime="application/vnd.apache.parquet"
+    )
 
-    if st.button("Reset All Choices"):
-        st.session_state.annotation_choices = {}
-        st.session_state.chunk_sources = {}
+    if st.button("Reset All Choices", key="reset_choices"):
+        st.session_state.annotation_choices.clear()
+        autosave({'type': 'reset'})
+        end_run(info['file_id'])
         st.rerun()
 else:
     st.info("No annotations have been marked yet.")
+
+
+# Cold start report: how long the first run in this server process took
+boot_report = get_boot_report()
+if 'imports' not in boot_report:
+    boot_report['imports'] = imports_done - script_start
+    boot_report['first page'] = time.perf_counter() - script_start
+with st.sidebar.expander("Cold start"):
+    for stage, seconds in boot_report.items():
+        st.caption(f"{stage}: {seconds * 1000:.0f} ms")
+    for note in get_boot_notes():
+        st.caption(note)
+
+timer.stage('footer')
+end_run(info['file_id'])
@@ -1,428 +1,223 @@
+import time
+script_start = time.perf_counter()
+
 import streamlit as st
-from annotated_text import annotated_text
-import ast
-import pandas as pd
+from autosave import get_session_id, replay_log
+from choice_store import ChoiceStore
+from corpus import AlignmentError, file_digest, load_document, read_jsonl
+from memory_profile import MemoryTracer, SessionRegistry, is_admin, show_memory_page
+from prefetch import Prefetcher
+from rerun_log import RerunLog, RerunTimer, log_rerun, rerun_trigger
+from review_ui import autosave, display_region_with_buttons, get_autosave_writer, show_autosave_error
+from scheduler import ReviewerSlots, build_schedule
+from shared_corpus import open_corpus_snapshot
+from snapshot import document_key
 
-# Initialize session state
-if 'annotation_choices' not in st.session_state:
-    st.session_state.annotation_choices = {}
+imports_done = time.perf_counter()
+timer = RerunTimer(script_start)
+timer.stage('imports')
 
-if 'chunk_sources' not in st.session_state:
-    st.session_state.chunk_sources = {}
 
-if 'user_info_collected' not in st.session_state:
-    st.session_state.user_info_collected = False
+@st.cache_resource
+def get_boot_report():
+    """Timings of the first run of this script in the server process, in seconds."""
+    return {}
 
-if 'user_experience' not in st.session_state:
-    st.session_state.user_experience = None
 
-if 'user_translation' not in st.session_state:
-    st.session_state.user_translation = None
-
-if 'user_feedback' not in st.session_state:
-    st.session_state.user_feedback = ""
+@st.cache_resource
+def get_boot_notes():
+    """Messages about the first run, e.g. that an outdated snapshot was ignored."""
+    return []
 
-# Define color schemes with lighter blues
-ENTITY_COLORS = {
-    'LOC_NAME': '#4A90E2',  # Medium blue
-    'LOC_ADJ': '#7FB3D5',  # Light blue
-    'PER_NAME': '#9FCDFF',  # Powder blue
-    'PER_ATTR': '#5B9BD5',  # Sky blue
-    'PRF': '#89CFF0',  # Baby blue
-    'CMTY_QUANT': '#6BB6FF',  # Bright blue
-    'CMTY_NAME': '#A8D5FF',  # Soft blue
-    'DOC': '#1E90FF',  # Dodger blue
-    'DATE': '#87CEEB',  # Sky blue light
-    'SHIP_TYPE': '#C2DFFF',  # Alice blue
-    'ORG': '#B0D7FF',  # Baby blue
-    'STATUS': '#AFEEEE'  # Pale Turquoise
-}
 
-EVENT_COLORS = {
-    'event1': '#FF8C00',  # Dark orange
-    'event2': '#FFA500',  # Orange
-    'event3': '#FFB347',  # Light orange
-    'event4': '#FF7F50',  # Coral
-    'event5': '#FF6347',  # Tomato
-}
+@st.cache_resource
+def get_corpus_snapshot():
+    """Preprocessed documents written by shared_corpus.py or snapshot.py at build time (empty if missing or outdated).
 
-# MANUAL GOLD CHUNK SELECTION
-# Add chunk IDs here that you want to display as gold data
-# Format: "region_idx_chunk_idx" (e.g., "0_0" for region 0, chunk 0)
-GOLD_CHUNK_IDS = {
-    "7_1",
-    "7_2",
-    "8_1"
-}
+    A shared corpus is memory-mapped, so all server processes share one copy of it.
+    """
+    start = time.perf_counter()
+    entries = open_corpus_snapshot(notes=get_boot_notes())
+    get_boot_report()['snapshot restore'] = time.perf_counter() - start
+    return entries
 
-#"5_1"
 
-#Temporary setting with no gold annotations for within-team inspection of the model's output
-GOLD_CHUNK_IDS = {}
+@st.cache_resource
+def get_session_registry():
+    """The state of every session of this server process, for the admin memory page."""
+    return SessionRegistry()
 
-def hex_to_rgba(hex_color, opacity=1.0):
-    """Convert hex color to rgba with specified opacity."""
-    hex_color = hex_color.lstrip('#')
-    r = int(hex_color[0:2], 16)
-    g = int(hex_color[2:4], 16)
-    b = int(hex_color[4:6], 16)
-    return f'rgba({r}, {g}, {b}, {opacity})'
-
-
-def get_color_for_label(label):
-    """Get the appropriate color for a label."""
-    if label in ENTITY_COLORS:
-        color = ENTITY_COLORS[label]
-        return hex_to_rgba(color, 0.30)  # Entities always 70% transparent (25% opacity)
-    elif label in EVENT_COLORS:
-        return EVENT_COLORS[label]
-    else:
-        # Default colors if not found
-        if is_entity_label(label):
-            color = '#B3D9FF'  # Default light blue
-            return hex_to_rgba(color, 0.25)  # Entities always transparent
-        else:
-            return '#FFD699'  # Default light orange
-
-def is_entity_label(label):
-    """Check if a label is an entity type."""
-    entity_labels = ['LOC_NAME', 'PER_NAME', 'PER_ATTR', 'PRF', 'CMTY_QUANT',
-                     'CMTY_NAME', 'DOC', 'DATE', 'SHIP_TYPE', 'LOC_ADJ', 'ORG', 'STATUS', 'SHIP', 'ETH_REL']
-    return any(entity in label for entity in entity_labels)
-
-
-def count_event_annotations(data):
-    """Count the number of event annotations in a data structure."""
-    events = data['events']
-    count = 0
-    for event in events:
-        if event.startswith('B-') and not is_entity_label(event[2:]):
-            count += 1
-    return count
-
-def merge_motion_events(data):
-    """Merge consecutive motion event annotations into a single span.
-    
-    If two consecutive tokens are annotated with different events from the motion list,
-    they are merged into one span using the label of the first token.
-    """
-    motion_events = ["Translocation", "Transportation", "Voyage", "Leaving", "Arriving", "BeingAtAPlace"]
-    
-    words = data['words']
-    events = data['events'].copy()  # Make a copy to avoid modifying original
-    
-    i = 0
-    while i < len(events):
-        current_event = events[i]
-        
-        # Check if current token has a motion event (B- or I-)
-        if current_event.startswith('B-'):
-            current_label = current_event[2:]
-            if current_label in motion_events:
-                # Look ahead for consecutive motion events
-                j = i + 1
-                while j < len(events):
-                    next_event = events[j]
-                    
-                    # If next token is also a motion event (B- prefix)
-                    if next_event.startswith('B-'):
-                        next_label = next_event[2:]
-                        if next_label in motion_events:
-                            # Change it to I- with the current label
-                            events[j] = f'I-{current_label}'
-                            j += 1
-                        else:
-                            break  # Not a motion event, stop merging
-                    elif next_event.startswith('I-'):
-                        # Already part of an annotation, continue
-                        next_label = next_event[2:]
-                        if next_label in motion_events:
-                            # Update to current label
-                            events[j] = f'I-{current_label}'
-                            j += 1
-                        else:
-                            break
-                    else:
-                        # 'O' tag, stop merging
-                        break
-                
-                i = j  # Skip to the end of merged span
-            else:
-                i += 1
-        else:
-            i += 1
-    
-    return {
-        'words': words,
-        'events': events
-    }
-
-
-def merge_annotations(event_data, entity_data):
-    """Merge event and entity annotations into a single data structure."""
-    words = event_data['words']
-    events = event_data['events']
-    entities = entity_data['entities']
-
-    combined = []
-    for event, entity in zip(events, entities):
-        if event != 'O':
-            combined.append(event)
-        else:
-            combined.append(entity)
-
-    merged_data = {
-        'words': words,
-        'events': combined
-    }
-    
-    # Apply motion event merging
-    merged_data = merge_motion_events(merged_data)
-    
-    return merged_data
 
+@st.cache_resource
+def get_memory_tracer():
+    return MemoryTracer()
 
-def convert_to_annotated_text(data):
-    """Convert data to annotated_text format with color coding."""
-    words = data['words']
-    events = data['events']
 
-    result = []
-    current_text = []
-    current_event = None
-    current_event_words = []
+@st.cache_resource
+def get_rerun_log():
+    """One rolling rerun timing log (and writer thread) per server process."""
+    return RerunLog()
 
-    for word, event in zip(words, events):
-        if event.startswith('B-'):
-            if current_text:
-                result.append(' '.join(current_text) + ' ')
-                current_text = []
 
-            if current_event_words and current_event:
-                label = current_event
-                color = get_color_for_label(label)
-                result.append((' '.join(current_event_words) + ' ', label, color))
-                current_event_words = []
+@st.cache_resource
+def get_prefetcher():
+    """One background loader thread per server process."""
+    return Prefetcher()
 
-            current_event = event[2:]
-            current_event_words = [word]
 
-        elif event.startswith('I-'):
-            current_event_words.append(word)
+def read_document(pred_path, entity_path, gold_path, min_words, snapshot):
+    """Take a document from the snapshot if its files did not change, or parse, merge and chunk it."""
+    # Import the renderer here too, so a prefetch also takes it off the first render
+    import annotated_text  # noqa: F401
 
-        else:
-            if current_event_words and current_event:
-                label = current_event
-                color = get_color_for_label(label)
-                result.append((' '.join(current_event_words) + ' ', label, color))
-                current_event_words = []
-                current_event = None
+    entry = snapshot.get(document_key(pred_path, entity_path, gold_path, min_words))
+    if entry is not None and entry[0] == file_digest(pred_path, entity_path, gold_path):
+        return entry[1]
+    return load_document(pred_path, entity_path, gold_path, min_words=min_words)
 
-            current_text.append(word)
 
-    if current_text:
-        result.append(' '.join(current_text))
-    if current_event_words and current_event:
-        label = current_event
-        color = get_color_for_label(label)
-        result.append((' '.join(current_event_words) + ' ', label, color))
+def prefetch_document(pred_path, entity_path, gold_path, min_words=None):
+    """Start loading a document in the background, e.g. while the participant fills in the intake form."""
+    get_prefetcher().prefetch(document_key(pred_path, entity_path, gold_path, min_words), read_document,
+                              pred_path, entity_path, gold_path, min_words, get_corpus_snapshot())
 
-    return result
 
+@st.cache_resource
+def get_document(pred_path, entity_path, gold_path, min_words=None):
+    """Parse, merge and chunk a document once per server process, picking up a prefetch if there is one.
 
-def extract_annotations(data, annotation_type='event'):
-    """Extract annotations. Can filter by type (event vs entity)."""
-    words = data['words']
-    events = data['events']
+    The result is made of tuples and read-only mappings and is shared by all
+    sessions, so a session only holds its own choices.
+    """
+    return get_prefetcher().get(document_key(pred_path, entity_path, gold_path, min_words), read_document,
+                                pred_path, entity_path, gold_path, min_words, get_corpus_snapshot())
 
-    annotations = []
-    current_event = None
-    current_words = []
 
-    for word, event in zip(words, events):
-        if event.startswith('B-'):
-            if current_words and current_event:
-                label_type = current_event
-                is_entity = is_entity_label(label_type)
-                is_event = not is_entity
+@st.cache_resource
+def get_reviewer_slots(_document, file_id, n_reviewers, overlap):
+    """Split a document over reviewers once per server process (file_id keys the cache)."""
+    return ReviewerSlots(build_schedule(_document, n_reviewers, overlap=overlap))
 
-                if (annotation_type == 'entity' and is_entity) or \
-                        (annotation_type == 'event' and is_event) or \
-                        (annotation_type == 'all'):
-                    annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
 
-            current_event = event[2:]
-            current_words = [word]
+@st.cache_resource
+def get_review_queue(_document, file_id, checkpoint_paths):
+    """Rank the chunks of a document by checkpoint disagreement once per server process."""
+    # numpy is only needed for this review order
+    from disagreement import build_review_queue
 
-        elif event.startswith('I-'):
-            current_words.append(word)
+    return build_review_queue(_document, [read_jsonl(path) for path in checkpoint_paths])
 
-        else:
-            if current_words and current_event:
-                label_type = current_event
-                is_entity = is_entity_label(label_type)
-                is_event = not is_entity
 
-                if (annotation_type == 'entity' and is_entity) or \
-                        (annotation_type == 'event' and is_event) or \
-                        (annotation_type == 'all'):
-                    annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
-                current_words = []
-                current_event = None
+autosave_writer = get_autosave_writer()
+trigger = rerun_trigger(st.session_state)
 
-    if current_words and current_event:
-        label_type = current_event
-        is_entity = is_entity_label(label_type)
-        is_event = not is_entity
 
-        if (annotation_type == 'entity' and is_entity) or \
-                (annotation_type == 'event' and is_event) or \
-                (annotation_type == 'all'):
-            annotations.append((' '.join(current_words), current_event, 'entity' if is_entity else 'event'))
+def end_run(document=None):
+    """Log this run. Also called right before st.rerun() and st.stop(), which leave the script early."""
+    log_rerun(get_rerun_log(), timer, st.session_state, 'make_workshop_streamlit', document, trigger)
 
-    return annotations
 
+# Restore choices from this session's autosave log, e.g. after the browser tab dropped
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = get_session_id(st.query_params)
+    restored = replay_log(st.session_state.session_id)
+    for name, value in restored.items():
+        st.session_state[name] = value
+    if 'user_translation' in restored:
+        st.session_state.user_info_collected = True
 
-def split_data_into_chunks(data, max_words=150):
-    """Split data into roughly equal chunks, each up to max_words."""
-    words = data['words']
-    events = data['events']
+# Initialize session state
+if 'annotation_choices' not in st.session_state:
+    st.session_state.annotation_choices = ChoiceStore()
 
-    total_words = len(words)
+if 'user_info_collected' not in st.session_state:
+    st.session_state.user_info_collected = False
 
-    if total_words <= max_words:
-        return [data]
+if 'user_experience' not in st.session_state:
+    st.session_state.user_experience = None
 
-    num_chunks = (total_words + max_words - 1) // max_words
-    chunk_size = total_words // num_chunks
-    remainder = total_words % num_chunks
+if 'user_translation' not in st.session_state:
+    st.session_state.user_translation = None
 
-    chunks = []
-    start_idx = 0
+if 'user_feedback' not in st.session_state:
+    st.session_state.user_feedback = ""
 
-    for i in range(num_chunks):
-        extra = 1 if i < remainder else 0
-        end_idx = start_idx + chunk_size + extra
+if 'queue_position' not in st.session_state:
+    st.session_state.queue_position = 0
+timer.stage('session')
 
-        chunk = {
-            'words': words[start_idx:end_idx],
-            'events': events[start_idx:end_idx]
-        }
-        chunks.append(chunk)
-        start_idx = end_idx
+get_session_registry().touch(st.session_state.session_id, st.session_state)
 
-    return chunks
+# The (prediction, entity, gold) files of the document under review
+DOCUMENT_FILES = ('predictions/3604_mixed_experts.json',
+                  'gold/curated_entities_3604/p_80-ner-event-preanno_NL-HaNA_1.04.02_3604_0270-0276 - 1782 -.json',
+                  'gold/3604.json')
 
-def merge_small_regions(regions, min_words=150):
-    """Merge consecutive regions with fewer than min_words tokens into one region."""
-    merged = []
-    buffer = None
+# MANUAL GOLD CHUNK SELECTION
+# Add chunk IDs here that you want to display as gold data
+# Format: "region_idx_chunk_idx" (e.g., "0_0" for region 0, chunk 0)
+GOLD_CHUNK_IDS = {
+    "7_1",
+    "7_2",
+    "8_1"
+}
 
-    for region in regions:
-        if buffer is None:
-            buffer = region
-        else:
-            combined_len = len(buffer['words']) + len(region['words'])
-            if len(buffer['words']) < min_words or combined_len <= min_words:
-                # Merge region into buffer
-                buffer = {
-                    'words': buffer['words'] + region['words'],
-                    'events': buffer['events'] + region['events']
-                }
-            else:
-                merged.append(buffer)
-                buffer = region
+#"5_1"
 
-    if buffer is not None:
-        merged.append(buffer)
+#Temporary setting with no gold annotations for within-team inspection of the model's output
+GOLD_CHUNK_IDS = {}
 
-    return merged
+# REVIEWER ASSIGNMENT
+# The chunks of the document are split over this many reviewer slots, balanced by event count.
+# Participants are assigned to slots in turn; set to 1 to let everyone review the whole document.
+REVIEW_SLOTS = 4
+# Fraction of chunks that is also given to a second slot, to measure agreement
+REVIEW_OVERLAP = 0.2
+
+# Model checkpoints compared for the "most contested first" review order
+CHECKPOINT_FILES = (
+    'predictions/3604_5ep.json',
+    'predictions/3604_10ep.json',
+    'predictions/3604_20ep.json',
+    'predictions/3604_40ep.json',
+    'predictions/3604_mixed_experts.json',
+)
 
 
-def display_region_with_buttons(pred_data, gold_data, file_id, region_idx, gold_chunk_ids):
-    """Display annotated text and buttons for each annotation.
-    
-    Args:
-        pred_data: Prediction annotation data
-        gold_data: Gold annotation data
-        file_id: Identifier for the file
-        region_idx: Index of the current region
-        gold_chunk_ids: Set of chunk IDs that should display gold data
-        transparent_entities: Whether to make entity labels transparent
-    """
-    pred_chunks = split_data_into_chunks(pred_data, max_words=150)
-    gold_chunks = split_data_into_chunks(gold_data, max_words=150)
-
-    for chunk_idx in range(len(pred_chunks)):
-        chunk_id = f"{region_idx}_{chunk_idx}"
-        
-        # Determine if this chunk should use gold or prediction data
-        if chunk_id in gold_chunk_ids:
-            chunk = gold_chunks[chunk_idx]
-            data_source = 'gold'
-        else:
-            chunk = pred_chunks[chunk_idx]
-            data_source = 'prediction'
-        
-        # Store the data source for this chunk
-        st.session_state.chunk_sources[chunk_id] = data_source
-        
-        annotated_version = convert_to_annotated_text(chunk)
-        annotated_text(*annotated_version)
-
-        annotations = extract_annotations(chunk, annotation_type='event')
-
-        if annotations:
-            st.markdown("---")
-            for ann_idx, (text, label, ann_type) in enumerate(annotations):
-                key = f"{file_id}_{region_idx}_{chunk_idx}_{ann_idx}"
-
-                cols = st.columns([0.6, 0.1, 0.1, 0.2])
-
-                with cols[0]:
-                    st.markdown(f"**{text}** `({label})`")
-
-                with cols[1]:
-                    if st.button("✓", key=f"correct_{key}"):
-                        st.session_state.annotation_choices[key] = {
-                            'file': file_id,
-                            'region': region_idx,
-                            'chunk': chunk_idx,
-                            'text': text,
-                            'label': label,
-                            'choice': 'useful',
-                            'data_source': data_source
-                        }
-
-                with cols[2]:
-                    if st.button("✗", key=f"wrong_{key}"):
-                        st.session_state.annotation_choices[key] = {
-                            'file': file_id,
-                            'region': region_idx,
-                            'chunk': chunk_idx,
-                            'text': text,
-                            'label': label,
-                            'choice': 'misleading',
-                            'data_source': data_source
-                        }
-
-                with cols[3]:
-                    if key in st.session_state.annotation_choices:
-                        choice = st.session_state.annotation_choices[key]['choice']
-                        st.markdown("✅ Useful" if choice == 'useful' else "❌ Misleading")
-
-        if chunk_idx < len(pred_chunks) - 1:
-            st.markdown("---")
+# Admin-only memory page, opened with ?admin=<ADMIN_TOKEN>
+if is_admin(st.query_params):
+    show_memory_page(get_session_registry(), get_memory_tracer(), {
+        'corpus snapshot': get_corpus_snapshot(),
+        'document': get_document(*DOCUMENT_FILES),
+        'prefetcher': get_prefetcher(),
+        'autosave writer': autosave_writer,
+    })
+    end_run()
+    st.stop()
 
 
 # Main app
 
 st.header("Missive sent from Batavia in 1782 (inv. nr. 3604)")
+show_autosave_error()
 
 
 
+# Cold start report: how long the first run in this server process took (the intake form is the first page)
+boot_report = get_boot_report()
+if 'imports' not in boot_report:
+    boot_report['imports'] = imports_done - script_start
+    boot_report['first page'] = time.perf_counter() - script_start
+with st.sidebar.expander("Cold start"):
+    for stage, seconds in boot_report.items():
+        st.caption(f"{stage}: {seconds * 1000:.0f} ms")
+    for note in get_boot_notes():
+        st.caption(note)
+
 # User information collection
 if not st.session_state.user_info_collected:
+    # Load the document while the participant is still typing; the first page after submitting then finds it ready
+    prefetch_document(*DOCUMENT_FILES)
     st.subheader("Before we begin...")
     
     # Experience question
@@ -442,47 +237,86 @@ if not st.session_state.user_info_collected:
     st.info("Wat er tegen de opere Vaart, die niet Voor half Oktober gerekend mag Worden, op Mallabaar Voorvallen kan, mogen wij niet gissen, en zoo Wij deeze zeshonderd lasten Mallabaers rijst kreegen, bij de geeischte Javasche, zoude onze Voorraad maar maatig zijn, Wijl de Fransche Vloot zeken om rijst zal vraagen, en de gemeente geen aanvoer uit Boengaale hoopen kan.")
     translation = st.text_area("Your translation:", height=100)
     
-    if st.button("Submit and Continue"):
+    if st.button("Submit and Continue", key="submit_intake"):
         if translation.strip():  # Check that translation is not empty
             st.session_state.user_experience = experience
             st.session_state.user_translation = translation
             st.session_state.user_info_collected = True
+            autosave({'type': 'user', 'experience': experience, 'translation': translation})
+            timer.stage('intake')
+            end_run()
             st.rerun()
         else:
             st.warning("Please provide a translation before continuing.")
-    
+
+    timer.stage('intake')
+    end_run()
     st.stop()  # Stop here until user submits
 
 st.subheader("Predictions of Mixed Experts model")
 
 # Load both prediction and gold data
-with open('predictions/3604_mixed_experts.json') as f:
-    pred_event_data = f.readlines()
-
-with open('gold/3604.json') as f:
-    gold_event_data = f.readlines()
-
-with open('gold/curated_entities_3604/p_80-ner-event-preanno_NL-HaNA_1.04.02_3604_0270-0276 - 1782 -.json') as f:
-    entity_data = f.readlines()
+try:
+    document = get_document(*DOCUMENT_FILES)
+except AlignmentError as e:
+    st.error("The prediction, entity and gold files of this document do not line up, so it cannot be shown.")
+    st.json(e.report, expanded=False)
+    end_run('3604_mixed_experts')
+    st.stop()
+timer.stage('load')
 
 
 # Use the manually configured gold chunk IDs
 gold_chunk_ids = GOLD_CHUNK_IDS
 
 
-# Display regions with mixed gold/prediction chunks
-for region_idx in range(len(pred_event_data)):
-    pred_event_parsed = ast.literal_eval(pred_event_data[region_idx])
-    gold_event_parsed = ast.literal_eval(gold_event_data[region_idx])
-    entity_parsed = ast.literal_eval(entity_data[region_idx])
+# Assign this participant a share of the document
+reviewer_slots = get_reviewer_slots(document, '3604_mixed_experts', REVIEW_SLOTS, REVIEW_OVERLAP)
+if 'reviewer_slot' not in st.session_state:
+    st.session_state.reviewer_slot = reviewer_slots.next_slot()
+    autosave({'type': 'assignment', 'slot': st.session_state.reviewer_slot})
+assigned_chunks = reviewer_slots.assignment(st.session_state.reviewer_slot)
+
+if REVIEW_SLOTS > 1:
+    st.info(f"To share the work, you have been assigned {len(assigned_chunks)} passages of this document.")
 
-    merged_pred = merge_annotations(pred_event_parsed, entity_parsed)
-    merged_gold = merge_annotations(gold_event_parsed, entity_parsed)
+review_order = st.sidebar.radio("Review order", ["Document order", "Most contested first"],
+                                help="Most contested first shows one passage at a time, starting with the passages "
+                                     "on which our model checkpoints disagree most.",
+                                key="review_order")
 
-    display_region_with_buttons(merged_pred, merged_gold, '3604_mixed_experts', region_idx, gold_chunk_ids)
-    st.write("")
-    st.write("")
+if review_order == "Most contested first":
+    _, contested_chunks = get_review_queue(document, '3604_mixed_experts', CHECKPOINT_FILES)
+    queue = [chunk for chunk in contested_chunks if chunk in assigned_chunks]
+    position = st.session_state.queue_position
 
+    if position < len(queue):
+        region_idx, chunk_idx = queue[position]
+        st.caption(f"Passage {position + 1} of {len(queue)}")
+        display_region_with_buttons(document[region_idx], '3604_mixed_experts', region_idx, gold_chunk_ids,
+                                    {(region_idx, chunk_idx)})
+
+        if st.button("Next passage", key="next_passage"):
+            st.session_state.queue_position += 1
+            end_run('3604_mixed_experts')
+            st.rerun()
+    else:
+        st.success("You have gone through all of your contested passages.")
+        if st.button("Start over", key="start_over"):
+            st.session_state.queue_position = 0
+            end_run('3604_mixed_experts')
+            st.rerun()
+else:
+    # Display regions with mixed gold/prediction chunks
+    for region_idx, region in enumerate(document):
+        if not any((region_idx, chunk_idx) in assigned_chunks for chunk_idx in range(len(region['prediction']))):
+            continue
+        display_region_with_buttons(region, '3604_mixed_experts', region_idx, gold_chunk_ids, assigned_chunks)
+        st.write("")
+        st.write("")
+
+
+timer.stage('render')
 
 # Feedback section
 st.divider()
@@ -495,8 +329,9 @@ feedback = st.text_area(
     key="feedback_input"
 )
 
-if st.button("Save Feedback"):
+if st.button("Save Feedback", key="save_feedback"):
     st.session_state.user_feedback = feedback
+    autosave({'type': 'feedback', 'value': feedback})
     st.success("Feedback saved!")
 
 # Download section
@@ -504,8 +339,10 @@ st.divider()
 st.subheader("Download Your Choices")
 
 if st.session_state.annotation_choices:
-    df = pd.DataFrame.from_dict(st.session_state.annotation_choices, orient='index')
-    
+    df = st.session_state.annotation_choices.to_frame({'3604_mixed_experts': get_document(*DOCUMENT_FILES)}.__getitem__)
+    # Tells participants apart when their downloads are aggregated, also without the intake form
+    df.insert(0, 'session_id', st.session_state.session_id)
+
     # Add user information to all rows
     df['user_experience'] = st.session_state.user_experience
     df['user_translation'] = st.session_state.user_translation
@@ -531,10 +368,21 @@ if st.session_state.annotation_choices:
         file_name="annotation_choices.csv",
         mime="text/csv"
     )
+    st.download_button(
+        label="Download Parquet",
+        # Written when the button is clicked rather than on every rerun
+        data=lambda: df.to_parquet(index=False),
+        file_name="annotation_choices.parquet",
+        mime="application/vnd.apache.parquet"
+    )
 
-    if st.button("Reset All Choices"):
-        st.session_state.annotation_choices = {}
-        st.session_state.chunk_sources = {}
+    if st.button("Reset All Choices", key="reset_choices"):
+        st.session_state.annotation_choices.clear()
+        autosave({'type': 'reset'})
+        end_run('3604_mixed_experts')
         st.rerun()
 else:
     st.info("No annotations have been marked yet.")
+
+timer.stage('footer')
+end_run('3604_mixed_experts')
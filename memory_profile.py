@@ -0,0 +1,200 @@
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+# Objects that belong to the interpreter rather than to the data, so deep_size does not follow them
+SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+              types.CodeType, types.FrameType, threading.Thread, type(threading.Lock()), type(threading.RLock()),
+              threading.Event, threading.Condition)
+
+
+def deep_size(obj, seen=None):
+    """Bytes used by an object and everything it references, counting every object once.
+
+    Objects whose id is already in `seen` are not counted, which is how
+    memory shared with other objects (e.g. the cached corpus) is left out of
+    a session's size. `seen` is updated in place.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SKIP_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if hasattr(obj, 'nbytes') and hasattr(obj, 'dtype'):
+            # numpy array: getsizeof already includes its buffer if it owns one
+            continue
+        if isinstance(obj, (dict, types.MappingProxyType)):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(vars(obj))
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    stack.append(getattr(obj, name))
+    return size
+
+
+class SessionRegistry:
+    """Process-wide record of the session state of every active session, for the memory page.
+
+    touch() keeps references to the values in a session's state (no copies)
+    and when the session was last seen. Booleans (mostly button states) and
+    keys starting with '_' are left out. Sessions not seen for max_idle
+    seconds are dropped, so the registry does not keep ended sessions alive.
+    """
+
+    def __init__(self, max_idle=3600):
+        self.max_idle = max_idle
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id, state):
+        values = {key: value for key, value in state.items() if not key.startswith('_') and not isinstance(value, bool)}
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now, values)
+            for old_id in [sid for sid, (seen, _) in self._sessions.items() if now - seen > self.max_idle]:
+                del self._sessions[old_id]
+
+    def sessions(self):
+        """{session id: (last seen, {key: value})}"""
+        with self._lock:
+            return dict(self._sessions)
+
+
+class MemoryTracer:
+    """tracemalloc snapshots of the process, compared with the previous and the first snapshot.
+
+    Tracing slows down every allocation, so it only runs between start() and stop().
+    """
+
+    def __init__(self):
+        self._first = None
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        with self._lock:
+            self._first = self._previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._first = self._previous = None
+
+    def snapshot(self, limit=20):
+        """Take a snapshot; returns the traced memory, the largest allocations and the top differences with the previous and first snapshot."""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        with self._lock:
+            previous, first = self._previous, self._first
+            self._previous = snapshot
+            if self._first is None:
+                self._first = snapshot
+
+        def top(stats):
+            return [{'location': str(stat.traceback[0]), 'size_kb': stat.size / 1024,
+                     'size_diff_kb': getattr(stat, 'size_diff', 0) / 1024, 'count': stat.count,
+                     'count_diff': getattr(stat, 'count_diff', 0)} for stat in stats[:limit]]
+
+        return {
+            'traced': tracemalloc.get_traced_memory(),
+            'top': top(snapshot.statistics('lineno')),
+            'since_previous': top(snapshot.compare_to(previous, 'lineno')) if previous is not None else [],
+            'since_first': top(snapshot.compare_to(first, 'lineno')) if first is not None else [],
+        }
+
+
+def is_admin(query_params):
+    """True if the page was opened with ?admin=<ADMIN_TOKEN>; without ADMIN_TOKEN set nobody is an admin."""
+    token = os.environ.get('ADMIN_TOKEN')
+    # As bytes: compare_digest refuses str with non-ASCII characters
+    return bool(token) and hmac.compare_digest(query_params.get('admin', '').encode(), token.encode())
+
+
+def memory_report(registry, shared):
+    """Deep sizes of the shared caches and of each session's state, as two DataFrames.
+
+    `shared` maps a name to a shared object (a cache, the corpus, ...). Session
+    sizes leave out everything reachable from the shared objects, so they only
+    count what each session adds.
+    """
+    import pandas as pd
+
+    seen = set()
+    shared_rows = [{'cache': name, 'size_kb': deep_size(obj, seen) / 1024} for name, obj in shared.items()]
+
+    session_rows = []
+    for session_id, (last_seen, values) in registry.sessions().items():
+        row = {'session': session_id, 'last_seen': pd.Timestamp(last_seen, unit='s')}
+        session_seen = set(seen)
+        for key, value in values.items():
+            row[key] = deep_size(value, session_seen) / 1024
+        session_rows.append(row)
+
+    sessions = pd.DataFrame(session_rows)
+    if not sessions.empty:
+        sizes = sessions.columns.drop(['session', 'last_seen'])
+        sessions.insert(2, 'total_kb', sessions[sizes].sum(axis=1))
+        sessions = sessions.sort_values('total_kb', ascending=False, ignore_index=True)
+    return pd.DataFrame(shared_rows), sessions
+
+
+def show_memory_page(registry, tracer, shared):
+    """Render the admin memory page: shared caches, sessions and tracemalloc snapshots."""
+    import streamlit as st
+
+    st.header("Memory")
+
+    shared_sizes, sessions = memory_report(registry, shared)
+    st.subheader("Shared caches")
+    st.dataframe(shared_sizes, hide_index=True)
+
+    st.subheader(f"Sessions ({len(sessions)})")
+    if not sessions.empty:
+        st.write(f"Total {sessions['total_kb'].sum():.0f} KB, largest {sessions['total_kb'].max():.0f} KB, "
+                 f"mean {sessions['total_kb'].mean():.0f} KB per session, not counting the shared caches.")
+    st.dataframe(sessions, hide_index=True)
+
+    st.subheader("tracemalloc")
+    # Callbacks run before the next run, so the page shows the new state without an st.rerun() that skips the
+    # caller's rerun log
+    if not tracer.tracing():
+        st.write("Tracing is off. It slows down the app while it runs.")
+        st.button("Start tracing", on_click=tracer.start)
+        return
+
+    st.button("Stop tracing", on_click=tracer.stop)
+
+    report = tracer.snapshot()
+    current, peak = report['traced']
+    st.write(f"Traced memory: {current / 2 ** 20:.1f} MB, peak {peak / 2 ** 20:.1f} MB. "
+             "Every rerun of this page takes a snapshot.")
+    st.caption("Since the previous snapshot")
+    st.dataframe(report['since_previous'], hide_index=True)
+    st.caption("Since tracing started")
+    st.dataframe(report['since_first'], hide_index=True)
+    st.caption("Largest allocations")
+    st.dataframe(report['top'], hide_index=True)
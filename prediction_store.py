@@ -0,0 +1,90 @@
+import json
+import os
+
+from corpus import build_document
+
+# Top-level index of a store: inventory number -> sorted list of pages
+INVENTORIES_FILE = 'inventories.json'
+
+
+def shard_paths(directory, inventory):
+    """Paths of the data file and the page index of one inventory's shard."""
+    return (os.path.join(directory, f'{inventory}.jsonl'),
+            os.path.join(directory, f'{inventory}.index.json'))
+
+
+def write_shard(directory, inventory, pages):
+    """Write one inventory's shard.
+
+    `pages` is an iterable of (page, payload) where payload is the page's
+    regions already encoded as one line of JSON (bytes). The index records the
+    byte offset and length of every page, so a page can be read with a single
+    seek. Returns the list of pages written.
+    """
+    data_path, index_path = shard_paths(directory, inventory)
+    index = {}
+    with open(data_path + '.tmp', 'wb') as f:
+        for page, payload in pages:
+            index[page] = [f.tell(), len(payload)]
+            f.write(payload + b'\n')
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    # Replace both files only once they are complete, so readers never see half a shard
+    os.replace(data_path + '.tmp', data_path)
+    os.replace(index_path + '.tmp', index_path)
+    return sorted(index)
+
+
+def update_inventories(directory, shards):
+    """Merge {inventory: [pages]} into the store's top-level index."""
+    path = os.path.join(directory, INVENTORIES_FILE)
+    inventories = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            inventories = json.load(f)
+    inventories.update(shards)
+    inventories = dict(sorted(inventories.items(), key=lambda item: int(item[0])))
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(inventories, f)
+    os.replace(path + '.tmp', path)
+
+
+class PredictionStore:
+    """Read access to a store written by import_predictions.py.
+
+    Only the small top-level index is read up front. The page index of an
+    inventory is loaded the first time one of its pages is opened, and a page
+    is read with one seek into its shard; nothing else is scanned or parsed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INVENTORIES_FILE), encoding='utf-8') as f:
+            self._inventories = json.load(f)
+        self._indexes = {}
+
+    def inventories(self):
+        return list(self._inventories)
+
+    def pages(self, inventory):
+        return list(self._inventories.get(inventory, []))
+
+    def _index(self, inventory):
+        if inventory not in self._indexes:
+            _, index_path = shard_paths(self.directory, inventory)
+            with open(index_path, encoding='utf-8') as f:
+                self._indexes[inventory] = json.load(f)
+        return self._indexes[inventory]
+
+    def read_page(self, inventory, page):
+        """Return the regions of one page as a list of {'words': [...], 'events': [...]} dicts."""
+        offset, length = self._index(inventory)[page]
+        data_path, _ = shard_paths(self.directory, inventory)
+        with open(data_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def load_document(self, inventory, page, min_words=150):
+        """Build the frozen regions of one page; the predictions double as entity and gold layer."""
+        lines = self.read_page(inventory, page)
+        return build_document(lines, lines, lines, min_words=min_words)
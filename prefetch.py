@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Loads documents in a background thread before anyone asks for them.
+
+    prefetch(key, fn, *args) starts fn(*args) on the worker thread, unless the
+    same key is already pending or was handed out before. get(key, fn, *args)
+    hands out the result, waiting for a prefetch that is still running, or
+    calls fn itself if nothing was prefetched. A result is handed out once:
+    the caller is expected to keep it (e.g. in st.cache_resource). At most
+    max_pending results wait to be picked up; older ones are dropped. Only
+    the last max_handed_out keys handed out are remembered, about as many as
+    the caller's cache keeps, so a key it has evicted can be prefetched again.
+    """
+
+    def __init__(self, workers=1, max_pending=8, max_handed_out=64):
+        self.max_pending = max_pending
+        self.max_handed_out = max_handed_out
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._pending = OrderedDict()
+        self._handed_out = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, key, fn, *args):
+        with self._lock:
+            if key in self._pending or key in self._handed_out:
+                return
+            self._pending[key] = self._executor.submit(fn, *args)
+            while len(self._pending) > self.max_pending:
+                _, future = self._pending.popitem(last=False)
+                future.cancel()
+
+    def get(self, key, fn, *args):
+        with self._lock:
+            future = self._pending.pop(key, None)
+            self._handed_out[key] = None
+            self._handed_out.move_to_end(key)
+            while len(self._handed_out) > self.max_handed_out:
+                self._handed_out.popitem(last=False)
+        if future is None or future.cancelled():
+            return fn(*args)
+        # Re-raises whatever the prefetch raised, e.g. an AlignmentError
+        return future.result()
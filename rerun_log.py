@@ -0,0 +1,129 @@
+import atexit
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+RERUN_LOG_DIR = 'rerun_log'
+RERUN_LOG_FILE = 'reruns.jsonl'
+
+# Types of session state values that are compared to find the widget that triggered a rerun
+WIDGET_VALUE_TYPES = (bool, int, float, str)
+
+
+class RerunTimer:
+    """Times the stages of one run of a Streamlit script.
+
+    Call stage(name) at the end of every stage; each stage lasts from the end
+    of the previous one (or from `start`) until the call.
+    """
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.stages = {}
+        self._last = self.start
+
+    def stage(self, name):
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def record(self, session_id, app, document, trigger):
+        """A compact JSON-serializable record of the run so far, with durations in milliseconds."""
+        return {
+            'time': round(time.time(), 3),
+            'session': session_id,
+            'app': app,
+            'document': document,
+            'trigger': trigger,
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 1),
+            'stages': {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+        }
+
+
+def widget_values(state):
+    """The simple values in session state, which include every widget that has a key."""
+    return {key: value for key, value in state.items() if isinstance(value, WIDGET_VALUE_TYPES)}
+
+
+def find_trigger(values, previous):
+    """Key of the widget that triggered a rerun, or None.
+
+    `values` are the widget values at the start of the run and `previous`
+    those at the end of the run before, so only user input can differ: a
+    pressed button turned True, other widgets changed value. (Buttons turn
+    False again by themselves, so a change to False is not counted.) Returns
+    None for the first run of a session and for widgets without a key; the
+    apps log a run before calling st.rerun(), so the run it starts reports None.
+    """
+    if previous is None:
+        return None
+    for key, value in values.items():
+        if previous.get(key) != value and (value is True or not isinstance(value, bool)):
+            return key
+    return None
+
+
+def rerun_trigger(state):
+    """Key of the widget that triggered the current run; call before the script changes session state."""
+    return find_trigger(widget_values(state), state.get('_rerun_values'))
+
+
+class RerunLog:
+    """Rolling JSONL log of rerun timings, shared by all sessions of a process.
+
+    append() only puts the record on a queue; a listener thread writes it.
+    The log is rotated at max_bytes, keeping `backups` older files.
+    """
+
+    def __init__(self, directory=RERUN_LOG_DIR, max_bytes=5_000_000, backups=5):
+        os.makedirs(directory, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(os.path.join(directory, RERUN_LOG_FILE), maxBytes=max_bytes,
+                                                       backupCount=backups, encoding='utf-8')
+        self._queue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._stopped = False
+        self._listener.start()
+        atexit.register(self.close)
+
+    def append(self, record):
+        self._queue.put(logging.makeLogRecord({'msg': json.dumps(record, ensure_ascii=False)}))
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._listener.stop()
+
+
+def log_rerun(log, timer, state, app, document, trigger):
+    """Append the record of the current run to the log and remember the widget values for the next run."""
+    state['_rerun_values'] = widget_values(state)
+    log.append(timer.record(state.get('session_id'), app, document, trigger))
+
+
+def read_rerun_log(directory=RERUN_LOG_DIR):
+    """Read the log and its rotated files into a DataFrame, one row per rerun, oldest first.
+
+    Stage durations become columns named stage_<name>; time becomes a datetime column.
+    """
+    import pandas as pd
+
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, RERUN_LOG_FILE + '*')), reverse=True):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+    if not records:
+        return pd.DataFrame(columns=['time', 'session', 'app', 'document', 'trigger', 'total_ms'])
+
+    df = pd.json_normalize(records, sep='_')
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    return df.sort_values('time', ignore_index=True)
@@ -0,0 +1,269 @@
+import argparse
+import os
+import threading
+
+from autosave import AUTOSAVE_DIR, SESSION_ID_PATTERN, AutosaveError, AutosaveWriter, get_session_id, replay_log
+from choice_store import CHOICE_VALUES, DATA_SOURCE_VALUES, EXPORT_COLUMNS, ChoiceRecord, export_rows
+from corpus import AlignmentError, file_stem, load_document
+from document_info import get_document_info
+from prediction_store import INVENTORIES_FILE, PredictionStore
+from shared_corpus import open_corpus_snapshot
+from snapshot import WORKSHOP_DOCUMENTS
+from watcher import PredictionWatcher
+
+PREDICTIONS_DIR = 'predictions_snellius'
+PREDICTION_STORE = 'prediction_store'
+
+# Most choices accepted in one request
+MAX_BATCH = 1000
+
+# Fields of a choice that index into a document
+INDEX_FIELDS = ('region', 'chunk', 'annotation')
+
+
+class ReviewService:
+    """The documents and choices behind the review API, without any web framework.
+
+    Documents come from the same places as in the apps: the workshop
+    documents, the watched predictions directory and the imported store.
+    They are built by the same merge/chunk/extract code and are identified by
+    the file ids the apps use, so choices posted here end up in the same
+    autosave logs as choices made in the apps.
+
+    A read-only service only serves documents: it does not start the
+    autosave writer, create the autosave directory or keep watching the
+    predictions directory, and it rejects choices.
+    """
+
+    def __init__(self, predictions_dir=PREDICTIONS_DIR, store_dir=PREDICTION_STORE, autosave_dir=AUTOSAVE_DIR,
+                 documents=WORKSHOP_DOCUMENTS, snapshot=None, read_only=False):
+        self.autosave_dir = autosave_dir
+        self.writer = None if read_only else AutosaveWriter(autosave_dir)
+        self.watcher = PredictionWatcher(predictions_dir, interval=None if read_only else 2.0, min_words=150,
+                                         snapshot=snapshot)
+        self.store = PredictionStore(store_dir) if os.path.exists(os.path.join(store_dir, INVENTORIES_FILE)) else None
+        self.workshop = {file_stem(files[0]): files for files in documents}
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def index(self):
+        """{file id: (header, link, loader args)} of every available document."""
+        index = {}
+        if self.store is not None:
+            for inventory in self.store.inventories():
+                for page in self.store.pages(inventory):
+                    info = get_document_info(f"NL-HaNA_1.04.02_{inventory}_{page}.json")
+                    index[info['file_id']] = (info['header'], info['link'], ('store', inventory, page))
+        for filename in self.watcher.files():
+            info = get_document_info(filename)
+            index[info['file_id']] = (info['header'], info['link'], ('file', filename))
+        for file_id, files in self.workshop.items():
+            index[file_id] = (file_id, '', ('workshop',) + files)
+        return index
+
+    def documents(self):
+        return [{'id': file_id, 'header': header, 'link': link, 'source': source[0]}
+                for file_id, (header, link, source) in self.index().items()]
+
+    def document(self, file_id):
+        """The frozen regions of a document, or KeyError if there is no such document."""
+        source = self.index()[file_id][2]
+        if source[0] == 'file':
+            return self.watcher.get(source[1])
+        with self._lock:
+            document = self._documents.get(source)
+        if document is None:
+            if source[0] == 'store':
+                document = self.store.load_document(source[1], source[2], min_words=150)
+            else:
+                document = load_document(*source[1:])
+            with self._lock:
+                self._documents[source] = document
+        return document
+
+    def region(self, file_id, region_idx, data_source='prediction', html=False):
+        """The chunks of one region with their words, annotated text and spans."""
+        document = self.document(file_id)
+        if region_idx < 0:
+            raise IndexError(f"no region {region_idx}")
+        chunks = []
+        for chunk_idx, chunk in enumerate(document[region_idx][data_source]):
+            entry = {
+                'chunk': chunk_idx,
+                'words': list(chunk['words']),
+                'annotated_text': [piece if isinstance(piece, str) else list(piece) for piece in chunk['annotated_text']],
+                'spans': [{'annotation': ann_idx, 'text': text, 'label': label, 'type': ann_type}
+                          for ann_idx, (text, label, ann_type) in enumerate(chunk['annotations'])],
+            }
+            if html:
+                from annotated_text.util import get_annotated_html
+                entry['html'] = get_annotated_html(*chunk['annotated_text'])
+            chunks.append(entry)
+        return {'document': file_id, 'region': region_idx, 'regions': len(document), 'data_source': data_source,
+                'chunks': chunks}
+
+    def spans(self, file_id, data_source='prediction'):
+        """Every span of a document, in document order."""
+        document = self.document(file_id)
+        return [{'region': region_idx, 'chunk': chunk_idx, 'annotation': ann_idx,
+                 'text': text, 'label': label, 'type': ann_type}
+                for region_idx, region in enumerate(document)
+                for chunk_idx, chunk in enumerate(region[data_source])
+                for ann_idx, (text, label, ann_type) in enumerate(chunk['annotations'])]
+
+    def submit(self, session_id, choices):
+        """Validate a batch of choices and append them all to the session's log, or none of them.
+
+        Each choice gives file, region, chunk, annotation, choice and
+        optionally data_source; the span must exist in the document.
+        Returns a list of problems, empty if the batch was recorded. Raises
+        AutosaveError once the writer has stopped on an error.
+        """
+        if self.writer is None:
+            return ["this service is read-only"]
+        if not isinstance(choices, list) or not choices:
+            return ["expected a non-empty list of choices"]
+        if len(choices) > MAX_BATCH:
+            return [f"at most {MAX_BATCH} choices per request"]
+
+        records = []
+        problems = []
+        for position, item in enumerate(choices):
+            try:
+                data_source = item.get('data_source', 'prediction')
+                if item['choice'] not in CHOICE_VALUES or data_source not in DATA_SOURCE_VALUES:
+                    raise ValueError(f"choice must be one of {CHOICE_VALUES} and data_source one of {DATA_SOURCE_VALUES}")
+                # Negative indices would count from the end, and True and False pass for 1 and 0
+                for field in INDEX_FIELDS:
+                    if type(item[field]) is not int or item[field] < 0:
+                        raise ValueError(f"{field} must be a non-negative integer")
+                # Only check that the span exists; its text and label are looked up on export
+                chunk = self.document(item['file'])[item['region']][data_source][item['chunk']]
+                if item['annotation'] >= len(chunk['annotations']):
+                    raise IndexError(f"no annotation {item['annotation']}")
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+                problems.append(f"choice {position}: {e!r}")
+                continue
+            records.append(ChoiceRecord(item['file'], item['region'], item['chunk'], item['annotation'],
+                                        item['choice'], data_source))
+        if problems:
+            return problems
+
+        # One record, so a crash cannot leave half a batch in the log
+        self.writer.append(session_id, {'type': 'choices', 'value': [record.as_dict() for record in records]})
+        return []
+
+    def choices(self, session_id):
+        """The session's current choices, restored from its log, with the text and label of their spans."""
+        # Queued records are written within the writer's flush interval
+        records = list(replay_log(session_id, self.autosave_dir)['annotation_choices'])
+        return [dict(zip(EXPORT_COLUMNS, row), annotation=record.annotation)
+                for record, row in zip(records, export_rows(records, self.document))]
+
+    def close(self):
+        """Stop watching the predictions directory and write the queued choices."""
+        self.watcher.stop()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def create_app(service):
+    """The Starlette app around a ReviewService; blocking work runs in Starlette's thread pool."""
+    from contextlib import asynccontextmanager
+
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    def not_found(message):
+        return JSONResponse({'error': message}, status_code=404)
+
+    def misaligned(error):
+        # The document exists, but its layers cannot be merged until its files are fixed
+        return JSONResponse({'error': "document layers do not line up", 'detail': str(error)}, status_code=409)
+
+    def data_source_of(request):
+        data_source = request.query_params.get('data_source', 'prediction')
+        return data_source if data_source in DATA_SOURCE_VALUES else None
+
+    async def documents(request):
+        return JSONResponse(await run_in_threadpool(service.documents))
+
+    async def region(request):
+        data_source = data_source_of(request)
+        if data_source is None:
+            return JSONResponse({'error': f"data_source must be one of {DATA_SOURCE_VALUES}"}, status_code=400)
+        html = request.query_params.get('html') in ('1', 'true')
+        try:
+            return JSONResponse(await run_in_threadpool(service.region, request.path_params['file_id'],
+                                                        request.path_params['region'], data_source, html))
+        except (KeyError, IndexError):
+            return not_found("no such document or region")
+        except AlignmentError as e:
+            return misaligned(e)
+
+    async def spans(request):
+        data_source = data_source_of(request)
+        if data_source is None:
+            return JSONResponse({'error': f"data_source must be one of {DATA_SOURCE_VALUES}"}, status_code=400)
+        try:
+            return JSONResponse(await run_in_threadpool(service.spans, request.path_params['file_id'], data_source))
+        except KeyError:
+            return not_found("no such document")
+        except AlignmentError as e:
+            return misaligned(e)
+
+    async def new_session(request):
+        return JSONResponse({'session_id': get_session_id({})}, status_code=201)
+
+    async def session_choices(request):
+        session_id = request.path_params['session_id']
+        if not SESSION_ID_PATTERN.match(session_id):
+            return not_found("no such session")
+        if request.method == 'GET':
+            return JSONResponse(await run_in_threadpool(service.choices, session_id))
+
+        try:
+            body = await request.json()
+        except ValueError:
+            return JSONResponse({'error': "body is not JSON"}, status_code=400)
+        choices = body.get('choices') if isinstance(body, dict) else body
+        try:
+            problems = await run_in_threadpool(service.submit, session_id, choices)
+        except AutosaveError as e:
+            return JSONResponse({'error': "choices can no longer be saved", 'detail': str(e)}, status_code=503)
+        if problems:
+            return JSONResponse({'error': "no choices were recorded", 'problems': problems}, status_code=400)
+        return JSONResponse({'recorded': len(choices)})
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        service.close()
+
+    return Starlette(routes=[
+        Route('/documents', documents),
+        Route('/documents/{file_id}/regions/{region:int}', region),
+        Route('/documents/{file_id}/spans', spans),
+        Route('/sessions', new_session, methods=['POST']),
+        Route('/sessions/{session_id}/choices', session_choices, methods=['GET', 'POST']),
+    ], lifespan=lifespan)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve documents and accept choices over a local JSON API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--predictions', default=PREDICTIONS_DIR)
+    parser.add_argument('--store', default=PREDICTION_STORE)
+    args = parser.parse_args()
+
+    service = ReviewService(args.predictions, args.store, snapshot=open_corpus_snapshot())
+    uvicorn.run(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import streamlit as st
+
+from autosave import AutosaveError, AutosaveWriter
+
+
+@st.cache_resource
+def get_autosave_writer():
+    """One autosave writer (and flush thread) per server process."""
+    return AutosaveWriter()
+
+
+def autosave(record):
+    """Append a record to the session's autosave log.
+
+    If the writer has stopped, the change is only kept in the session;
+    show_autosave_error() tells the participant.
+    """
+    try:
+        get_autosave_writer().append(st.session_state.session_id, record)
+    except AutosaveError:
+        pass
+
+
+def show_autosave_error():
+    """Warn that choices are no longer saved on the server, if the autosave writer has stopped."""
+    error = get_autosave_writer().error
+    if error is not None:
+        st.error(f"Your choices can no longer be saved on the server ({error!r}). "
+                 "Please download them at the bottom of the page before closing it.")
+
+
+def record_choice(file_id, region_idx, chunk_idx, ann_idx, choice, data_source):
+    """Store a choice in the session and append it to the session's autosave log."""
+    record = st.session_state.annotation_choices.set(file_id, region_idx, chunk_idx, ann_idx, choice, data_source)
+    autosave({'type': 'choice', 'value': record.as_dict()})
+
+
+def set_choices(spans, choice):
+    """Set the choice for many spans with one autosave record, or clear it if choice is None.
+
+    spans are (file_id, region_idx, chunk_idx, ann_idx, text, label, data_source) tuples.
+    """
+    store = st.session_state.annotation_choices
+    if choice is None:
+        for file_id, region_idx, chunk_idx, ann_idx, *_ in spans:
+            store.remove(file_id, region_idx, chunk_idx, ann_idx)
+        autosave({'type': 'clear', 'value': [
+            {'file': span[0], 'region': span[1], 'chunk': span[2], 'annotation': span[3]} for span in spans]})
+    else:
+        records = [store.set(*span[:4], choice, span[6]) for span in spans]
+        autosave({'type': 'choices', 'value': [record.as_dict() for record in records]})
+
+
+def record_choices(file_id, region_idx, chunks, choice):
+    """Set the choice for every span of some chunks in one go, or clear it if choice is None.
+
+    chunks is a list of (chunk_idx, chunk, data_source), as shown by display_region_with_buttons.
+    """
+    set_choices([(file_id, region_idx, chunk_idx, ann_idx, text, label, data_source)
+                 for chunk_idx, chunk, data_source in chunks
+                 for ann_idx, (text, label, _) in enumerate(chunk['annotations'])], choice)
+
+
+def bulk_buttons(file_id, region_idx, chunks, key, scope):
+    """Buttons that mark all spans of some chunks as useful or misleading, or clear them, with one rerun."""
+    cols = st.columns([0.3, 0.3, 0.2, 0.2])
+    with cols[0]:
+        if st.button("✓ Mark all useful", key=f"all_useful_{key}", help=f"Mark every annotation in this {scope} as useful"):
+            record_choices(file_id, region_idx, chunks, 'useful')
+    with cols[1]:
+        if st.button("✗ Mark all misleading", key=f"all_wrong_{key}",
+                     help=f"Mark every annotation in this {scope} as misleading"):
+            record_choices(file_id, region_idx, chunks, 'misleading')
+    with cols[2]:
+        if st.button("Clear", key=f"clear_{key}", help=f"Remove your choices for this {scope}"):
+            record_choices(file_id, region_idx, chunks, None)
+
+
+def display_region_with_buttons(region, file_id, region_idx, gold_chunk_ids, assigned_chunks=None):
+    """Display annotated text and buttons for each annotation.
+    
+    Args:
+        region: Frozen region from the shared corpus, with 'prediction' and 'gold' chunks
+        file_id: Identifier for the file
+        region_idx: Index of the current region
+        gold_chunk_ids: Set of chunk IDs that should display gold data
+        assigned_chunks: Set of (region_idx, chunk_idx) to display, or None to display all
+    """
+    from annotated_text import annotated_text
+
+    pred_chunks = region['prediction']
+    gold_chunks = region['gold']
+
+    chunks = []
+    for chunk_idx in range(len(pred_chunks)):
+        if assigned_chunks is not None and (region_idx, chunk_idx) not in assigned_chunks:
+            continue
+
+        chunk_id = f"{region_idx}_{chunk_idx}"
+        
+        # Determine if this chunk should use gold or prediction data
+        if chunk_id in gold_chunk_ids:
+            chunks.append((chunk_idx, gold_chunks[chunk_idx], 'gold'))
+        else:
+            chunks.append((chunk_idx, pred_chunks[chunk_idx], 'prediction'))
+
+    # Region-wide actions come first, so the choices they record show up in this same run
+    if sum(1 for _, chunk, _ in chunks if chunk['annotations']) > 1:
+        bulk_buttons(file_id, region_idx, chunks, f"region_{file_id}_{region_idx}", "region")
+
+    for chunk_idx, chunk, data_source in chunks:
+        annotated_text(*chunk['annotated_text'])
+
+        annotations = chunk['annotations']
+
+        if annotations:
+            st.markdown("---")
+            bulk_buttons(file_id, region_idx, [(chunk_idx, chunk, data_source)], f"{file_id}_{region_idx}_{chunk_idx}",
+                         "passage")
+            for ann_idx, (text, label, ann_type) in enumerate(annotations):
+                key = f"{file_id}_{region_idx}_{chunk_idx}_{ann_idx}"
+
+                cols = st.columns([0.6, 0.1, 0.1, 0.2])
+
+                with cols[0]:
+                    st.markdown(f"**{text}** `({label})`")
+
+                with cols[1]:
+                    if st.button("✓", key=f"correct_{key}"):
+                        record_choice(file_id, region_idx, chunk_idx, ann_idx, 'useful', data_source)
+
+                with cols[2]:
+                    if st.button("✗", key=f"wrong_{key}"):
+                        record_choice(file_id, region_idx, chunk_idx, ann_idx, 'misleading', data_source)
+
+                with cols[3]:
+                    choice = st.session_state.annotation_choices.get_choice(file_id, region_idx, chunk_idx, ann_idx)
+                    if choice is not None:
+                        st.markdown("✅ Useful" if choice == 'useful' else "❌ Misleading")
+
+        if chunk_idx < len(pred_chunks) - 1:
+            st.markdown("---")
@@ -0,0 +1,65 @@
+import itertools
+import threading
+
+from annotation_utils import count_event_annotations
+
+
+def chunk_weights(document):
+    """Return ((region_idx, chunk_idx), weight) for every prediction chunk of a document.
+
+    The weight is the number of event annotations in the chunk, plus one so
+    that chunks without events (which still have to be read) are spread out too.
+    """
+    weights = []
+    for region_idx, region in enumerate(document):
+        for chunk_idx, chunk in enumerate(region['prediction']):
+            weights.append(((region_idx, chunk_idx), count_event_annotations(chunk) + 1))
+    return weights
+
+
+def build_schedule(document, n_reviewers, overlap=0.0):
+    """Partition the chunks of a document over n_reviewers, balanced by event count.
+
+    Chunks are handed out heaviest first, each to the reviewer with the
+    lightest load so far. A fraction `overlap` of the chunks, spread evenly
+    over the weight ranking, is also given to a second reviewer so that
+    agreement can be measured. Returns one frozenset of (region_idx, chunk_idx)
+    per reviewer.
+
+    There are never more reviewers than chunks, so that no reviewer gets an
+    empty assignment: with fewer chunks, fewer assignments are returned and
+    ReviewerSlots hands them out to more than one session each.
+    """
+    units = sorted(chunk_weights(document), key=lambda unit: -unit[1])
+    n_reviewers = max(1, min(n_reviewers, len(units)))
+    loads = [0] * n_reviewers
+    assignments = [set() for _ in range(n_reviewers)]
+
+    for i, (unit, weight) in enumerate(units):
+        copies = 1
+        if n_reviewers > 1 and int((i + 1) * overlap) > int(i * overlap):
+            copies = 2
+        for _ in range(copies):
+            reviewer = min((r for r in range(n_reviewers) if unit not in assignments[r]), key=lambda r: loads[r])
+            assignments[reviewer].add(unit)
+            loads[reviewer] += weight
+
+    return tuple(frozenset(assignment) for assignment in assignments)
+
+
+class ReviewerSlots:
+    """Hands out the assignments of a schedule to sessions in round-robin order."""
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def next_slot(self):
+        """Return the slot number for a new session."""
+        with self._lock:
+            return next(self._counter) % len(self.schedule)
+
+    def assignment(self, slot):
+        """Return the frozenset of (region_idx, chunk_idx) for a slot."""
+        return self.schedule[slot % len(self.schedule)]
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from snapshot import WORKSHOP_DOCUMENTS, build_snapshot, read_snapshot, report_skipped, snapshot_version
+
+SHARED_CORPUS_FILE = 'corpus_shared.arrow'
+
+SOURCES = ('prediction', 'gold')
+
+# The columns a chunk is read from, which are also its keys
+CHUNK_FIELDS = ('words', 'events', 'annotated_text', 'annotations')
+
+
+def corpus_schema():
+    """One row per frozen chunk, with everything the apps render precomputed."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('region', pa.int32()),
+        ('source', pa.dictionary(pa.int8(), pa.string())),
+        ('words', pa.list_(pa.string())),
+        ('events', pa.list_(pa.string())),
+        # Plain text pieces have no label and color
+        ('annotated_text', pa.list_(pa.struct([('text', pa.string()), ('label', pa.string()), ('color', pa.string())]))),
+        ('annotations', pa.list_(pa.struct([('text', pa.string()), ('label', pa.string()), ('type', pa.string())]))),
+    ])
+
+
+def document_rows(document):
+    """Rows of corpus_schema for the chunks of a frozen document, in region, source and chunk order."""
+    for region_idx, region in enumerate(document):
+        for source in SOURCES:
+            for chunk in region[source]:
+                yield {
+                    'region': region_idx,
+                    'source': source,
+                    'words': list(chunk['words']),
+                    'events': list(chunk['events']),
+                    'annotated_text': [{'text': piece, 'label': None, 'color': None} if isinstance(piece, str)
+                                       else dict(zip(('text', 'label', 'color'), piece))
+                                       for piece in chunk['annotated_text']],
+                    'annotations': [dict(zip(('text', 'label', 'type'), annotation))
+                                    for annotation in chunk['annotations']],
+                }
+
+
+def publish_corpus(path, entries):
+    """Write {key: (content hash, document)}, as built by snapshot.build_snapshot, as one uncompressed Arrow IPC file.
+
+    The documents are listed in the schema metadata with their hash, number of
+    regions and rows. The file is written next to `path` and moved into place,
+    so processes that still map the previous version keep reading it.
+    """
+    import pyarrow as pa
+
+    schema = corpus_schema()
+    documents = {}
+    batches = []
+    row = 0
+    for key, (digest, document) in entries.items():
+        rows = list(document_rows(document))
+        documents[key] = {'digest': digest, 'regions': len(document), 'start': row, 'rows': len(rows)}
+        batches.append(pa.RecordBatch.from_pylist(rows, schema=schema))
+        row += len(rows)
+
+    # The index goes in the schema, which is written before the batches
+    metadata = {'version': snapshot_version(), 'documents': json.dumps(documents)}
+    # Few large batches: every batch costs some memory in each process that maps the file
+    table = pa.Table.from_batches(batches, schema=schema).combine_chunks()
+    with pa.OSFile(path + '.tmp', 'wb') as sink, pa.ipc.new_file(sink, schema.with_metadata(metadata)) as writer:
+        writer.write_table(table, max_chunksize=65536)
+    os.replace(path + '.tmp', path)
+    return len(documents), row
+
+
+class SharedChunk(Mapping):
+    """One chunk of a SharedCorpus, read-only like the chunks of build_document.
+
+    Only the row number is kept; each field is built from the mapped row when
+    it is read, and dropped again by the caller once the page is rendered.
+    """
+
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, columns, row):
+        self._columns = columns
+        self._row = row
+
+    def __getitem__(self, key):
+        if key not in CHUNK_FIELDS:
+            raise KeyError(key)
+        value = self._columns[key][self._row].as_py()
+        if key == 'annotated_text':
+            return tuple(piece['text'] if piece['label'] is None else (piece['text'], piece['label'], piece['color'])
+                         for piece in value)
+        if key == 'annotations':
+            return tuple((annotation['text'], annotation['label'], annotation['type']) for annotation in value)
+        return tuple(value)
+
+    def __iter__(self):
+        return iter(CHUNK_FIELDS)
+
+    def __len__(self):
+        return len(CHUNK_FIELDS)
+
+
+class SharedCorpus:
+    """Read-only view of a corpus published by publish_corpus, memory-mapped rather than loaded.
+
+    The pages of the file are shared by every process that maps it. A
+    document only holds the row numbers of its chunks, so a worker keeps no
+    copy of the text of the documents it opens, and nothing is parsed,
+    merged or chunked. Works as the snapshot of the apps: get(key) returns
+    (content hash, document).
+    """
+
+    def __init__(self, path=SHARED_CORPUS_FILE):
+        import pyarrow as pa
+
+        self.path = path
+        self._source = pa.memory_map(path, 'r')
+        self._table = pa.ipc.open_file(self._source).read_all()
+        metadata = self._table.schema.metadata or {}
+        self.version = metadata.get(b'version', b'').decode()
+        self.schema = self._table.schema.remove_metadata()
+        self._documents = json.loads(metadata.get(b'documents', b'{}'))
+        # Zero-copy views of the mapped columns
+        self._columns = {name: self._table.column(name) for name in CHUNK_FIELDS}
+
+    def __contains__(self, key):
+        return key in self._documents
+
+    def __len__(self):
+        return len(self._documents)
+
+    def keys(self):
+        return self._documents.keys()
+
+    def digest(self, key):
+        return self._documents[key]['digest']
+
+    def document(self, key):
+        """The document for a key, with the same regions and chunks as build_document's, as SharedChunks."""
+        info = self._documents[key]
+        rows = self._table.slice(info['start'], info['rows'])
+        chunks = [{source: [] for source in SOURCES} for _ in range(info['regions'])]
+        for row, (region_idx, source) in enumerate(zip(rows.column('region').to_pylist(),
+                                                       rows.column('source').to_pylist()), info['start']):
+            chunks[region_idx][source].append(SharedChunk(self._columns, row))
+        return tuple(MappingProxyType({source: tuple(region[source]) for source in SOURCES}) for region in chunks)
+
+    def get(self, key, default=None):
+        if key not in self._documents:
+            return default
+        return self.digest(key), self.document(key)
+
+    def __getitem__(self, key):
+        return self.digest(key), self.document(key)
+
+
+def open_corpus_snapshot(path=SHARED_CORPUS_FILE, notes=None):
+    """The shared corpus if one was published by the current preprocessing code, else the pickled snapshot.
+
+    If `notes` is a list, a message is added to it for every outdated file that is ignored.
+    """
+    if os.path.exists(path):
+        shared = SharedCorpus(path)
+        if shared.version == snapshot_version() and shared.schema.equals(corpus_schema()):
+            return shared
+        if notes is not None:
+            notes.append(f"Ignored outdated shared corpus {path}")
+    return read_snapshot(notes=notes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess the corpus once into a memory-mapped Arrow file that "
+                                                 "every app process attaches to read-only.")
+    parser.add_argument('--predictions', default='predictions_snellius', help="directory watched by make_streamlit.py")
+    parser.add_argument('-o', '--output', default=SHARED_CORPUS_FILE, help="shared corpus file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    skipped = {}
+    n_documents, n_chunks = publish_corpus(args.output, build_snapshot(args.predictions, WORKSHOP_DOCUMENTS,
+                                                                       skipped=skipped))
+    report_skipped(skipped)
+    print(f"Wrote {n_documents} documents ({n_chunks} chunks) to {args.output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
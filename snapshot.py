@@ -0,0 +1,129 @@
+import argparse
+import copyreg
+import hashlib
+import os
+import pickle
+import time
+from types import MappingProxyType
+
+import annotation_utils
+import corpus
+import span_rules
+from corpus import AlignmentError, build_document, file_digest, is_data_file, load_document, read_jsonl
+
+SNAPSHOT_FILE = 'corpus_snapshot.pkl'
+
+# Bump when the layout of the snapshot changes; changes to the preprocessing code are picked up automatically
+SNAPSHOT_FORMAT = 1
+
+# Documents of make_workshop_streamlit.py as (prediction, entity, gold) files
+WORKSHOP_DOCUMENTS = [
+    ('predictions/3604_mixed_experts.json',
+     'gold/curated_entities_3604/p_80-ner-event-preanno_NL-HaNA_1.04.02_3604_0270-0276 - 1782 -.json',
+     'gold/3604.json'),
+]
+
+
+def snapshot_version():
+    """Version of the preprocessing: the snapshot format plus a hash of the code and rules that build documents."""
+    digest = hashlib.sha1(str(SNAPSHOT_FORMAT).encode())
+    for path in (annotation_utils.__file__, corpus.__file__, span_rules.__file__, span_rules.SPAN_RULES_FILE):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def document_key(pred_path, entity_path, gold_path, min_words=None):
+    return f"{pred_path}|{entity_path}|{gold_path}|{min_words}"
+
+
+def restore_mapping(items):
+    """Rebuild a read-only mapping when unpickling a frozen document."""
+    return MappingProxyType(items)
+
+
+def reduce_mapping(mapping):
+    return restore_mapping, (dict(mapping),)
+
+
+def write_snapshot(path, entries):
+    """Write {key: (content hash, document)} together with the current snapshot version."""
+    with open(path + '.tmp', 'wb') as f:
+        pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Read-only mappings cannot be pickled by default; only the snapshot needs to, so it is not registered globally
+        pickler.dispatch_table = {**copyreg.dispatch_table, MappingProxyType: reduce_mapping}
+        pickler.dump({'version': snapshot_version(), 'entries': entries})
+    os.replace(path + '.tmp', path)
+
+
+def read_snapshot(path=SNAPSHOT_FILE, notes=None):
+    """Return the entries of a snapshot, or {} if there is none or it was built by other preprocessing code.
+
+    If `notes` is a list, a message is added to it when an outdated snapshot is ignored.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb') as f:
+        snapshot = pickle.load(f)
+    if snapshot.get('version') != snapshot_version():
+        if notes is not None:
+            notes.append(f"Ignored outdated snapshot {path}")
+        return {}
+    return snapshot['entries']
+
+
+def build_snapshot(predictions_dir, documents, min_words=150, skipped=None):
+    """Preprocess every prediction file in predictions_dir and the given (prediction, entity, gold) documents.
+
+    Documents whose layers do not line up are left out, so one bad file does
+    not cost the apps their snapshot; they are parsed (and rejected) on
+    demand instead. If `skipped` is a dict, their alignment reports are put
+    in it by key.
+    """
+    entries = {}
+    if skipped is None:
+        skipped = {}
+
+    for name in sorted(os.listdir(predictions_dir)):
+        if not is_data_file(name):
+            continue
+        path = os.path.join(predictions_dir, name)
+        lines = read_jsonl(path)
+        try:
+            entries[name] = (file_digest(path), build_document(lines, lines, lines, min_words=min_words))
+        except AlignmentError as e:
+            skipped[name] = e.report
+
+    for pred_path, entity_path, gold_path in documents:
+        key = document_key(pred_path, entity_path, gold_path)
+        try:
+            entries[key] = (file_digest(pred_path, entity_path, gold_path),
+                            load_document(pred_path, entity_path, gold_path))
+        except AlignmentError as e:
+            skipped[key] = e.report
+
+    return entries
+
+
+def report_skipped(skipped):
+    """Print the documents build_snapshot left out, with the first alignment error of each."""
+    for key, report in skipped.items():
+        print(f"Skipped {key}: {len(report['errors'])} alignment errors, first: {report['errors'][0]['message']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess the corpus into a snapshot for fast cold starts of the apps.")
+    parser.add_argument('--predictions', default='predictions_snellius', help="directory watched by make_streamlit.py")
+    parser.add_argument('-o', '--output', default=SNAPSHOT_FILE, help="snapshot file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    skipped = {}
+    entries = build_snapshot(args.predictions, WORKSHOP_DOCUMENTS, skipped=skipped)
+    write_snapshot(args.output, entries)
+    report_skipped(skipped)
+    print(f"Wrote {len(entries)} documents to {args.output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import string
+from collections import Counter
+
+# Stripped from both ends of a span before grouping, e.g. the comma in "Edele Heeren,"
+STRIP_CHARS = string.punctuation + string.whitespace
+
+
+def normalize_span(text):
+    """Lower-cased span text with runs of whitespace collapsed and surrounding punctuation removed.
+
+    Spans of only punctuation keep their (collapsed) text, so that e.g. "," and
+    ";" are not grouped together.
+    """
+    collapsed = ' '.join(text.lower().split())
+    return collapsed.strip(STRIP_CHARS) or collapsed
+
+
+class SpanIndex:
+    """The spans of one or more documents, grouped by their normalized (text, label) pair.
+
+    Every occurrence is a (file_id, region_idx, chunk_idx, ann_idx, text,
+    label, data_source) tuple, so a group can be passed as is to anything
+    that records choices for spans. The documents themselves are kept by
+    reference to look up the chunk an occurrence is in.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self._groups = {}
+
+    def add_document(self, file_id, document, gold_chunk_ids=()):
+        self.documents[file_id] = document
+        for region_idx, region in enumerate(document):
+            for chunk_idx in range(len(region['prediction'])):
+                data_source = 'gold' if f"{region_idx}_{chunk_idx}" in gold_chunk_ids else 'prediction'
+                for ann_idx, (text, label, _) in enumerate(region[data_source][chunk_idx]['annotations']):
+                    self._groups.setdefault((normalize_span(text), label), []).append(
+                        (file_id, region_idx, chunk_idx, ann_idx, text, label, data_source))
+
+    def groups(self, min_size=2):
+        """[(key, occurrences)] for the groups with at least min_size occurrences, largest first."""
+        groups = [(key, occurrences) for key, occurrences in self._groups.items() if len(occurrences) >= min_size]
+        return sorted(groups, key=lambda group: (-len(group[1]), group[0]))
+
+    def group(self, key):
+        return self._groups.get(key, [])
+
+    def chunk(self, occurrence):
+        """The chunk (with its words, annotated text and annotations) an occurrence is in."""
+        file_id, region_idx, chunk_idx, _, _, _, data_source = occurrence
+        return self.documents[file_id][region_idx][data_source][chunk_idx]
+
+    def __len__(self):
+        return len(self._groups)
+
+
+def group_choices(occurrences, store):
+    """Counter of the choices in a ChoiceStore for the occurrences of a group; None counts unreviewed ones."""
+    return Counter(store.get_choice(*occurrence[:4]) for occurrence in occurrences)
@@ -0,0 +1,253 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+# Rules applied to every document after events and entities are merged
+SPAN_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'span_rules.txt')
+
+KIND_OTHER, KIND_B, KIND_I = 0, 1, 2
+
+# How often load_span_rules() looks at the rules file, in seconds; documents are built many regions at a time
+CHECK_INTERVAL = 2.0
+
+# A small rule set and the rewrites it must produce, checked by `python span_rules.py`
+SELF_CHECK_RULES = """
+merge Translocation Voyage Arriving
+relabel LOC_NAME inside Voyage
+"""
+SELF_CHECK_CASES = [
+    ('B-Translocation I-Translocation B-Voyage I-Voyage O',
+     'B-Translocation I-Translocation I-Translocation I-Translocation O'),
+    ('B-Voyage B-LOC_NAME I-LOC_NAME I-Voyage', 'B-Voyage I-Voyage I-Voyage I-Voyage'),
+    ('B-Voyage B-LOC_NAME O', 'B-Voyage B-LOC_NAME O'),
+    # The entity is inside the Voyage span merged into Translocation, so the rest of that span is relabelled too
+    ('B-Translocation B-Voyage B-LOC_NAME I-Voyage',
+     'B-Translocation I-Translocation I-Translocation I-Translocation'),
+    ('B-Translocation B-Voyage B-LOC_NAME I-Voyage B-Arriving',
+     'B-Translocation I-Translocation I-Translocation I-Translocation I-Translocation'),
+]
+
+
+def parse_rules(text):
+    """Parse the rule language into (merge groups, relabel rules).
+
+    Two kinds of rules are supported, one per line; '#' starts a comment.
+
+        merge LABEL LABEL ...
+            Consecutive spans whose labels are all in this set become one
+            span with the label of the first.
+        relabel ENTITY ... inside EVENT ...
+            Entity tokens between two tokens of the same event span (with a
+            label from the EVENT set, also when that span was merged into
+            one with another label) become part of that event span.
+    """
+    merge_groups = []
+    relabel_rules = []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        command, args = words[0], words[1:]
+        if command == 'merge' and len(args) >= 2:
+            merge_groups.append(frozenset(args))
+        elif command == 'relabel' and 'inside' in args:
+            split = args.index('inside')
+            entities, events = args[:split], args[split + 1:]
+            if not entities or not events:
+                raise ValueError(f"line {line_no}: 'relabel' needs labels on both sides of 'inside'")
+            relabel_rules.append((frozenset(entities), frozenset(events)))
+        else:
+            raise ValueError(f"line {line_no}: cannot parse rule {line.strip()!r}")
+    return merge_groups, relabel_rules
+
+
+class SpanRules:
+    """Span-merging rules compiled into lookup tables over tag ids.
+
+    run() rewrites a list of BIO tags in a single left-to-right pass,
+    whatever the number of rules: every decision is a table lookup on the id
+    of the current tag and the state of the pass. The tables grow as new tags
+    are seen.
+    """
+
+    def __init__(self, merge_groups, relabel_rules):
+        self.group_of = {}
+        for group_idx, group in enumerate(merge_groups):
+            for label in group:
+                if label in self.group_of:
+                    raise ValueError(f"label {label} is in more than one merge rule")
+                self.group_of[label] = group_idx
+
+        self.absorbed_by = {}
+        for entities, events in relabel_rules:
+            for entity in entities:
+                self.absorbed_by.setdefault(entity, set()).update(events)
+
+        # Per tag id: the tag, its kind, its label, its merge group (-1 for none),
+        # the event labels it can be absorbed into and the id of I-<label>
+        self._ids = {}
+        self._tags = []
+        self._kind = []
+        self._label = []
+        self._group = []
+        self._absorbed_by = []
+        self._inside_id = []
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_file(cls, path=SPAN_RULES_FILE):
+        with open(path, encoding='utf-8') as f:
+            return cls(*parse_rules(f.read()))
+
+    def _tag_id(self, tag):
+        tag_id = self._ids.get(tag)
+        if tag_id is not None:
+            return tag_id
+
+        # One instance is shared by the app, watcher and prefetch threads. A new tag is added
+        # to every table before its id is published in _ids, so readers never see half of it.
+        with self._lock:
+            tag_id = self._ids.get(tag)
+            if tag_id is not None:
+                return tag_id
+
+            if tag.startswith('B-') and tag != 'B-None':
+                kind, label = KIND_B, tag[2:]
+            elif tag.startswith('I-') and tag != 'I-None':
+                kind, label = KIND_I, tag[2:]
+            else:
+                kind, label = KIND_OTHER, None
+            # The id of I-<label> (added first if needed; an I- tag is its own)
+            inside_id = self._tag_id(f'I-{label}') if kind == KIND_B else None
+
+            tag_id = len(self._tags)
+            self._tags.append(tag)
+            self._kind.append(kind)
+            self._label.append(label)
+            self._group.append(self.group_of.get(label, -1))
+            self._absorbed_by.append(frozenset(self.absorbed_by.get(label, ())))
+            self._inside_id.append(tag_id if kind == KIND_I else inside_id)
+            self._ids[tag] = tag_id
+        return tag_id
+
+    def run(self, events):
+        """Return a new list of tags with all rules applied."""
+        ids = [self._tag_id(tag) for tag in events]
+        kind, label, group = self._kind, self._label, self._group
+        absorbed_by, inside_id = self._absorbed_by, self._inside_id
+
+        out = list(ids)
+        merge_id = None      # I-<label> id of the merge run in progress
+        merge_group = -1
+        span_label = None    # label of the open span in the output
+        span_id = None       # id of I-<span_label>
+        source_label = None  # label of that span in the input; differs from span_label inside a merge run
+        buffer_start = None  # first entity token waiting to be absorbed into the open span
+
+        def encloses(tag_id):
+            return kind[tag_id] != KIND_OTHER and (span_label in absorbed_by[tag_id] or
+                                                   source_label in absorbed_by[tag_id])
+
+        for i, tag_id in enumerate(ids):
+            # relabel: entity tokens inside an event span
+            if buffer_start is not None:
+                if encloses(tag_id):
+                    continue
+                if kind[tag_id] == KIND_I and label[tag_id] in (span_label, source_label):
+                    # The span goes on: the entity tokens and this token (which may still carry the
+                    # label of a span merged into it) become part of it; a merge run goes on too
+                    for j in range(buffer_start, i + 1):
+                        out[j] = span_id
+                    buffer_start = None
+                    continue
+                # Not enclosed after all: the buffered entity tokens keep their labels
+                for j in range(buffer_start, i):
+                    if kind[ids[j]] == KIND_B:
+                        span_label = source_label = label[ids[j]]
+                        span_id = inside_id[ids[j]]
+                buffer_start = None
+                merge_id = None
+
+            # merge: B-/I- tags from the same group as the run continue it under the first label
+            if merge_id is not None and kind[tag_id] != KIND_OTHER and group[tag_id] == merge_group:
+                out[i] = merge_id
+                if kind[tag_id] == KIND_B:
+                    source_label = label[tag_id]
+                continue
+
+            if span_label is not None and encloses(tag_id):
+                buffer_start = i
+                continue
+
+            merge_id = None
+            if kind[tag_id] == KIND_B and group[tag_id] >= 0:
+                merge_id, merge_group = inside_id[tag_id], group[tag_id]
+
+            if kind[tag_id] == KIND_B:
+                span_label = source_label = label[tag_id]
+                span_id = inside_id[tag_id]
+            elif kind[tag_id] == KIND_OTHER:
+                span_label = source_label = span_id = None
+
+        return [self._tags[tag_id] for tag_id in out]
+
+
+_compiled = {}
+
+
+def load_span_rules(path=SPAN_RULES_FILE):
+    """Compile the rules file once, and again only when it changes.
+
+    The file is looked at once every CHECK_INTERVAL seconds at most, not on
+    every call: building a document applies the rules to each region.
+    """
+    now = time.monotonic()
+    cached = _compiled.get(path)
+    if cached is not None and now - cached[1] < CHECK_INTERVAL:
+        return cached[2]
+    mtime = os.stat(path).st_mtime_ns
+    if cached is None or cached[0] != mtime:
+        rules = SpanRules.from_file(path)
+    else:
+        rules = cached[2]
+    _compiled[path] = (mtime, now, rules)
+    return rules
+
+
+def apply_span_rules(data, rules=None):
+    """Apply the span rules to a {'words': [...], 'events': [...]} structure."""
+    rules = rules or load_span_rules()
+    return {
+        'words': data['words'],
+        'events': rules.run(data['events'])
+    }
+
+
+def self_check():
+    """Run SELF_CHECK_CASES through SELF_CHECK_RULES and return a message per case that came out wrong."""
+    rules = SpanRules(*parse_rules(SELF_CHECK_RULES))
+    problems = []
+    for tags, expected in SELF_CHECK_CASES:
+        result = ' '.join(rules.run(tags.split()))
+        if result != expected:
+            problems.append(f"{tags}\n  gives    {result}\n  expected {expected}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a span rules file and the rule engine's own test cases.")
+    parser.add_argument('rules', nargs='?', default=SPAN_RULES_FILE, help="rules file to parse")
+    args = parser.parse_args()
+
+    SpanRules.from_file(args.rules)
+    problems = self_check()
+    for problem in problems:
+        print(problem)
+    print(f"{args.rules}: ok; self-check: {len(SELF_CHECK_CASES) - len(problems)}/{len(SELF_CHECK_CASES)} cases passed")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
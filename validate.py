@@ -0,0 +1,117 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+# Defined in corpus, so that the apps can catch it without importing numpy
+from corpus import AlignmentError
+
+
+def label_key(line):
+    return 'entities' if 'entities' in line else 'events'
+
+
+def normalize_words(words):
+    """Strip whitespace and apostrophes, which the transcription and entity pipelines write differently ('t vs t)."""
+    return np.char.strip(np.char.replace(words, "'", ""))
+
+
+def check_alignment(layers):
+    """Check that the layers of a document line up, region by region and token by token.
+
+    `layers` maps a layer name ('prediction', 'entity', 'gold', ...) to its
+    parsed lines. Returns a JSON-serializable report. Errors (different
+    region counts, token counts, label counts, or words that differ even
+    after normalization) mean the layers cannot be merged; warnings are
+    words that differ only in whitespace or apostrophes.
+    """
+    names = list(layers)
+    errors = []
+    warnings = []
+
+    n_regions = {name: len(lines) for name, lines in layers.items()}
+    if len(set(n_regions.values())) > 1:
+        errors.append({'check': 'region_count', 'regions': n_regions,
+                       'message': f"different numbers of regions: {n_regions}"})
+    n_common = min(n_regions.values())
+
+    # (layer, region) matrices of word and label counts
+    word_counts = np.array([[len(lines[i]['words']) for i in range(n_common)] for lines in layers.values()], dtype=np.int64)
+    label_counts = np.array([[len(lines[i][label_key(lines[i])]) for i in range(n_common)] for lines in layers.values()], dtype=np.int64)
+
+    for layer_idx, region in zip(*np.nonzero(word_counts != label_counts)):
+        errors.append({'check': 'label_count', 'layer': names[layer_idx], 'region': int(region),
+                       'words': int(word_counts[layer_idx, region]), 'labels': int(label_counts[layer_idx, region]),
+                       'message': f"{names[layer_idx]} region {region}: {word_counts[layer_idx, region]} words "
+                                  f"but {label_counts[layer_idx, region]} labels"})
+
+    aligned = (word_counts == word_counts[0]).all(axis=0)
+    for region in np.nonzero(~aligned)[0]:
+        counts = {name: int(word_counts[layer_idx, region]) for layer_idx, name in enumerate(names)}
+        errors.append({'check': 'token_count', 'region': int(region), 'tokens': counts,
+                       'message': f"region {region}: different token counts {counts}"})
+
+    # Compare the words of all aligned regions at once against the first layer
+    regions = np.nonzero(aligned)[0]
+    if len(regions) and word_counts[0, regions].sum():
+        offsets = np.concatenate([[0], np.cumsum(word_counts[0, regions])])
+        flat = [np.array([word for i in regions for word in lines[i]['words']], dtype=str) for lines in layers.values()]
+        reference = normalize_words(flat[0])
+        for layer_idx in range(1, len(names)):
+            differs = flat[layer_idx] != flat[0]
+            misaligned = differs & (normalize_words(flat[layer_idx]) != reference)
+            for kind, mask in (('error', misaligned), ('warning', differs & ~misaligned)):
+                positions = np.nonzero(mask)[0]
+                if not len(positions):
+                    continue
+                region_pos = np.searchsorted(offsets, positions, side='right') - 1
+                examples = [{'region': int(regions[r]), 'token': int(p - offsets[r]),
+                             names[0]: str(flat[0][p]), names[layer_idx]: str(flat[layer_idx][p])}
+                            for r, p in zip(region_pos[:5], positions[:5])]
+                issue = {'check': 'word_mismatch', 'layer': names[layer_idx], 'count': int(len(positions)),
+                         'regions': sorted({int(regions[r]) for r in region_pos}), 'examples': examples,
+                         'message': f"{len(positions)} words of {names[layer_idx]} differ from {names[0]}"}
+                (errors if kind == 'error' else warnings).append(issue)
+
+    return {'ok': not errors, 'regions': n_regions, 'tokens': int(word_counts[0].sum()) if n_common else 0,
+            'errors': errors, 'warnings': warnings}
+
+
+def validate_document(pred_lines, entity_lines, gold_lines):
+    """Check a document at ingest and raise AlignmentError if it cannot be merged; returns the report otherwise."""
+    if pred_lines is entity_lines is gold_lines:
+        layers = {'prediction': pred_lines}
+    else:
+        layers = {'prediction': pred_lines, 'entity': entity_lines, 'gold': gold_lines}
+    report = check_alignment(layers)
+    if not report['ok']:
+        raise AlignmentError(report)
+    return report
+
+
+def main():
+    from corpus import read_layer
+
+    parser = argparse.ArgumentParser(description="Check that the prediction, entity and gold files of a document line up.")
+    parser.add_argument('prediction')
+    parser.add_argument('entity')
+    parser.add_argument('gold')
+    parser.add_argument('-o', '--output', help="write the JSON report here instead of to stdout")
+    args = parser.parse_args()
+
+    report = check_alignment({'prediction': read_layer(args.prediction),
+                              'entity': read_layer(args.entity),
+                              'gold': read_layer(args.gold)})
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+
+    sys.exit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
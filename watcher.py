@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+from types import MappingProxyType
+
+from corpus import build_document, file_digest, is_data_file, read_jsonl
+
+logger = logging.getLogger(__name__)
+
+# What a file that is being copied, was just removed or is damaged raises while it is loaded
+LOAD_ERRORS = (ValueError, KeyError, IndexError, OSError)
+
+
+class PredictionWatcher:
+    """Keeps an index of a directory of prediction files and parses documents on demand.
+
+    A background thread lists the directory every `interval` seconds, which
+    only costs a stat per file, so new files show up on the next rerun of the
+    app without anything being parsed. A document is parsed the first time
+    it is requested with get() and then cached. Cached documents whose file
+    changed (by mtime and size) are hashed again in the background and only
+    re-parsed if the content hash differs, so unchanged documents are never
+    parsed twice. Each prediction file doubles as its own entity and gold
+    file, as in make_streamlit.py. Compressed files (e.g. .json.gz) are
+    listed and read as well; the hash is taken of the compressed bytes, and
+    files are hashed and decompressed while streaming them, never held whole.
+
+    `snapshot` optionally maps file names to (content hash, document), as
+    written by snapshot.py or shared_corpus.py. Those documents are used as
+    long as the hash of the file still matches, without parsing anything.
+
+    With an interval of None the directory is listed once and not watched,
+    so no thread is started.
+
+    A file that changed but cannot be loaded again keeps being served in its
+    last good version; errors() tells which ones, and scan_error why the
+    directory could not be listed, so the app can say the data is stale.
+    """
+
+    def __init__(self, directory, suffix='.json', interval=2.0, min_words=150, snapshot=None):
+        self.directory = directory
+        self.suffix = suffix
+        self.interval = interval
+        self.min_words = min_words
+
+        self._files = MappingProxyType({})
+        # name -> (signature, hash, document) for the documents parsed so far
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # name -> message of the last failed load, for files served in an older version
+        self._errors = {}
+        self.scan_error = None
+
+        # Looked up when a file is first loaded, so documents of a shared corpus are only built when opened
+        self._snapshot = snapshot if snapshot is not None else {}
+
+        self.scan()
+
+        self._thread = None
+        if interval is not None:
+            self._thread = threading.Thread(target=self._run, name='prediction-watcher', daemon=True)
+            self._thread.start()
+
+    def files(self):
+        """Read-only mapping of file name -> (mtime_ns, size) for every prediction file in the directory."""
+        return self._files
+
+    def errors(self):
+        """{file name: message} for the files whose new version could not be loaded."""
+        with self._lock:
+            return dict(self._errors)
+
+    def get(self, name):
+        """Return the document parsed from a file, parsing it only if it is new or its content changed.
+
+        Raises KeyError if there is no such file, also when it was removed
+        after the caller saw it in files(), unless it was parsed before.
+        """
+        signature = self._files.get(name)
+        with self._lock:
+            cached = self._cache.get(name)
+        if cached is not None and (signature is None or cached[0] == signature):
+            return cached[2]
+        if signature is None:
+            raise KeyError(name)
+        try:
+            return self._load(name, signature, cached)
+        except LOAD_ERRORS as e:
+            if cached is None:
+                if isinstance(e, FileNotFoundError):
+                    # Removed after the last scan
+                    raise KeyError(name) from e
+                raise
+            self._failed(name, e)
+            return cached[2]
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.scan()
+            except Exception as e:
+                # Whatever happened, keep watching: new files must still show up
+                if self.scan_error is None:
+                    logger.warning("Could not scan %s: %r", self.directory, e)
+                self.scan_error = f"Could not scan {self.directory}: {e!r}"
+            else:
+                self.scan_error = None
+
+    def scan(self):
+        """Refresh the file index and re-check the cached documents whose file changed."""
+        files = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and is_data_file(entry.name, self.suffix):
+                stat = entry.stat()
+                files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        self._files = MappingProxyType(files)
+
+        with self._lock:
+            cached = dict(self._cache)
+        for name, entry in cached.items():
+            if name not in files:
+                with self._lock:
+                    self._cache.pop(name, None)
+                    self._errors.pop(name, None)
+            elif entry[0] != files[name]:
+                # Keep documents that people have opened warm
+                try:
+                    self._load(name, files[name], entry)
+                except LOAD_ERRORS as e:
+                    # Probably still being copied (or just removed); try again on the next scan
+                    self._failed(name, e)
+
+    def _failed(self, name, error):
+        message = f"{error!r}"
+        with self._lock:
+            new = self._errors.get(name) != message
+            self._errors[name] = message
+        if new:
+            logger.warning("Could not load %s, serving its previous version: %s", name, message)
+
+    def _load(self, name, signature, cached):
+        path = os.path.join(self.directory, name)
+        digest = file_digest(path)
+
+        if cached is None and name in self._snapshot:
+            cached = (None,) + tuple(self._snapshot[name])
+        if cached is not None and cached[1] == digest:
+            document = cached[2]
+        else:
+            lines = read_jsonl(path)
+            document = build_document(lines, lines, lines, min_words=self.min_words)
+
+        with self._lock:
+            self._cache[name] = (signature, digest, document)
+            self._errors.pop(name, None)
+        return document